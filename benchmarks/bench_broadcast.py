@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from argparse import ArgumentParser
+
+from gb_chat.server import ChatServer
+from gb_chat.server.outbox import Outbox
+from gb_chat.tools.message import Message
+from gb_chat.tools.requests import SERVER_ROOM, request_msg
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(os.path.abspath(__file__)))[0], "config.json")
+
+
+class NullSocket(object):
+    def sendmsg(self, buffers: list) -> int:
+        return sum(len(buffer) for buffer in buffers)
+
+    def close(self):
+        pass
+
+
+def prepare_server(recipients: int) -> ChatServer:
+    with open(CONFIG_PATH) as f:
+        result = json.load(f)
+    server = ChatServer({**result["general"], **result["server"], "address": "127.0.0.1", "port": 7778})
+    for i in range(recipients):
+        session = server.clients.add(NullSocket(), "user{}".format(i))
+        session.outbox = Outbox(server.output_limit, server.overflow_policy)
+    return server
+
+
+def encode_per_recipient(server: ChatServer, msg: dict):
+    # Прежний путь: send_data сериализует сообщение заново для каждого получателя.
+    # Обычный dict, а не Message: иначе после первого получателя кадр берется из кеша
+    for session in server.clients.sessions():
+        server.send_data(client=session.client, data=dict(msg))
+    server.flush_pending()
+
+
+def encode_once(server: ChatServer, msg: dict):
+    # Свежий Message на каждую рассылку: кеш кадра от прошлого повтора не засчитывается
+    server.writer([(None, Message(msg))])
+    server.flush_pending()
+
+
+def measure(func, server: ChatServer, msg: dict, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(server, msg)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    ap = ArgumentParser(description="Broadcast cost by recipient count: per-recipient encode vs encode-once")
+    ap.add_argument("-r", dest="recipients", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    ap.add_argument("-s", dest="size", type=int, default=200, help="message text size")
+    ap.add_argument("-t", dest="time", type=float, default=0.5, help="seconds per measurement")
+    options = ap.parse_args()
+
+    msg = request_msg(sender="bench", to=SERVER_ROOM, encoding="utf-8", message="x" * options.size)
+    print("{:>10} {:>16} {:>16} {:>8}".format("recipients", "per-recipient,us", "encode-once,us", "speedup"))
+    for recipients in options.recipients:
+        server = prepare_server(recipients)
+        repeat = max(1, int(options.time / measure(encode_once, server, msg, 1)))
+        before = measure(encode_per_recipient, server, msg, repeat)
+        after = measure(encode_once, server, msg, repeat)
+        print("{:>10} {:>16.1f} {:>16.1f} {:>7.1f}x".format(recipients, before * 1e6, after * 1e6, before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import json
+import os
+import socket
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+
+from benchmarks.capture import DEFAULT_CAPTURE, load_capture, to_message
+from gb_chat.server import ChatServer
+from gb_chat.tools.framing import HEADER, FrameDecoder
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(os.path.abspath(__file__)))[0], "config.json")
+MODES = ("copy", "pooled")
+
+
+class CopyDecoder(object):
+    # Прежний путь приема для сравнения: recv() -> bytes, дозапись в bytearray, копия каждого кадра в bytes
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[bytes]:
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            size = HEADER.unpack_from(buffer, offset)[0]
+            end = offset + HEADER.size + size
+            if end > len(buffer):
+                break
+            frames.append(bytes(buffer[offset + HEADER.size:end]))
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def reader(server: ChatServer, decoders: dict, pooled: bool):
+    # Цикл чтения get_data без учета квот: режимы отличаются только приемом и разбором кадров
+    codec = server.get_codec()
+    size = server.buffer_size
+
+    def read_copy(client: socket.socket) -> list:
+        decoder = decoders[client]
+        frames = []
+        while True:
+            try:
+                data = client.recv(size)
+            except BlockingIOError:
+                break
+            frames.extend(decoder.feed(data))
+            if len(data) < size:
+                break
+        return frames
+
+    def read_pooled(client: socket.socket) -> list:
+        decoder = decoders[client]
+        frames = []
+        while True:
+            try:
+                received = decoder.read(client, size)
+            except BlockingIOError:
+                break
+            frames.extend(decoder.frames())
+            if received < size:
+                break
+        return frames
+
+    read_frames = read_pooled if pooled else read_copy
+
+    def read(client: socket.socket) -> int:
+        count = 0
+        for frame in read_frames(client):
+            codec.loads(frame)
+            count += 1
+        if pooled:
+            decoders[client].release()
+        return count
+    return read
+
+
+def run(mode: str, options, payloads: list[bytes], results: Queue):
+    with open(CONFIG_PATH) as f:
+        result = json.load(f)
+    server = ChatServer({**result["general"], **result["server"], "address": "127.0.0.1", "port": 7778,
+                         "rate_bytes": None, "rate_messages": None})
+    pairs = [socket.socketpair() for _ in range(options.connections)]
+    for _, client in pairs:
+        client.setblocking(False)
+    if mode == "copy":
+        decoders = {client: CopyDecoder(server.limit) for _, client in pairs}
+    else:
+        decoders = {client: FrameDecoder(server.limit, server.buffers) for _, client in pairs}
+    read = reader(server, decoders, mode == "pooled")
+    base_rss = rss()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    # Каждое соединение получает пачку сообщений, затем простаивает; транзиентные выделения считаем по пику
+    # каждого чтения, удержанную память - после того как все соединения разобрали свои пачки
+    transient = 0
+    count = 0
+    elapsed = 0.0
+    for round_ in range(options.rounds):
+        for number, (peer, client) in enumerate(pairs):
+            data = b"".join(payloads[(number + round_ + i) % len(payloads)] for i in range(options.burst))
+            # Последний кадр пачки режется пополам: у соединения остается недочитанный хвост, как в жизни
+            peer.sendall(data[:-10] if round_ == 0 else data)
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            count += read(client)
+            elapsed += time.perf_counter() - start
+            transient += tracemalloc.get_traced_memory()[1] - current
+            if round_ == 0:
+                peer.sendall(data[-10:])
+                count += read(client)
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    results.put((mode, count, elapsed, transient, retained, rss() - base_rss))
+    for peer, client in pairs:
+        peer.close()
+        client.close()
+
+
+def main():
+    ap = ArgumentParser(description="Receive path allocations: recv() with per-frame copies "
+                                    "vs recv_into() into pooled buffers with memoryview frames")
+    ap.add_argument("capture", nargs="?", default=DEFAULT_CAPTURE)
+    ap.add_argument("-n", dest="connections", type=int, default=2000)
+    ap.add_argument("-b", dest="burst", type=int, default=8, help="messages per connection per round")
+    ap.add_argument("-r", dest="rounds", type=int, default=5)
+    options = ap.parse_args()
+
+    msgs = [to_message(record, "sender", "recipient") for record in load_capture(options.capture)]
+    with open(CONFIG_PATH) as f:
+        result = json.load(f)
+    encoding = result["general"]["encoding"]
+    payloads = [HEADER.pack(len(data)) + data for data in (json.dumps(msg).encode(encoding) for msg in msgs)]
+
+    print("{} connections, {} messages per burst, {} rounds".format(options.connections, options.burst,
+                                                                    options.rounds))
+    print("{:<8} {:>10} {:>16} {:>16} {:>16}".format("mode", "us/msg", "alloc B/msg", "retained B/conn",
+                                                     "RSS B/conn"))
+    results = Queue()
+    # Каждый режим в отдельном процессе, чтобы RSS одного не влиял на другой
+    for mode in MODES:
+        process = Process(target=run, args=(mode, options, payloads, results))
+        process.start()
+        mode, count, elapsed, transient, retained, grown = results.get()
+        process.join()
+        print("{:<8} {:>10.2f} {:>16.0f} {:>16.0f} {:>16.0f}".format(
+            mode, elapsed / count * 1e6, transient / count, retained / options.connections,
+            grown / options.connections
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import time
+from argparse import ArgumentParser
+
+from benchmarks.capture import DEFAULT_CAPTURE, load_capture, to_message
+from gb_chat.tools.codec import available_codecs, get_codec
+from gb_chat.tools.compression import CompressedCodec
+from gb_chat.tools.requests import request_msg
+
+# Короткие реплики чата, которых в захвате задач почти нет
+CHAT = ["hi", "ok", "see you tomorrow", "how are you?", "sure, let me check and get back to you in a minute"]
+
+
+def measure(codec, msgs: list[dict]) -> tuple[int, float, float]:
+    payloads = []
+    start = time.perf_counter()
+    for msg in msgs:
+        payloads.append(codec.dumps(msg))
+    dumps = time.perf_counter() - start
+    start = time.perf_counter()
+    for payload in payloads:
+        codec.loads(payload)
+    loads = time.perf_counter() - start
+    return sum(len(payload) for payload in payloads), dumps / len(msgs) * 1e6, loads / len(msgs) * 1e6
+
+
+def main():
+    ap = ArgumentParser(description="Per-frame deflate with a preset dictionary: bytes on the wire and CPU "
+                                    "per message for each codec and compression_min_size")
+    ap.add_argument("capture", nargs="?", default=DEFAULT_CAPTURE)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[0, 128, 256, 512])
+    ap.add_argument("-r", dest="repeat", type=int, default=20)
+    options = ap.parse_args()
+
+    msgs = [to_message(record, "sender", "recipient") for record in load_capture(options.capture)]
+    msgs += [request_msg(sender="sender", to="#room", encoding="utf-8", message=text) for text in CHAT]
+    msgs *= options.repeat
+
+    print("{:<8} {:<12} {:>10} {:>8} {:>10} {:>10} {:>14}".format(
+        "codec", "compression", "bytes/msg", "ratio", "dumps us", "loads us", "saved B/us"))
+    for name in available_codecs(["json", "orjson", "msgpack"]):
+        codec = get_codec(name)
+        size, base_dumps, base_loads = measure(codec, msgs)
+        print("{:<8} {:<12} {:>10.0f} {:>8.3f} {:>10.2f} {:>10.2f} {:>14}".format(
+            name, "none", size / len(msgs), 1, base_dumps, base_loads, "-"))
+        variants = [("zlib/nodict", CompressedCodec(codec, 0, 1 << 20, b""))]
+        variants += [("zlib/{}".format(min_size), CompressedCodec(codec, min_size, 1 << 20))
+                     for min_size in options.sizes]
+        for label, compressed in variants:
+            compressed_size, dumps, loads = measure(compressed, msgs)
+            # Сэкономленные байты на микросекунду добавленного CPU (сжатие + одна распаковка)
+            cost = (dumps - base_dumps) + (loads - base_loads)
+            saved = (size - compressed_size) / len(msgs)
+            print("{:<8} {:<12} {:>10.0f} {:>8.3f} {:>10.2f} {:>10.2f} {:>14.1f}".format(
+                name, label, compressed_size / len(msgs), compressed_size / size, dumps, loads,
+                saved / cost if cost > 0 else float("inf")))
+
+
+if __name__ == "__main__":
+    main()
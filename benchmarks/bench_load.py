@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import random
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from multiprocessing import Barrier, Process, Queue
+
+from gb_chat.client.aio import AsyncChatClient
+from gb_chat.server import ChatServer
+from gb_chat.server.aio import AsyncChatServer
+from gb_chat.tools.requests import SERVER_ROOM, request_msg
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(os.path.abspath(__file__)))[0], "config.json")
+ENGINES = {
+    "select": ChatServer,
+    "asyncio": AsyncChatServer,
+}
+NAME = "load{process}-{session}"
+# Сколько ждем доставки последних сообщений после окончания отправки
+DRAIN = 1.0
+# Шаг генератора: за один проход отправляется все, что набралось по темпу с прошлого шага
+TICK = 0.001
+
+
+def load_config() -> dict:
+    with open(CONFIG_PATH) as f:
+        return json.load(f)
+
+
+def start_server(engine: str, address: str, port: int):
+    result = load_config()
+    ENGINES[engine]({**result["general"], **result["server"], "address": address, "port": port}).run()
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def connect(config: dict, process: int, sessions: int, handler) -> tuple[list[AsyncChatClient], float]:
+    clients = []
+    for session in range(sessions):
+        client = AsyncChatClient({**config, "account": {"login": NAME.format(process=process, session=session)}},
+                                 handler)
+        clients.append(client)
+    start = time.perf_counter()
+    # ChatClient печатает приветствие сервера в консоль
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for client in clients:
+            await client.connect()
+    return clients, time.perf_counter() - start
+
+
+async def generate(options, process: int, barrier: Barrier) -> tuple[float, int, list[float]]:
+    result = load_config()
+    config = {**result["general"], **result["client"], "address": options.address, "port": options.port}
+    loop = asyncio.get_running_loop()
+    latencies = []
+    # Все сессии процесса работают в одном цикле, задержку считает handler в receiver каждой сессии
+    await loop.run_in_executor(None, barrier.wait)
+    clients, setup = await connect(config, process, options.sessions,
+                                   lambda msg: latencies.append(time.time() - msg["time"]))
+    await loop.run_in_executor(None, barrier.wait)
+    # Сообщения, пришедшие до общего старта, в замер не входят
+    latencies.clear()
+
+    rate = options.rate / options.processes
+    sent = 0
+    start = time.perf_counter()
+    stop = start + options.duration
+    while True:
+        now = time.perf_counter()
+        if now >= stop:
+            break
+        for _ in range(int((now - start) * rate) - sent):
+            sender = random.choice(clients)
+            if random.random() < options.broadcast:
+                to = SERVER_ROOM
+            else:
+                to = NAME.format(process=random.randrange(options.processes),
+                                 session=random.randrange(options.sessions))
+            sender.send_data(data=request_msg(sender=sender.account["login"], to=to,
+                                              encoding=sender.encoding, message="x" * options.size))
+            sent += 1
+        await asyncio.sleep(TICK)
+    await asyncio.sleep(DRAIN)
+    for client in clients:
+        client.close()
+    return setup, sent, latencies
+
+
+def generator(options, process: int, barrier: Barrier, results: Queue):
+    results.put(asyncio.run(generate(options, process, barrier)))
+
+
+def main():
+    ap = ArgumentParser(description="Headless load generator: simulated AsyncChatClient sessions against a local "
+                                    "server")
+    ap.add_argument("-a", dest="address", default="127.0.0.1")
+    ap.add_argument("-p", dest="port", type=int, default=7778)
+    ap.add_argument("-e", dest="engine", choices=ENGINES, default=None,
+                    help="start a local server with this engine (default: use a running one)")
+    ap.add_argument("-n", dest="sessions", type=int, default=100, help="sessions per process")
+    ap.add_argument("-j", dest="processes", type=int, default=4, help="generator processes")
+    ap.add_argument("-r", dest="rate", type=float, default=1000, help="messages sent per second, total")
+    ap.add_argument("-b", dest="broadcast", type=float, default=0.0, help="share of #server broadcasts, 0..1")
+    ap.add_argument("-s", dest="size", type=int, default=100, help="message text size")
+    ap.add_argument("-d", dest="duration", type=float, default=10, help="seconds of traffic")
+    options = ap.parse_args()
+
+    server = None
+    if options.engine is not None:
+        server = Process(target=start_server, args=(options.engine, options.address, options.port), daemon=True)
+        server.start()
+        time.sleep(1)
+    barrier = Barrier(options.processes)
+    results = Queue()
+    processes = [Process(target=generator, args=(options, process, barrier, results))
+                 for process in range(options.processes)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    if server is not None:
+        server.terminate()
+
+    sessions = options.sessions * options.processes
+    setup = max(result[0] for result in collected)
+    sent = sum(result[1] for result in collected)
+    latencies = sorted(latency for result in collected for latency in result[2])
+    print("sessions           {:>10}".format(sessions))
+    print("setup, conn/s      {:>10.1f}".format(sessions / setup))
+    print("sent, msg/s        {:>10.1f}".format(sent / options.duration))
+    print("delivered, msg/s   {:>10.1f}".format(len(latencies) / options.duration))
+    print("latency p50, ms    {:>10.2f}".format(percentile(latencies, 50) * 1e3))
+    print("latency p99, ms    {:>10.2f}".format(percentile(latencies, 99) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
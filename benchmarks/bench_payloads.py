@@ -0,0 +1,106 @@
+import json
+import os
+import time
+from argparse import ArgumentParser
+
+from benchmarks.capture import DEFAULT_CAPTURE, load_capture, to_message
+from gb_chat.server import ChatServer
+from gb_chat.server.outbox import Outbox
+from gb_chat.tools.codec import INSTALLED, get_codec
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(os.path.abspath(__file__)))[0], "config.json")
+
+
+class ReplaySocket(object):
+    # Отдает заранее собранный поток кадров порциями recv, как настоящий сокет
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+
+    def recv(self, size: int) -> bytes:
+        if self.position >= len(self.data):
+            raise BlockingIOError
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def recv_into(self, buffer: memoryview) -> int:
+        chunk = self.recv(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def sendmsg(self, buffers: list) -> int:
+        return sum(len(buffer) for buffer in buffers)
+
+    def close(self):
+        pass
+
+
+def measure(func, seconds: float) -> tuple[int, float]:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        count += func()
+    return count, time.perf_counter() - start
+
+
+def prepare_server() -> ChatServer:
+    with open(CONFIG_PATH) as f:
+        result = json.load(f)
+    server = ChatServer({**result["general"], **result["server"], "address": "127.0.0.1", "port": 7778})
+    return server
+
+
+def main():
+    ap = ArgumentParser(description="Offline micro-benchmarks of validation, codecs and ChatServer.reader "
+                                    "on messages built from a jsonl capture")
+    ap.add_argument("capture", nargs="?", default=DEFAULT_CAPTURE)
+    ap.add_argument("-t", dest="time", type=float, default=1.0, help="seconds per measurement")
+    options = ap.parse_args()
+
+    msgs = [to_message(record, "sender", "recipient") for record in load_capture(options.capture)]
+    size = sum(len(json.dumps(msg)) for msg in msgs) / len(msgs)
+    print("{} messages, {:.0f} bytes on average as json".format(len(msgs), size))
+    print("{:<28} {:>12} {:>10}".format("benchmark", "msg/s", "us/msg"))
+
+    def report(name: str, count: int, elapsed: float):
+        print("{:<28} {:>12.0f} {:>10.2f}".format(name, count / elapsed, elapsed / count * 1e6))
+
+    server = prepare_server()
+    validator = server.validator
+
+    def validate() -> int:
+        for msg in msgs:
+            validator.validate_data("msg", msg)
+        return len(msgs)
+
+    report("validate_data(msg)", *measure(validate, options.time))
+
+    for name in (name for name, installed in INSTALLED.items() if installed):
+        codec = get_codec(name)
+        payloads = [codec.dumps(msg) for msg in msgs]
+        report("{} dumps".format(name), *measure(lambda: [codec.dumps(msg) for msg in msgs] and len(msgs),
+                                                  options.time))
+        report("{} loads".format(name), *measure(lambda: [codec.loads(data) for data in payloads] and len(msgs),
+                                                  options.time))
+
+    # reader: recv кадров, decode, validate_action и action() для сессии отправителя
+    stream = b"".join(server.encode(msg) for msg in msgs)
+    client = ReplaySocket(stream)
+    session = server.clients.add(client, "sender")
+    session.outbox = Outbox(server.output_limit, server.overflow_policy)
+    session.codec = server.get_codec()
+
+    def reader() -> int:
+        client.position = 0
+        count = 0
+        while client.position < len(stream):
+            count += len(server.reader([client]))
+        return count
+
+    report("ChatServer.reader", *measure(reader, options.time))
+
+
+if __name__ == "__main__":
+    main()
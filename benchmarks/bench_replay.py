@@ -0,0 +1,136 @@
+import selectors
+import socket
+import time
+from argparse import ArgumentParser
+
+from benchmarks.bench_load import percentile
+from benchmarks.capture import DEFAULT_CAPTURE, load_capture, record_time, to_message
+from gb_chat.tools.codec import JsonCodec
+from gb_chat.tools.framing import FrameDecoder, encode_frame
+from gb_chat.tools.requests import request_presence
+
+NAME = "replay{}"
+# Интервал для записей без поля time в режиме исходного темпа
+DEFAULT_INTERVAL = 0.01
+DRAIN = 1.0
+
+
+class Connection(object):
+    def __init__(self, address: str, port: int, name: str, codec: JsonCodec):
+        self.name = name
+        self.codec = codec
+        self.decoder = FrameDecoder(10 ** 7)
+        self.socket = socket.create_connection((address, port))
+        self.send(request_presence(name))
+        frames = []
+        while not frames:
+            frames = self.decoder.feed(self.socket.recv(65536))
+        welcome = self.codec.loads(frames[0])
+        if welcome.get("response") != 200:
+            raise ConnectionError("{}: {}".format(name, welcome))
+
+    def send(self, data: dict) -> int:
+        frame = encode_frame(self.codec.dumps(data))
+        self.socket.sendall(frame)
+        return len(frame)
+
+
+def schedule(records: list[dict], timed: bool, speed: float) -> list[float]:
+    # Смещение отправки каждой записи от начала прогона; в быстром режиме все нули
+    if not timed:
+        return [0.0] * len(records)
+    offsets = []
+    first = None
+    previous = 0.0
+    for record in records:
+        stamp = record_time(record)
+        if stamp is None:
+            previous += DEFAULT_INTERVAL
+        else:
+            first = stamp if first is None else first
+            previous = stamp - first
+        offsets.append(previous / speed)
+    return offsets
+
+
+def main():
+    ap = ArgumentParser(description="Replay a jsonl capture into a running server over many connections")
+    ap.add_argument("capture", nargs="?", default=DEFAULT_CAPTURE)
+    ap.add_argument("-a", dest="address", default="127.0.0.1")
+    ap.add_argument("-p", dest="port", type=int, default=7778)
+    ap.add_argument("-n", dest="connections", type=int, default=50)
+    ap.add_argument("-l", dest="loops", type=int, default=20, help="times to replay the capture")
+    ap.add_argument("-t", dest="timed", action="store_true", help="keep original timing (default: as fast as possible)")
+    ap.add_argument("-s", dest="speed", type=float, default=1.0, help="timing speed-up factor for -t")
+    options = ap.parse_args()
+
+    codec = JsonCodec()
+    records = load_capture(options.capture) * options.loops
+    offsets = schedule(records, options.timed, options.speed)
+    start = time.perf_counter()
+    connections = [Connection(options.address, options.port, NAME.format(i), codec)
+                   for i in range(options.connections)]
+    setup = time.perf_counter() - start
+    selector = selectors.DefaultSelector()
+    for connection in connections:
+        connection.socket.setblocking(False)
+        selector.register(connection.socket, selectors.EVENT_READ, connection)
+
+    latencies = []
+    sent_bytes = 0
+    received_bytes = 0
+
+    def receive(timeout: float):
+        nonlocal received_bytes
+        for key, _ in selector.select(timeout):
+            connection = key.data
+            try:
+                data = connection.socket.recv(1 << 20)
+            except BlockingIOError:
+                continue
+            received_bytes += len(data)
+            now = time.time()
+            for frame in connection.decoder.feed(data):
+                msg = codec.loads(frame)
+                if msg.get("action") == "msg" and msg.get("from", "").startswith("replay"):
+                    latencies.append(now - msg["time"])
+
+    start = time.perf_counter()
+    for number, (record, offset) in enumerate(zip(records, offsets)):
+        while time.perf_counter() - start < offset:
+            receive(max(0.0, offset - (time.perf_counter() - start)))
+        sender = connections[number % len(connections)]
+        recipient = connections[(number + 1) % len(connections)]
+        msg = to_message(record, sender.name, recipient.name)
+        # Неблокирующий сокет: при заполненном буфере сначала читаем, иначе сервер упрется в наши входящие
+        frame = encode_frame(codec.dumps(msg))
+        view = memoryview(frame)
+        while view:
+            try:
+                view = view[sender.socket.send(view):]
+            except BlockingIOError:
+                receive(0.001)
+        sent_bytes += len(frame)
+        if number % 64 == 0:
+            receive(0)
+    sent = time.perf_counter() - start
+    deadline = time.perf_counter() + DRAIN
+    while len(latencies) < len(records) and time.perf_counter() < deadline:
+        receive(0.05)
+    elapsed = time.perf_counter() - start
+    for connection in connections:
+        connection.socket.close()
+
+    latencies.sort()
+    print("records            {:>10}".format(len(records)))
+    print("connections        {:>10}  ({:.1f} conn/s)".format(len(connections), len(connections) / setup))
+    print("send time, s       {:>10.3f}".format(sent))
+    print("sent, msg/s        {:>10.1f}  ({:.2f} MB/s)".format(len(records) / sent, sent_bytes / sent / 1e6))
+    print("delivered          {:>10}  ({:.2f} MB received)".format(len(latencies), received_bytes / 1e6))
+    print("delivered, msg/s   {:>10.1f}".format(len(latencies) / elapsed))
+    print("latency p50, ms    {:>10.2f}".format(percentile(latencies, 50) * 1e3))
+    print("latency p99, ms    {:>10.2f}".format(percentile(latencies, 99) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import json
+import os
+import tracemalloc
+from argparse import ArgumentParser
+
+from benchmarks.bench_payloads import ReplaySocket
+from gb_chat.server import ChatServer
+from gb_chat.tools.requests import request_presence
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(os.path.abspath(__file__)))[0], "config.json")
+
+
+def main():
+    ap = ArgumentParser(description="Memory per connected user: tracemalloc over N logins "
+                                    "through ChatServer.login with the default limits and heartbeat")
+    ap.add_argument("-n", dest="sessions", type=int, default=10000)
+    ap.add_argument("--top", type=int, default=8, help="show the largest allocation sites")
+    options = ap.parse_args()
+
+    with open(CONFIG_PATH) as f:
+        result = json.load(f)
+    chat_server = ChatServer({**result["general"], **result["server"], "address": "127.0.0.1", "port": 7777,
+                              "metrics_dump": None})
+    clients = [ReplaySocket(b"") for _ in range(options.sessions)]
+    requests = []
+    for number in range(options.sessions):
+        data = request_presence("user{}".format(number))
+        data["session"] = "{:016x}".format(number)
+        requests.append(data)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    base = tracemalloc.get_traced_memory()[0]
+    for client, data in zip(clients, requests):
+        chat_server.handshakes.add(client, 0.0)
+        chat_server.handshakes.remove(client)
+        chat_server.login(client, data)
+    # Приветствия отправлены: у простаивающей сессии очередь пуста
+    chat_server.flush_pending()
+    used = tracemalloc.get_traced_memory()[0] - base
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    print("{} sessions: {:.0f} B per session".format(len(chat_server.clients), used / options.sessions))
+    for stat in after.compare_to(before, "lineno")[:options.top]:
+        print("  {:>8.0f} B  {}".format(stat.size_diff / options.sessions, stat.traceback[0]))
+
+
+if __name__ == "__main__":
+    main()
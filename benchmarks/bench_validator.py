@@ -0,0 +1,57 @@
+import json
+import os
+import time
+from argparse import ArgumentParser
+
+from gb_chat.tools.requests import request_join, request_msg, request_presence
+from gb_chat.tools.validator import Validator
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(os.path.abspath(__file__)))[0], "config.json")
+
+
+def jsonschema_path(validator: Validator, data: dict):
+    # Прежний путь сервера: общая схема action, затем msg.json в reader и еще раз в action()
+    validator._validator["action"].validate(data)
+    name = data["action"]
+    if name == "msg":
+        validator._validator[name].validate(data)
+    if name in validator._validator:
+        validator._validator[name].validate(data)
+
+
+def single_pass(validator: Validator, data: dict):
+    validator.validate_action(data)
+
+
+def measure(func, validator: Validator, data: dict, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            func(validator, data)
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    ap = ArgumentParser(description="Messages validated per second: jsonschema passes vs compiled single pass")
+    ap.add_argument("-t", dest="time", type=float, default=1.0, help="seconds per measurement")
+    options = ap.parse_args()
+
+    with open(CONFIG_PATH) as f:
+        validator = Validator(json.load(f)["server"]["schema"])
+    samples = {
+        "msg": request_msg(sender="alice", to="bob", encoding="utf-8", message="hello"),
+        "presence": request_presence("alice"),
+        "join": request_join("dev"),
+    }
+    print("{:>10} {:>14} {:>14} {:>8}".format("action", "jsonschema/s", "compiled/s", "speedup"))
+    for name, data in samples.items():
+        before = measure(jsonschema_path, validator, data, options.time)
+        after = measure(single_pass, validator, data, options.time)
+        print("{:>10} {:>14.0f} {:>14.0f} {:>7.1f}x".format(name, before, after, after / before))
+
+
+if __name__ == "__main__":
+    main()
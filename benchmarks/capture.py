@@ -0,0 +1,228 @@
+import json
+import os
+import re
+import selectors
+import socket
+from argparse import ArgumentParser
+from collections import Counter
+from typing import Optional
+
+from gb_chat.tools.codec import DecodeError, JsonCodec, get_codec
+from gb_chat.tools.compression import get_compressed
+from gb_chat.tools.framing import FrameDecoder
+from gb_chat.tools.requests import ROOM_PREFIX, SERVER_ROOM, request_msg
+
+DEFAULT_CAPTURE = os.path.join(os.path.split(os.path.dirname(os.path.abspath(__file__)))[0], "requests.jsonl")
+# Заглушки для переменных частей кадров при сборке образцов словаря сжатия
+PLACEHOLDER_TIME = 1700000000.0
+PLACEHOLDER_ID = "0123456789abcdef"
+PLACEHOLDER_MESSAGE = "the message"
+ROOM_RE = re.compile(re.escape(ROOM_PREFIX) + r"[^\s'\"]+")
+# Пароль и токены входа/возобновления сессии не попадают в захват даже до нормализации
+SECRETS = {"password": "secret", "token": PLACEHOLDER_ID, "session": PLACEHOLDER_ID}
+
+
+def load_capture(path: str = DEFAULT_CAPTURE) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_time(record: dict) -> Optional[float]:
+    stamp = record.get("time")
+    return stamp if isinstance(stamp, (int, float)) else None
+
+
+def to_message(record: dict, sender: str, to: str) -> dict:
+    # Записи в формате протокола (action msg) отправляются со своим текстом. Прочие строки jsonl,
+    # например requests.jsonl с полями request_id/title/body, превращаются в msg с текстом записи,
+    # чтобы нагрузка шла на реальных по размеру и составу сообщениях.
+    if record.get("action") == "msg":
+        text = record.get("message", "")
+    else:
+        text = "\n".join(str(record[key]) for key in ("title", "body") if key in record) or json.dumps(record)
+    return request_msg(sender=sender, to=to, encoding="utf-8", message=text)
+
+
+def scrub(record: dict) -> dict:
+    result = {}
+    for key, value in record.items():
+        if key in SECRETS and isinstance(value, str):
+            value = SECRETS[key]
+        elif isinstance(value, dict):
+            value = scrub(value)
+        result[key] = value
+    return result
+
+
+def normalize(record: dict, names: re.Pattern) -> dict:
+    # Переменные части кадра заменяются заглушками, остается форма протокола: ключи, действия, тексты сервера
+    result = {}
+    for key, value in record.items():
+        if key in ("time", "since", "until") and isinstance(value, (int, float)):
+            value = PLACEHOLDER_TIME
+        elif key == "seq" and isinstance(value, int):
+            value = 1
+        elif key in SECRETS and isinstance(value, str):
+            value = SECRETS[key]
+        elif key == "messages" and isinstance(value, list):
+            value = []
+        elif key == "message" and record.get("from") != "server":
+            value = PLACEHOLDER_MESSAGE
+        elif isinstance(value, dict):
+            value = normalize(value, names)
+        elif isinstance(value, str):
+            value = normalize_text(value, names)
+        result[key] = value
+    return result
+
+
+def normalize_text(text: str, names: re.Pattern) -> str:
+    # Ответы и уведомления сервера содержат имя пользователя или комнаты внутри текста
+    text = names.sub("user", text)
+    return ROOM_RE.sub(lambda match: match[0] if match[0] == SERVER_ROOM else "#room", text)
+
+
+def build_samples(records: list[dict], count: int) -> list[dict]:
+    # Самые частые формы кадров захвата, по возрастанию частоты: в словаре ближе к концу - короче совпадения
+    names = set()
+    for record in records:
+        user = record.get("user")
+        if isinstance(user, dict) and isinstance(user.get("account_name"), str):
+            names.add(user["account_name"])
+        if record.get("action") == "msg" and record.get("from") != "server":
+            names.add(record.get("from"))
+    names.discard(None)
+    # Длинные имена раньше коротких, только целыми словами: member1 не заменяется внутри member10
+    alternatives = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    pattern = re.compile(r"\b(?:{})\b".format(alternatives) if names else r"(?!)")
+    shapes = Counter(json.dumps(normalize(record, pattern), ensure_ascii=False) for record in records)
+    common = shapes.most_common(count)
+    return [json.loads(shape) for shape, _ in reversed(common)]
+
+
+def literal(value) -> str:
+    # Запись значения в стиле исходников: словари с двойными кавычками, как в json
+    if isinstance(value, dict):
+        return "{" + ", ".join("{}: {}".format(json.dumps(key), literal(item)) for key, item in value.items()) + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join(literal(item) for item in value) + "]"
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    return repr(value)
+
+
+def format_samples(samples: list[dict], width: int = 110) -> str:
+    lines = ["SAMPLES = ("]
+    for sample in samples:
+        line = "    " + literal(sample) + ","
+        while len(line) > width:
+            # Перенос по границе пары ключ-значение
+            cut = line.rfind(", \"", 0, width)
+            if cut < 0:
+                break
+            lines.append(line[:cut + 1])
+            line = "     " + line[cut + 2:]
+        lines.append(line)
+    lines.append(")")
+    return "\n".join(lines)
+
+
+class Tap(object):
+    # Одно проксируемое соединение: кадры в обе стороны пересылаются как есть и пишутся в захват.
+    # Приветствие сервера всегда в json без сжатия, из него берется договоренный кодек для остальных кадров
+    def __init__(self, client: socket.socket, upstream: socket.socket, limit: int):
+        self.peers = {client: upstream, upstream: client}
+        self.decoders = {client: FrameDecoder(limit), upstream: FrameDecoder(limit)}
+        self.upstream = upstream
+        self.limit = limit
+        self.codec = JsonCodec()
+
+    def forward(self, sock: socket.socket, data: bytes) -> list[dict]:
+        self.peers[sock].sendall(data)
+        records = []
+        for frame in self.decoders[sock].feed(data):
+            if self.codec is None:
+                continue
+            try:
+                record = self.codec.loads(frame)
+            except DecodeError:
+                continue
+            records.append(record)
+            if sock is self.upstream and record.get("response") == 200 and "codec" in record:
+                try:
+                    self.codec = get_compressed(get_codec(record["codec"]), record.get("compression"), 0,
+                                                self.limit)
+                except ValueError:
+                    # Кодек не установлен у записывающего: дальше соединение только пересылается
+                    self.codec = None
+        return records
+
+
+def record_command(options):
+    listener = socket.create_server((options.address, options.listen))
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    taps = {}
+    written = 0
+    print("Recording {}:{} -> {}:{} into {}".format(options.address, options.listen, options.address,
+                                                    options.port, options.capture))
+    with open(options.capture, "a", encoding="utf-8") as f:
+        try:
+            while True:
+                for key, _ in selector.select():
+                    sock = key.fileobj
+                    if sock is listener:
+                        client, _ = listener.accept()
+                        upstream = socket.create_connection((options.address, options.port))
+                        tap = Tap(client, upstream, options.limit)
+                        for peer in (client, upstream):
+                            taps[peer] = tap
+                            selector.register(peer, selectors.EVENT_READ)
+                        continue
+                    tap = taps[sock]
+                    try:
+                        data = sock.recv(65536)
+                    except OSError:
+                        data = b""
+                    if not data:
+                        for peer in (sock, tap.peers[sock]):
+                            selector.unregister(peer)
+                            taps.pop(peer)
+                            peer.close()
+                        continue
+                    for item in tap.forward(sock, data):
+                        if not options.raw:
+                            item = scrub(item)
+                        f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        written += 1
+        except KeyboardInterrupt:
+            pass
+    print("{} frames recorded".format(written))
+
+
+def samples_command(options):
+    print(format_samples(build_samples(load_capture(options.capture), options.count)))
+
+
+def main():
+    ap = ArgumentParser(description="Protocol captures: record frames through a proxy, build compression samples")
+    commands = ap.add_subparsers(dest="command", required=True)
+    recorder = commands.add_parser("record", help="forward clients to a server and append every frame to a jsonl "
+                                                  "capture")
+    recorder.add_argument("capture")
+    recorder.add_argument("-a", dest="address", default="127.0.0.1")
+    recorder.add_argument("-l", dest="listen", type=int, default=7779, help="port for clients")
+    recorder.add_argument("-p", dest="port", type=int, default=7778, help="server port")
+    recorder.add_argument("--limit", type=int, default=1 << 24)
+    recorder.add_argument("--raw", action="store_true", help="keep passwords and tokens in the capture")
+    recorder.set_defaults(func=record_command)
+    sampler = commands.add_parser("samples", help="print SAMPLES for gb_chat/tools/compression.py from a capture")
+    sampler.add_argument("capture")
+    sampler.add_argument("-n", dest="count", type=int, default=16, help="most frequent frame shapes to keep")
+    sampler.set_defaults(func=samples_command)
+    options = ap.parse_args()
+    options.func(options)
+
+
+if __name__ == "__main__":
+    main()
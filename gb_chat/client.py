@@ -3,7 +3,8 @@ import traceback
 from argparse import ArgumentParser
 
 from tools.config import prepare_config
-from client import ChatClient, logger
+from client import logger
+from client.aio import AsyncChatClient
 
 CONFIG_PATH = os.getenv("CONFIG_PATH", os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "config.json"))
 
@@ -15,7 +16,7 @@ def main():
 
     options = ap.parse_args()
     config = prepare_config(options, config_path=CONFIG_PATH, service="client")
-    client = ChatClient(config)
+    client = AsyncChatClient(config)
     try:
         client.run()
     except Exception as e:
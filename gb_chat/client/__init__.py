@@ -1,8 +1,7 @@
-import json
 import sys
 import time
 import traceback
-from json import JSONDecodeError
+from collections import deque
 from socket import SOCK_STREAM, AF_INET, socket
 from threading import Thread
 from typing import Optional
@@ -11,7 +10,11 @@ from jsonschema.exceptions import ValidationError
 
 from .logger import logger
 from gb_chat.tools.validator import Validator
-from gb_chat.tools.requests import request_msg, request_presence, request_quit
+from gb_chat.tools.codec import DEFAULT, DecodeError, available_codecs, get_codec
+from gb_chat.tools.compression import get_compressed
+from gb_chat.tools.framing import FrameDecoder, FrameError, encode_frame
+from gb_chat.tools.requests import request_authenticate, request_history, request_join, request_leave, request_msg, \
+    request_presence, request_quit
 from gb_chat.metaclass import ClientVerifier
 
 
@@ -19,95 +22,146 @@ class ChatClient(metaclass=ClientVerifier):
     def __init__(self, config: dict):
         self._config = config
         self.encoding = config["encoding"]
+        self.limit = config["input_limit"]
+        self.buffer_size = config["buffer_size"]
         self.socket = None
+        self.decoder = None
+        self.inbox = None
+        self.codec = None
+        self.codecs = config["codecs"]
+        self.compressions = config["compressions"]
+        self.compression_min_size = config["compression_min_size"]
         self.address = config["address"]
         self.port = config["port"]
         self.account = config["account"]
+        # Токен сессии из приветствия сервера: при переподключении пароль заново не проверяется
+        self.token = None
         self.validator = Validator(config["schema"])
         self.__is_connected = False
 
     def init_socket(self):
         _socket = socket(AF_INET, SOCK_STREAM)
         self.socket = _socket
-        logger.info("Client socket init at {address}:{port}".format(
-            address=self.address, port=self.port
-        ))
+        self.decoder = FrameDecoder(self.limit)
+        self.inbox = deque()
+        self.codec = get_codec(DEFAULT, self.encoding)
+        logger.info("Client socket init at %s:%s", self.address, self.port)
 
     def send_data(self, *, data: dict):
-        data = json.dumps(data).encode(self.encoding)
-        self.socket.send(data)
+        self.socket.sendall(encode_frame(self.codec.dumps(data)))
 
     def get_data(self) -> dict:
-        data = self.socket.recv(1024)
-        data = json.loads(data)
-        return data
+        while not self.inbox:
+            data = self.socket.recv(self.buffer_size)
+            if not data:
+                raise ConnectionResetError("Connection closed by server")
+            self.inbox.extend(self.decoder.feed(data))
+        return self.codec.loads(self.inbox.popleft())
+
+    def close(self):
+        self.socket.close()
 
     def check_data(self, data) -> bool:
         if "response" in data and data["response"] != 200:
             if "error" in data:
                 print(data["error"])
-            self.socket.close()
+            self.close()
             return False
         else:
             if "alert" in data:
                 print(data["alert"])
             return True
 
+    @property
+    def is_connected(self) -> bool:
+        return self.__is_connected
+
+    def login_request(self) -> dict:
+        if self.account.get("password"):
+            presence = request_authenticate(self.account["login"], self.account["password"], self.token)
+        else:
+            presence = request_presence(self.account["login"])
+        presence["codecs"] = available_codecs(self.codecs)
+        if self.compressions:
+            presence["compressions"] = list(self.compressions)
+        # Сам запрос не пишем: в authenticate есть пароль
+        logger.debug("client: %s, try send %s", self.account["login"], presence["action"])
+        return presence
+
+    def welcome(self, data: dict) -> bool:
+        if self.check_data(data):
+            # Сервер, не знающий сжатия, не вернет compression - остаемся на кодеке без него
+            self.codec = get_compressed(get_codec(data.get("codec", DEFAULT), self.encoding), data.get("compression"),
+                                        self.compression_min_size, self.limit)
+            self.token = data.get("token", self.token)
+            self.__is_connected = True
+        return self.__is_connected
+
     def connect(self):
         self.init_socket()
-        logger.debug("client: {name}, try connect to {ip}:{port}".format(
-            name=self.account["login"], ip=self._config["address"], port=self._config["port"]
-        ))
+        logger.debug("client: %s, try connect to %s:%s", self.account["login"], self.address, self.port)
         self.socket.connect((self._config["address"], self._config["port"]))
-        logger.info("client: {name}, connected to {ip}:{port}".format(
-            name=self.account["login"], ip=self._config["address"], port=self._config["port"]
-        ))
-        presence = request_presence(self.account["login"])
-        logger.debug("client: {name}, try send presence: {presence}".format(
-            name=self.account["login"], presence=presence
-        ))
-        self.send_data(data=presence)
-        data = self.get_data()
-        if self.check_data(data):
-            self.__is_connected = True
+        logger.info("client: %s, connected to %s:%s", self.account["login"], self.address, self.port)
+        self.send_data(data=self.login_request())
+        self.welcome(self.get_data())
 
     def action(self, data: dict) -> Optional[dict]:
         msg = None
         action = data["action"]
         if action == "msg":
-            if self.validator.validate_data(action, data):
-                msg = data
+            msg = data
         elif action == "probe":
-            if self.validator.validate_data(action, data):
-                self.send_data(data=request_presence(self.account["login"]))
+            self.send_data(data=request_presence(self.account["login"]))
         return msg
 
+    def show(self, msg: dict):
+        print("\n{sender}: {msg}".format(sender=msg["from"], msg=msg["message"]))
+
+    def process(self, data: dict):
+        logger.debug("Received: %s", data)
+        if "messages" in data:
+            for msg in data["messages"]:
+                print("\n[{to}] {sender}: {msg}".format(to=msg["to"], sender=msg["from"], msg=msg["message"]))
+            if "before" in data:
+                print("\nЕсть более ранние сообщения (before={})".format(data["before"]))
+        elif "response" in data:
+            print("\n{}".format(data.get("alert", data.get("error", data["response"]))))
+        elif self.validator.validate_action(data):
+            data = self.action(data)
+            if data is not None:
+                self.show(data)
+
     def receiver(self):
         while True:
             try:
-                data = self.get_data()
-                logger.debug("Received: {}".format(data))
-                if self.validator.validate_data("action", data):
-                    data = self.action(data)
-                    if data is not None:
-                        print("\n{sender}: {msg}".format(sender=data["from"], msg=data["message"]))
-            except (JSONDecodeError, ValidationError) as e:
-                logger.error(str(e))
+                self.process(self.get_data())
+            except (DecodeError, ValidationError) as e:
+                logger.error("%s", e)
+            except FrameError as e:
+                print("Соединение с сервером, разорвано")
+                logger.critical("%s", e)
+                break
             except (OSError, ConnectionError, ConnectionAbortedError, ConnectionResetError) as ex:
                 print("Соединение с сервером, разорвано")
                 logger.critical(ex.with_traceback(traceback.print_exc()), exc_info=True)
                 break
 
+    def help(self):
+        print("Доступные команды:")
+        print("name - сменить имя (до подключения)")
+        print("connect - подключиться к чату")
+        print("join - войти в комнату (адресат '#комната')")
+        print("leave - покинуть комнату")
+        print("history - последние сообщения комнаты или диалога")
+        print("! - выход из cli")
+        print("exit - выход из программы")
+        print("help - доступные команды")
+
     def cli(self):
         while True:
             command = input("Введите команду: ")
             if command == "help":
-                print("Доступные команды:")
-                print("name - сменить имя (до подключения)")
-                print("connect - подключиться к чату")
-                print("! - выход из cli")
-                print("exit - выход из программы")
-                print("help - доступные команды")
+                self.help()
             elif command == "connect":
                 print("Введите знак '!' чтобы перейти в cli ")
                 self.connect()
@@ -115,6 +169,19 @@ class ChatClient(metaclass=ClientVerifier):
                     break
                 else:
                     print("Подключение не удалось")
+            elif command in ("join", "leave"):
+                if self.__is_connected:
+                    room = input("Введите комнату: ")
+                    self.send_data(data=request_join(room) if command == "join" else request_leave(room))
+                else:
+                    print("Сначала подключитесь к чату")
+            elif command == "history":
+                if self.__is_connected:
+                    to = input("Введите комнату или собеседника: ")
+                    limit = input("Сколько сообщений: ")
+                    self.send_data(data=request_history(to, int(limit) if limit.isdigit() else None))
+                else:
+                    print("Сначала подключитесь к чату")
             elif command == "name":
                 if sys._getframe(1).f_code.co_name == "run":
                     name = input("Ведите имя: ")
@@ -138,9 +205,7 @@ class ChatClient(metaclass=ClientVerifier):
             if msg == "!" or addressee == "!":
                 self.cli()
             msg = request_msg(sender=self.account["login"], to=addressee, encoding=self.encoding, message=msg)
-            logger.debug("client: {name}, try send msg: {msg}".format(
-                name=self.account["login"], msg=msg
-            ))
+            logger.debug("client: %s, try send msg: %s", self.account["login"], msg)
             self.send_data(data=msg)
 
     def run(self):
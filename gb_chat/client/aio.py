@@ -0,0 +1,287 @@
+import asyncio
+import random
+import secrets
+import sys
+from collections import deque
+from concurrent.futures import Executor, Future
+from queue import SimpleQueue
+from socket import AF_INET, SOCK_STREAM, socket
+from threading import Thread
+from typing import Callable, Optional
+
+from jsonschema.exceptions import ValidationError
+
+from . import ChatClient
+from .logger import logger
+from gb_chat.tools.codec import DEFAULT, DecodeError, get_codec
+from gb_chat.tools.framing import FrameDecoder, FrameError, encode_frame
+from gb_chat.tools.requests import request_history, request_join, request_leave, request_msg, request_quit
+from gb_chat.tools.responses import RESPONSE
+
+# Ответы на вход, после которых переподключение повторяется: старая сессия еще не освобождена сервером
+# или presence не дошел вовремя. На 401/402 повторять бессмысленно.
+RETRY = (408, 409)
+
+
+class ConsoleExecutor(Executor):
+    # Один поток-демон для input(). ThreadPoolExecutor при выходе дожидается своих потоков,
+    # а заблокированный input() не прерывается: программа не завершилась бы до нажатия Enter.
+    def __init__(self):
+        self._tasks = SimpleQueue()
+        self._thread = None
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        self._tasks.put((future, fn, args, kwargs))
+        if self._thread is None:
+            self._thread = Thread(target=self.worker, daemon=True)
+            self._thread.start()
+        return future
+
+    def worker(self):
+        while True:
+            future, fn, args, kwargs = self._tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class AsyncChatClient(ChatClient):
+    # Клиент на asyncio: чтение, отправка и ответы на probe идут в одном цикле, консольный ввод
+    # читается в отдельном потоке. Без cli работает как библиотека (боты, нагрузочные тесты):
+    # await connect(), send_data() пишет кадр сразу в транспорт, входящие msg уходят в handler.
+    def __init__(self, config: dict, handler: Optional[Callable[[dict], None]] = None):
+        super().__init__(config)
+        self.handler = handler
+        self.reader = None
+        self.writer = None
+        self.receiving = None
+        self.console = ConsoleExecutor()
+        # Соединение сейчас открыто и вход выполнен; без него send_data() только копит сообщения
+        self.online = False
+        self.reconnect_delay = config["reconnect_delay"]
+        self.reconnect_max_delay = config["reconnect_max_delay"]
+        # Отправленные сообщения с номерами seq, повторяются после переподключения; самые старые вытесняются
+        self.outbox = deque(maxlen=config["outbox_size"])
+        self.sequence = 0
+        # Последний seq, записанный в транспорт: все, что больше, точно не доходило до сервера
+        self.written = 0
+        self.rooms = set()
+        # Идентификатор экземпляра клиента, по нему сервер узнает переподключение и помнит последний seq
+        self.session = secrets.token_hex(8)
+
+    def init_socket(self):
+        _socket = socket(AF_INET, SOCK_STREAM)
+        _socket.setblocking(False)
+        self.socket = _socket
+        self.decoder = FrameDecoder(self.limit)
+        self.inbox = deque()
+        self.codec = get_codec(DEFAULT, self.encoding)
+        logger.info("Client socket init at %s:%s", self.address, self.port)
+
+    def send_data(self, *, data: dict):
+        action = data["action"]
+        if action == "msg":
+            self.sequence += 1
+            data["seq"] = self.sequence
+            if len(self.outbox) == self.outbox.maxlen and self.outbox[0]["seq"] > self.written:
+                logger.warning("Outbound buffer is full, unsent message %s dropped", self.outbox[0]["seq"])
+            self.outbox.append(data)
+        elif action == "join":
+            self.rooms.add(data["room"])
+        elif action == "leave":
+            self.rooms.discard(data["room"])
+        if self.online:
+            self.write(data)
+
+    def write(self, data: dict):
+        # Транспорт сразу пробует send(), в буфер попадает только то, что не влезло в сокет
+        self.writer.write(encode_frame(self.codec.dumps(data)))
+        if "seq" in data:
+            self.written = data["seq"]
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def get_data(self) -> dict:
+        while not self.inbox:
+            data = await self.reader.read(self.buffer_size)
+            if not data:
+                raise ConnectionResetError("Connection closed by server")
+            self.inbox.extend(self.decoder.feed(data))
+        return self.codec.loads(self.inbox.popleft())
+
+    def close(self):
+        self.online = False
+        if self.receiving is not None and self.receiving is not asyncio.current_task():
+            self.receiving.cancel()
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            self.socket.close()
+
+    def login_request(self) -> dict:
+        presence = super().login_request()
+        presence["session"] = self.session
+        return presence
+
+    async def login(self) -> int:
+        self.init_socket()
+        logger.debug("client: %s, try connect to %s:%s", self.account["login"], self.address, self.port)
+        try:
+            await asyncio.get_running_loop().sock_connect(self.socket, (self.address, self.port))
+        except OSError:
+            self.socket.close()
+            raise
+        self.reader, self.writer = await asyncio.open_connection(sock=self.socket)
+        logger.info("client: %s, connected to %s:%s", self.account["login"], self.address, self.port)
+        self.write(self.login_request())
+        data = await self.get_data()
+        if self.welcome(data):
+            self.online = True
+            self.resume(data.get("seq"))
+        return data.get("response", 200)
+
+    def resume(self, acked: Optional[int]):
+        # acked - последний seq, принятый сервером от этого экземпляра клиента. Если сервер нас не помнит
+        # (рестарт, другой воркер), повторяются только сообщения, которые не записывались в прошлое соединение:
+        # судьба остальных неизвестна, и повтор мог бы их задвоить.
+        if acked is None:
+            acked = self.written
+        while self.outbox and self.outbox[0]["seq"] <= acked:
+            self.outbox.popleft()
+        if self.outbox and self.outbox[0]["seq"] > acked + 1:
+            logger.warning("Messages %s-%s were dropped from the outbound buffer", acked + 1, self.outbox[0]["seq"] - 1)
+        for room in self.rooms:
+            self.write(request_join(room))
+        for msg in self.outbox:
+            self.write(msg)
+
+    async def connect(self) -> bool:
+        if await self.login() != 200:
+            return False
+        self.receiving = asyncio.create_task(self.receiver())
+        return True
+
+    async def reconnect(self) -> bool:
+        # Экспоненциальная задержка с полным джиттером: после рестарта сервера клиенты приходят
+        # вразнобой по всему окну, а не одной волной на каждом шаге
+        attempt = 0
+        while True:
+            delay = min(self.reconnect_max_delay, self.reconnect_delay * 2 ** attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+            attempt += 1
+            try:
+                code = await self.login()
+            except (OSError, FrameError, DecodeError) as e:
+                if self.writer is not None:
+                    self.writer.close()
+                logger.info("client: %s, reconnect attempt %s failed: %s", self.account["login"], attempt, e)
+                continue
+            if code == 200:
+                logger.info("client: %s, reconnected after %s attempts", self.account["login"], attempt)
+                return True
+            if code not in RETRY:
+                logger.error("client: %s, reconnect refused: %s", self.account["login"], RESPONSE.get(code, code))
+                return False
+
+    def show(self, msg: dict):
+        if self.handler is None:
+            super().show(msg)
+        else:
+            self.handler(msg)
+
+    async def receiver(self):
+        while True:
+            try:
+                self.process(await self.get_data())
+            except (DecodeError, ValidationError) as e:
+                logger.error("%s", e)
+            except (FrameError, OSError) as e:
+                print("Соединение с сервером, разорвано")
+                logger.critical("%s", e)
+                self.online = False
+                self.writer.close()
+                if not await self.reconnect():
+                    break
+                print("Соединение восстановлено")
+
+    async def input(self, prompt: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self.console, input, prompt)
+
+    async def cli(self, startup: bool = False) -> bool:
+        # False - пользователь вышел из программы
+        while True:
+            command = await self.input("Введите команду: ")
+            if command == "help":
+                self.help()
+            elif command == "connect":
+                if self.is_connected:
+                    print("Вы уже подключены")
+                    continue
+                print("Введите знак '!' чтобы перейти в cli ")
+                if await self.connect():
+                    return True
+                print("Подключение не удалось")
+            elif command in ("join", "leave"):
+                if self.is_connected:
+                    room = await self.input("Введите комнату: ")
+                    self.send_data(data=request_join(room) if command == "join" else request_leave(room))
+                else:
+                    print("Сначала подключитесь к чату")
+            elif command == "history":
+                if self.is_connected:
+                    to = await self.input("Введите комнату или собеседника: ")
+                    limit = await self.input("Сколько сообщений: ")
+                    self.send_data(data=request_history(to, int(limit) if limit.isdigit() else None))
+                else:
+                    print("Сначала подключитесь к чату")
+            elif command == "name":
+                if startup:
+                    self.account["login"] = await self.input("Ведите имя: ")
+                else:
+                    print("Смена имени доступна только при запуске!")
+            elif command == "!":
+                return True
+            elif command == "exit":
+                if self.is_connected:
+                    try:
+                        self.send_data(data=request_quit())
+                        await self.drain()
+                    except OSError:
+                        pass
+                return False
+
+    async def chat(self):
+        while True:
+            addressee = await self.input("Введите адресата: ")
+            msg = await self.input("Сообщение: ")
+            if msg == "!" or addressee == "!":
+                if not await self.cli():
+                    return
+                continue
+            msg = request_msg(sender=self.account["login"], to=addressee, encoding=self.encoding, message=msg)
+            logger.debug("client: %s, try send msg: %s", self.account["login"], msg)
+            self.send_data(data=msg)
+
+    async def main(self):
+        if not await self.cli(startup=True) or not self.is_connected:
+            return
+        chat = asyncio.create_task(self.chat())
+        # Разрыв соединения завершает receiver, и клиент выходит сразу, без опроса потоков
+        done, _ = await asyncio.wait((chat, self.receiving), return_when=asyncio.FIRST_COMPLETED)
+        chat.cancel()
+        self.close()
+        if chat in done:
+            chat.result()
+
+    def run(self):
+        try:
+            asyncio.run(self.main())
+        except (EOFError, KeyboardInterrupt):
+            sys.exit(1)
@@ -1,9 +1,11 @@
 import inspect
 import sys
 from functools import wraps
-from logging import Formatter, FileHandler, getLogger
+from logging import Formatter, FileHandler
 import os
 
+from gb_chat.tools.log import DeferredFlushMixin, queue_logger
+
 DEBUG = os.getenv("DEBUG", "")
 DEBUG = True if "1" == DEBUG or "true" == DEBUG.lower() else False
 
@@ -13,15 +15,15 @@ NAME = "Client"
 LEVEL = "INFO"
 FILE = "client-gb_async-chat.log"
 
-handler = FileHandler(FILE, encoding=ENCODING)
+
+class QueuedFileHandler(DeferredFlushMixin, FileHandler):
+    pass
+
+
+handler = QueuedFileHandler(FILE, encoding=ENCODING)
 handler.setFormatter(FORMATTER)
 
-logger = getLogger(NAME)
-logger.addHandler(handler)
-if DEBUG:
-    logger.setLevel("DEBUG")
-else:
-    logger.setLevel(LEVEL)
+logger = queue_logger(NAME, "DEBUG" if DEBUG else LEVEL, handler)
 
 
 def log(func):
@@ -29,9 +31,7 @@ def log(func):
     def wrap(*args, **kwargs):
         print(inspect.stack()[1][3])
         # не использовал inspect потому что при, обертки метода и функции результаты будут отличаться
-        logger.debug("Функция {name} вызвана из функции {caller}".format(
-            name=wrap.__name__, caller=sys._getframe(1).f_code.co_name)
-        )
+        logger.debug("Функция %s вызвана из функции %s", wrap.__name__, sys._getframe(1).f_code.co_name)
         return func(*args, **kwargs)
 
     return wrap
@@ -7,7 +7,7 @@ class ClientVerifier(type):
         methods = []
         attrs = []
         classes = []
-        allowed = ["Validator"]
+        allowed = ["set", "super", "Validator", "ConsoleExecutor", "deque", "secrets"]
 
         for key, value in clsdict.items():
             if isinstance(value, socket):
@@ -54,7 +54,9 @@ class ServerVerifier(type):
         methods = []
         attrs = []
         classes = []
-        allowed = ["Validator"]
+        allowed = ["set", "super", "Validator", "SessionRegistry", "SequenceRegistry", "RoomRegistry",
+                   "HandshakeRegistry", "OfflineStore", "HistoryLog", "Authenticator", "Heartbeat", "BufferPool",
+                   "ServerMetrics", "time"]
 
         for key, value in clsdict.items():
             if isinstance(value, socket):
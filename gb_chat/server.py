@@ -1,20 +1,42 @@
 import os
 import traceback
 from argparse import ArgumentParser
+from getpass import getpass
 
 from server import ChatServer, logger
+from server.aio import AsyncChatServer
+from server.auth import UserStore
+from server.cluster import run_cluster
 from tools.config import prepare_config
 
 CONFIG_PATH = os.getenv("CONFIG_PATH", os.path.join(os.path.split(os.path.dirname(__file__))[0], "config.json"))
+ENGINES = {
+    "select": ChatServer,
+    "asyncio": AsyncChatServer,
+}
 
 
 def main():
     ap = ArgumentParser()
     ap.add_argument("-a", dest="addr", required=False, default="0.0.0.0", help="IP-address or 'localhost'")
     ap.add_argument("-p", dest="port", type=int, required=False, help="port in range 1024-49151")
+    ap.add_argument("-e", dest="engine", required=False, default="select", choices=ENGINES.keys(),
+                    help="server engine: 'select' (default) or 'asyncio'")
+    ap.add_argument("-w", dest="workers", type=int, required=False, default=1,
+                    help="number of worker processes sharing the port via SO_REUSEPORT")
+    ap.add_argument("--add-user", dest="add_user", required=False, metavar="NAME",
+                    help="add a user (or change the password) in the 'users' file and exit")
     options = ap.parse_args()
     config = prepare_config(options, config_path=CONFIG_PATH, service="server")
-    server = ChatServer(config)
+    if options.add_user:
+        if not config["users"]:
+            raise ValueError("'users' file is not set in config")
+        UserStore(config["users"]).add(options.add_user, getpass("Password: "))
+        return
+    if options.workers > 1:
+        run_cluster(ENGINES[options.engine], config, options.workers)
+        return
+    server = ENGINES[options.engine](config)
     logger.info("Server rdy")
     server.run()
 
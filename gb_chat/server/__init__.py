@@ -1,16 +1,31 @@
-import json
-import select
-from json import JSONDecodeError
-from socket import AF_INET, SOCK_STREAM, socket
+import signal
+import time
+from collections import deque
+from selectors import DefaultSelector, EVENT_READ, EVENT_WRITE
+from socket import AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, socket, socketpair
 from typing import Optional
 
 from jsonschema.exceptions import ValidationError
 
 from .logger import logger
+from .history import CURSOR_MAX, HistoryLog, conversation, fit_page
+from .metrics import ServerMetrics, serve_metrics
+from .auth import Authenticator
+from .heartbeat import Heartbeat
+from .limits import TokenBucket
+from .handshake import ACTIVE, AUTHENTICATING, AWAITING_PRESENCE, Handshake, HandshakeRegistry
+from .outbox import Outbox
+from .rooms import RoomRegistry
+from .sessions import SequenceRegistry, Session, SessionRegistry
+from .store import OfflineStore
 from gb_chat.tools.validator import Validator
+from gb_chat.tools.codec import DEFAULT, DecodeError, EncodeError, get_codec, negotiate
+from gb_chat.tools.compression import get_compressed, negotiate_compression
 from gb_chat.tools.responses import error_400, error_500, ok, RESPONSE
-from gb_chat.tools.requests import request_msg
+from gb_chat.tools.requests import ROOM_PREFIX, SERVER_ROOM, request_msg, request_probe, room_name
 from gb_chat.tools.descriptors import Port
+from gb_chat.tools.framing import BufferPool, FrameDecoder, FrameError, encode_frame
+from gb_chat.tools.message import Message
 from gb_chat.metaclass import ServerVerifier
 
 
@@ -18,153 +33,749 @@ class ChatServer(metaclass=ServerVerifier):
     port = Port()
 
     def __init__(self, config):
-        self.clients = {}
+        self.clients = SessionRegistry()
+        self.sequences = SequenceRegistry(config["resume_cache_size"])
+        # Подключения, которые еще не прислали presence
+        self.handshakes = HandshakeRegistry(config["handshake_timeout"])
+        self.rooms = RoomRegistry()
+        # Проверка живости: probe молчащим сессиям и отключение не ответивших; null в heartbeat_interval - выключено
+        self.heartbeats = None
+        if config["heartbeat_interval"]:
+            self.heartbeats = Heartbeat(config["heartbeat_interval"], config["heartbeat_timeout"],
+                                        config["heartbeat_tick"], time.monotonic())
+        self.decoders = {}
+        self._codecs = {}
+        # Сессии, которым с прошлого прохода цикла добавились исходящие данные
+        self.dirty = set()
+        # Бюджет чтения текущего прохода, сокеты, выбравшие свою долю целиком, и сокеты, чтение которых
+        # приостановлено до пополнения ведра байтов: сокет -> время возобновления
+        self.budget = 0
+        self.unread = []
+        self.muted = {}
+        # Селектор движка select (epoll в Linux); у движка asyncio свой цикл событий
+        self.selector = None
+        # Пара сокетов, которой пул проверки паролей будит цикл select, и очередь готовых проверок
+        self.waker = None
+        self.verified = None
+        # Флаг остановки цикла run(): выставляет stop(), в том числе из другого потока
+        self.stopped = False
         self.socket = None
+        self.socket_options = []
+        # Связь с брокером в режиме нескольких процессов (см. cluster.py)
+        self.cluster = None
         self.address = config["address"]
         self.port = config["port"]
         self.listen = config["listen"]
-        self.timeout = config["timeout"]
         self.validator = Validator(config["schema"])
         self.encoding = config["encoding"]
         self.limit = config["input_limit"]
         self.select_wait = config["select_wait"]
+        self.buffer_size = config["buffer_size"]
+        self.output_limit = config["output_limit"]
+        self.read_budget = config["read_budget"]
+        # Общий пул буферов приема: recv_into читает в буфер из пула, кадры разбираются из memoryview,
+        # опустевший буфер возвращается в пул
+        self.buffers = BufferPool(self.buffer_size, config["buffer_pool_size"])
+        self.rate_messages = config["rate_messages"]
+        self.rate_messages_burst = config["rate_messages_burst"]
+        self.rate_bytes = config["rate_bytes"]
+        self.rate_bytes_burst = config["rate_bytes_burst"]
+        self.overflow_policy = config["overflow_policy"]
+        self.codecs = config["codecs"]
+        # Сжатие согласуется при входе, как и кодек; кадры короче compression_min_size не сжимаются
+        self.compressions = config["compressions"]
+        self.compression_min_size = config["compression_min_size"]
+        # Хранилище личных сообщений для пользователей не в сети, включается путем к файлу SQLite
+        self.store = None
+        if config["offline_store"]:
+            self.store = OfflineStore(config["offline_store"], config["offline_retention"], self.encoding)
+        # Пользователи с паролями; без файла пользователей вход по presence, как раньше
+        self.auth = None
+        if config["users"]:
+            self.auth = Authenticator(config["users"], config["auth_workers"], config["token_ttl"],
+                                      config["token_cache_size"])
+        # Счетчики и гистограммы по этапам; выгрузка по HTTP (metrics_port) и/или по SIGUSR1 в файл
+        self.metrics = ServerMetrics()
+        # Адрес метрик отдельно от address чата: по умолчанию только localhost, наружу - явной настройкой
+        self.metrics_address = config["metrics_address"]
+        self.metrics_port = config["metrics_port"]
+        self.metrics_dump = config["metrics_dump"]
+        self.metrics_server = None
+        self.metrics.gauge("chat_sessions", "Logged in sessions", lambda: len(self.clients))
+        self.metrics.gauge("chat_handshakes", "Connections waiting for presence", lambda: len(self.handshakes))
+        self.metrics.gauge("chat_outbox_bytes", "Bytes queued in all outboxes",
+                           lambda: sum(len(session.outbox) for session in self.clients.sessions() if session.outbox))
+        self.metrics.gauge("chat_outbox_dropped", "Frames dropped by drop_oldest overflow policy",
+                           lambda: sum(session.outbox.dropped for session in self.clients.sessions() if session.outbox))
+        # Журнал истории сообщений, включается путем к каталогу сегментов
+        self.history = None
+        self.history_limit = config["history_limit"]
+        if config["history"]:
+            self.history = HistoryLog(config["history"], config["history_segment_size"],
+                                      config["history_flush_interval"], self.encoding)
 
     def init_socket(self):
         _socket = socket(AF_INET, SOCK_STREAM)
+        # Перезапуск не ждет, пока соединения прошлого процесса выйдут из TIME_WAIT, как и в движке asyncio
+        _socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        for option in self.socket_options:
+            _socket.setsockopt(*option)
         _socket.bind((self.address, self.port))
-        _socket.settimeout(self.timeout)
+        _socket.setblocking(False)
         self.socket = _socket
         self.socket.listen(self.listen)
-        logger.info("Server started at {address}:{port}, timeout={timeout}, listen={listen}".format(
-            address=self.address, port=self.port, timeout=self.timeout, listen=self.listen
-        ))
+        # Сокеты регистрируются один раз: слушающий и брокер здесь, клиенты в accept
+        self.selector = DefaultSelector()
+        self.selector.register(self.socket, EVENT_READ)
+        self.waker = socketpair()
+        self.waker[0].setblocking(False)
+        self.waker[1].setblocking(False)
+        self.selector.register(self.waker[0], EVENT_READ)
+        self.verified = deque()
+        if self.cluster is not None:
+            self.selector.register(self.cluster, EVENT_READ)
+        logger.info("Server started at %s:%s, handshake_timeout=%s, listen=%s",
+                    self.address, self.port, self.handshakes.timeout, self.listen)
 
-    def get_data(self, *, client: socket) -> dict:
-        try:
-            data = client.recv(self.limit).decode(self.encoding)
-            data = json.loads(data)
-            return data
-        except ConnectionResetError:
-            logger.info(str(client.getpeername()) + " disconnected")
-            self.clients.pop(client)
+    def get_codec(self, name: str = DEFAULT, compression: Optional[str] = None):
+        # Один экземпляр на пару кодек + сжатие: по нему кешируются закодированные кадры
+        key = name if compression is None else (name, compression)
+        codec = self._codecs.get(key)
+        if codec is None:
+            codec = get_compressed(get_codec(name, self.encoding), compression, self.compression_min_size, self.limit)
+            codec = self._codecs.setdefault(key, codec)
+        return codec
+
+    def decode(self, frame: bytes, codec=None) -> dict:
+        start = time.perf_counter()
+        data = (codec or self.get_codec()).loads(frame)
+        self.metrics.stages["decode"].observe(time.perf_counter() - start)
+        return data
+
+    def encode(self, data: dict, codec=None) -> bytes:
+        # Ответы и запросы из tools (Message) держат готовый кадр, принятые от клиентов сообщения - обычные dict
+        if isinstance(data, Message):
+            return data.frame(codec or self.get_codec())
+        return encode_frame((codec or self.get_codec()).dumps(data))
+
+    def get_data(self, *, client: socket, quota: Optional[int] = None) -> list[memoryview]:
+        decoder = self.decoders.get(client)
+        if decoder is None:
+            decoder = self.decoders.setdefault(client, FrameDecoder(self.limit, self.buffers))
+        quota = self.limit if quota is None else quota
+        session = self.clients.get(client)
+        if session is not None and session.traffic is not None:
+            quota = min(quota, max(self.buffer_size, int(session.traffic.update(time.monotonic()))))
+        received = 0
+        start = time.perf_counter()
+        # Читаем блоками по buffer_size прямо в буфер декодера, пока сокет не опустеет, но не больше quota,
+        # и разбираем кадры после каждого чтения: в буфере лежит не больше одного недоразобранного кадра.
+        # memoryview кадров действительны до decoder.release() в receive()
+        frames = []
+        while received < quota:
+            try:
+                size = decoder.read(client, self.buffer_size)
+            except BlockingIOError:
+                break
+            if not size:
+                if received:
+                    break
+                raise ConnectionResetError("Connection closed by peer")
+            received += size
+            frames.extend(decoder.frames())
+            if size < self.buffer_size:
+                break
+        else:
+            self.unread.append(client)
+        self.budget -= received
+        if session is not None and session.traffic is not None:
+            now = time.monotonic()
+            session.traffic.take(received, now)
+            delay = session.traffic.delay(now)
+            if delay:
+                self.mute(session, now + delay)
+        self.metrics.stages["recv"].observe(time.perf_counter() - start)
+        self.metrics.bytes_in.inc(received)
+        return frames
 
     def send_data(self, *, client: socket, data: dict):
-        data = json.dumps(data).encode(self.encoding)
-        client.send(data)
+        session = self.clients.get(client)
+        if session is None:
+            self.send_direct(client, self.encode(data))
+        else:
+            # Ответы без action считаются под меткой response
+            self.metrics.frames_out(data.get("action", "response")).inc()
+            self.push(session, self.encode(data, session.codec))
+
+    def send_direct(self, client: socket, frame: bytes):
+        # Ответы до входа в чат (ошибки рукопожатия) отправляются сразу, мимо очереди
+        client.sendall(frame)
+
+    def push(self, session: Session, frame: bytes):
+        if session.outbox.put(frame):
+            self.wakeup(session)
+        else:
+            logger.warning("%s output queue overflow (%s bytes), disconnecting", session.name, len(session.outbox))
+            # Остальные узнают о выходе, как при любом другом отключении (AsyncChatServer.disconnect рассылает сам)
+            msg = self.disconnect(session.client)
+            if msg is not None:
+                self.writer([(session.client, msg)])
+
+    def wakeup(self, session: Session):
+        self.dirty.add(session)
+
+    def flush(self, session: Session):
+        start = time.perf_counter()
+        self.metrics.bytes_out.inc(session.outbox.flush(session.client.sendmsg))
+        self.metrics.stages["send"].observe(time.perf_counter() - start)
+
+    def flush_pending(self, ready: list[Session] = ()):
+        # Отправляем сразу тем, кому добавились данные, и тем, чей сокет снова готов к записи.
+        # Интерес к записи в селекторе включен, только пока в очереди что-то осталось
+        sessions = self.dirty.union(ready)
+        self.dirty.clear()
+        for session in sessions:
+            if session.client not in self.clients:
+                continue
+            try:
+                self.flush(session)
+            except OSError:
+                logger.info("%s disconnected", session.name)
+                self.disconnect(session.client)
+                continue
+            self.watch(session.client, bool(session.outbox))
+
+    def watch(self, client: socket, writable: bool):
+        if self.selector is None:
+            return
+        events = (0 if client in self.muted else EVENT_READ) | (EVENT_WRITE if writable else 0)
+        key = self.selector.get_map().get(client)
+        if key is None:
+            if events:
+                self.selector.register(client, events)
+        elif not events:
+            self.selector.unregister(client)
+        elif key.events != events:
+            self.selector.modify(client, events)
+
+    def mute(self, session: Session, until: float):
+        # Клиент превысил байты в секунду: не читаем его сокет, пока ведро не пополнится,
+        # данные копятся в буфере ядра, и окно TCP притормаживает отправителя
+        self.muted[session.client] = until
+        self.metrics.error("Throttled").inc()
+        self.watch(session.client, bool(session.outbox))
+
+    def unmute(self):
+        if not self.muted:
+            return
+        now = time.monotonic()
+        for client, until in list(self.muted.items()):
+            if until <= now:
+                del self.muted[client]
+                session = self.clients.get(client)
+                if session is not None:
+                    self.watch(client, bool(session.outbox))
+
+    def admit(self, session: Session) -> bool:
+        # Сообщения сверх лимита отбрасываются, 429 уходит один раз на серию отброшенных
+        if session.rate.consume(1, time.monotonic()):
+            session.throttled = False
+            return True
+        if not session.throttled:
+            session.throttled = True
+            self.metrics.error("RateLimit").inc()
+            self.send_data(client=session.client, data=error_400(code=429))
+        return False
 
     def action(self, client: socket, data: dict) -> Optional[dict]:
         msg = None
         action = data["action"]
         if action == "msg":
-            if self.validator.validate_data(action, data):
+            session = self.clients.get(client)
+            seq = data.get("seq")
+            if seq is not None:
+                if seq <= session.sequence:
+                    # Повтор после переподключения, сообщение уже было принято
+                    return None
+                session.sequence = seq
+            to = data["to"]
+            if to != SERVER_ROOM and to.startswith(ROOM_PREFIX) and to not in session.rooms:
+                self.send_data(client=client, data=error_400(code=403))
+            else:
+                # Отправитель - имя сессии, а не то, что написал клиент: чужим именем не подписаться ни
+                # в доставке, ни в журнале истории
+                if data["from"] != session.name:
+                    data["from"] = session.name
                 msg = data
         elif action == "presence":
-            if self.validator.validate_data(action, data):
+            # Ответ на probe не подтверждаем, иначе heartbeat удваивает трафик
+            if self.clients.get(client).probed is None:
                 self.send_data(client=client, data=ok())
         elif action == "authenticate":
-            if self.validator.validate_data(action, data):
-                pass
+            pass
         elif action == "quit":
-            if client in self.clients:
-                msg = request_msg(
-                    sender="server", to="global", encoding=self.encoding,
-                    message="Пользователь: {user}, покинул чат!".format(user=self.clients[client])
-                )
-            self.quite(client, ok("Goodbye!"))
+            msg = self.quite(client, ok("Goodbye!"))
         elif action == "join":
-            pass
+            self.join(client, room_name(data["room"]))
         elif action == "leave":
-            pass
+            self.leave(client, room_name(data["room"]))
+        elif action == "history":
+            self.send_history(client, data)
         return msg
 
-    def quite(self, client: socket, msg: dict):
+    def join(self, client: socket, room: str):
+        if room == SERVER_ROOM or room == ROOM_PREFIX:
+            self.send_data(client=client, data=error_400(error="Room {} is reserved".format(room)))
+        elif self.rooms.join(room, self.clients.get(client)):
+            self.send_data(client=client, data=ok("Joined {}".format(room)))
+        else:
+            self.send_data(client=client, data=error_400(error="Already in {}".format(room)))
+
+    def leave(self, client: socket, room: str):
+        if self.rooms.leave(room, self.clients.get(client)):
+            self.send_data(client=client, data=ok("Left {}".format(room)))
+        else:
+            self.send_data(client=client, data=error_400(code=403))
+
+    def send_history(self, client: socket, data: dict):
+        session = self.clients.get(client)
+        to = data["to"]
+        if to != SERVER_ROOM and to.startswith(ROOM_PREFIX) and to not in session.rooms:
+            self.send_data(client=client, data=error_400(code=403))
+            return
+        result = ok()
+        result["messages"] = []
+        if self.history is not None:
+            limit = max(0, min(int(data.get("limit", self.history_limit)), self.history_limit))
+            messages, start, first = self.history.page(conversation(data, session.name), limit, data.get("since"),
+                                                       data.get("until"), data.get("before"))
+            # Ответ уходит одним кадром, а клиент не примет кадр длиннее input_limit. Сжатый кадр проверяется
+            # по несжатому телу - этим же limit ограничена распаковка; байт флага сжатия в запасе
+            codec = getattr(session.codec, "codec", session.codec)
+            result["messages"], start = fit_page(codec, {**result, "before": CURSOR_MAX}, messages, start,
+                                                 self.limit - 1)
+            if start > first:
+                # Более ранние сообщения - следующим запросом с before
+                result["before"] = start
+        self.send_data(client=client, data=result)
+
+    def quite(self, client: socket, msg: dict) -> Optional[dict]:
         if client in self.clients:
-            self.clients.pop(client)
-            self.send_data(client=client, data=msg)
-            client.close()
-
-    def writer(self, clients: list[socket], msgs: dict):
-        for sender, msg in msgs.items():
-            if msg["to"] == "#server":
-                for client in clients:
-                    try:
-                        self.send_data(client=client, data=msg)
-                    except ConnectionResetError:
-                        if client in self.clients:
-                            log = str(client.getpeername()) + " disconnected"
-                            logger.info(log)
-                            self.clients.pop(client)
-            elif msg["to"] in self.clients.values():
-                client = list(self.clients.keys())[list(self.clients.values()).index(msg["to"])]
+            try:
                 self.send_data(client=client, data=msg)
+            except OSError:
+                pass
+        return self.disconnect(client)
 
-    def reader(self, clients: list[socket]) -> dict:
-        error = None
-        msgs = {}
-        for client in clients:
+    def disconnect(self, client: socket) -> Optional[dict]:
+        msg = None
+        self.handshakes.remove(client)
+        session = self.clients.remove(client)
+        if session is not None:
+            if self.cluster is not None:
+                self.cluster.release(session.name)
+            self.dirty.discard(session)
+            try:
+                self.flush(session)
+            except OSError:
+                pass
+            self.rooms.leave_all(session)
+            if self.heartbeats is not None:
+                self.heartbeats.remove(session)
+            if session.resume is not None:
+                self.sequences.save(session.name, session.resume, session.sequence)
+            msg = request_msg(sender="server", to=SERVER_ROOM, encoding=self.encoding,
+                              message="Пользователь: '{user}' покинул чат!".format(user=session.name))
+            logger.info("Потеряно соединение с: %s", session.name)
+        self.decoders.pop(client, None)
+        self.muted.pop(client, None)
+        if self.selector is not None:
             try:
-                data = self.get_data(client=client)
-                if self.validator.validate_data("action", data):
-                    if data["action"] == "msg":
-                        self.validator.validate_data("msg", data)
-                        data = self.action(client, data)
-                        if data is not None:
-                            msgs[client] = data
-            except (JSONDecodeError, ValidationError) as e:
-                error = error_400()
-                logger.error(str(e))
-            finally:
-                if error is not None:
-                    try:
-                        self.send_data(client=client, data=error)
-                        client.close()
-                    except ConnectionResetError:
-                        if client in self.clients:
-                            user = self.clients.pop(client)
-                            msg = "Пользователь: '{user}' покинул чат!".format(user=user)
-                            msgs[client] = request_msg(sender="server", to="#server",
-                                                       encoding=self.encoding, message=msg)
-                        logger.info("Потеряно соединение с: {}".format(client.getpeername()))
+                self.selector.unregister(client)
+            except (KeyError, ValueError):
+                pass
+        client.close()
+        return msg
 
-        return msgs
+    def writer(self, msgs: list[tuple[socket, dict]], publish: bool = True):
+        # publish=False для сообщений, пришедших от брокера: их уже получили остальные воркеры
+        start = time.perf_counter()
+        for sender, msg in msgs:
+            to = msg["to"]
+            if to == SERVER_ROOM:
+                recipients = self.clients.sessions()
+            elif to.startswith(ROOM_PREFIX):
+                recipients = self.rooms.members(to)
+            else:
+                session = self.clients.find(to)
+                recipients = [] if session is None else [session]
+            try:
+                # Кадр кодируется один раз на кодек, очереди всех получателей ссылаются на один и тот же буфер.
+                # Все кодирование - до первой отправки: сообщение, которое не кодируется для кого-то из
+                # получателей, брокера или журнала, отбрасывается целиком, а цикл продолжает работу
+                frames = {}
+                for session in recipients:
+                    if session.codec not in frames:
+                        frames[session.codec] = memoryview(self.encode(msg, session.codec))
+                if self.history is not None and publish:
+                    # Сообщения от брокера уже записал воркер-отправитель
+                    self.history.append(msg)
+                if publish and to.startswith(ROOM_PREFIX):
+                    if self.cluster is not None:
+                        self.cluster.broadcast(msg)
+                elif publish and not recipients:
+                    if self.cluster is not None:
+                        # Если адресат не в сети ни на одном воркере, брокер вернет сообщение как undelivered
+                        self.cluster.route(msg)
+                    elif self.store is not None:
+                        self.offline(msg)
+            except EncodeError as e:
+                logger.error("Message from %s to %s dropped: %s", msg.get("from"), to, e)
+                self.metrics.error(type(e).__name__).inc()
+                continue
+            for session in recipients:
+                self.push(session, frames[session.codec])
+            if recipients:
+                self.metrics.frames_out(msg["action"]).inc(len(recipients))
+        self.metrics.stages["route"].observe(time.perf_counter() - start)
 
-    def accept(self):
+    def offline(self, msg: dict):
+        # Запись на диск откладывается до commit() в конце прохода цикла
+        self.store.put(msg)
+
+    def deliver_offline(self, session: Session):
+        for msg in self.store.take(session.name):
+            self.metrics.frames_out(msg["action"]).inc()
+            self.push(session, self.encode(msg, session.codec))
+
+    def cluster_reader(self):
+        msgs = []
+        for request in self.cluster.receive():
+            if request["op"] == "undelivered":
+                if self.store is not None:
+                    self.offline(request["msg"])
+            else:
+                msgs.append((None, request["msg"]))
+        self.writer(msgs, publish=False)
+
+    def handle(self, client: socket, data: dict) -> Optional[dict]:
+        # Сообщение проверяется ровно один раз схемой своего action, action() повторно не валидирует
+        msg = None
+        start = time.perf_counter()
+        valid = self.validator.validate_action(data)
+        self.metrics.stages["validate"].observe(time.perf_counter() - start)
+        if valid:
+            self.metrics.message(data["action"]).inc()
+            msg = self.action(client, data)
+        return msg
+
+    def credentials(self, data: dict) -> Optional[int]:
+        # Код ответа на рукопожатие: 200 - можно входить, None - нужна проверка пароля в пуле потоков.
+        # Первый кадр еще никто не проверял: не объект или не presence/authenticate - ValidationError, ответ 400
+        action = data.get("action") if isinstance(data, dict) else None
+        self.validator.validate_data("authenticate" if action == "authenticate" else "presence", data)
+        if self.auth is None:
+            return 200
+        if action != "authenticate":
+            return 401
+        user = data["user"]
+        if self.auth.tokens.check(user["account_name"], user.get("token")):
+            return 200
+        if "password" not in user:
+            return 402
+        return None
+
+    def login(self, client: socket, data: dict) -> bool:
+        name = "authenticate" if data.get("action") == "authenticate" else "presence"
+        if self.validator.validate_data(name, data):
+            user = data["user"]["account_name"]
+            session = None
+            if self.clients.find(user) is None and (self.cluster is None or self.cluster.claim(user)):
+                session = self.clients.add(client, user)
+            if session is not None:
+                session.outbox = Outbox(self.output_limit, self.overflow_policy)
+                # Приветствие уходит еще в json, дальше обе стороны используют согласованный кодек
+                welcome = ok("Welcome")
+                welcome["codec"] = negotiate(data.get("codecs", []), self.codecs)
+                compression = negotiate_compression(data.get("compressions", []), self.compressions)
+                if compression is not None:
+                    welcome["compression"] = compression
+                if self.auth is not None:
+                    welcome["token"] = self.auth.tokens.issue(user)
+                session.resume = data.get("session")
+                if session.resume is not None:
+                    sequence = self.sequences.restore(user, session.resume)
+                    if sequence is not None:
+                        # Клиент удалит из своего буфера все, что не больше seq, и повторит остальное
+                        session.sequence = welcome["seq"] = sequence
+                self.send_data(client=client, data=welcome)
+                session.codec = self.get_codec(welcome["codec"], compression)
+                now = time.monotonic()
+                if self.heartbeats is not None:
+                    self.heartbeats.add(session, now)
+                if self.rate_messages:
+                    session.rate = TokenBucket(self.rate_messages, self.rate_messages_burst, now)
+                if self.rate_bytes:
+                    session.traffic = TokenBucket(self.rate_bytes, self.rate_bytes_burst, now)
+                if self.store is not None:
+                    self.deliver_offline(session)
+                return True
+            # Сокет закрывает вызывающий через disconnect()
+            self.send_data(client=client, data=error_400(code=409))
+            logger.error("User: %s, %s", user, RESPONSE[409])
+        return False
+
+    def handshake(self, client: socket, frames: list[memoryview]) -> list[memoryview]:
+        # Первый кадр нового подключения - presence или authenticate; кадры, пришедшие вместе с ним,
+        # обрабатываются как обычно, а пока пароль проверяется в пуле - откладываются.
+        # Отложенные кадры копируются: их memoryview указывают в буфер, который вернется в пул
+        handshake = self.handshakes.get(client)
+        if handshake.state == AUTHENTICATING:
+            handshake.frames.extend(bytes(frame) for frame in frames)
+            return []
+        if not frames:
+            handshake.state = AWAITING_PRESENCE
+            return []
+        data = self.decode(frames[0])
+        code = self.credentials(data)
+        if code is None:
+            handshake.state = AUTHENTICATING
+            handshake.data = data
+            handshake.frames = [bytes(frame) for frame in frames[1:]]
+            future = self.auth.submit(data["user"]["account_name"], data["user"]["password"])
+            future.add_done_callback(
+                lambda result: self.wakeup_verified(handshake, result.exception() is None and result.result())
+            )
+            return []
+        self.handshakes.remove(client)
+        if code != 200:
+            self.send_data(client=client, data=error_400(code=code))
+            self.disconnect(client)
+            return []
+        if not self.login(client, data):
+            self.disconnect(client)
+            return []
+        handshake.state = ACTIVE
+        return frames[1:]
+
+    def wakeup_verified(self, handshake: Handshake, result: bool):
+        # Вызывается из потока пула
+        self.verified.append((handshake, result))
         try:
-            client, addr = self.socket.accept()
-        except OSError:
-            return
-        logger.info("Запрос на соединение от: {}".format(addr))
-        client.settimeout(self.select_wait)
+            self.waker[1].send(b"\0")
+        except BlockingIOError:
+            pass
+
+    def authenticated(self) -> list[tuple[socket, dict]]:
         try:
-            data = self.get_data(client=client)
-            client.settimeout(None)
-            if self.validator.validate_data("presence", data):
-                user = data["user"]["account_name"]
-                if user not in self.clients.values():
-                    self.clients.setdefault(client, user)
-                    self.send_data(client=client, data=ok("Welcome"))
+            while self.waker[0].recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        msgs = []
+        while self.verified:
+            handshake, result = self.verified.popleft()
+            client = handshake.client
+            # Подключение могло закрыться или истечь по таймауту, пока считался хеш
+            if self.handshakes.get(client) is not handshake:
+                continue
+            self.handshakes.remove(client)
+            handshake.state = ACTIVE
+            try:
+                if not result:
+                    self.send_data(client=client, data=error_400(code=402))
+                    self.disconnect(client)
+                elif not self.login(client, handshake.data):
+                    self.disconnect(client)
                 else:
-                    self.send_data(client=client, data=error_400(code=409))
-                    client.close()
-                    logger.error("User: {user}, {error}".format(user=user, error=RESPONSE[409]))
+                    msgs.extend(self.receive(client, handshake.frames))
+            except OSError:
+                self.disconnect(client)
+        return msgs
+
+    def receive(self, client: socket, frames: Optional[list[bytes]] = None,
+                quota: Optional[int] = None) -> list[tuple[socket, dict]]:
+        msgs = []
+        try:
+            if frames is None:
+                frames = self.get_data(client=client, quota=quota)
+            if client in self.handshakes:
+                frames = self.handshake(client, frames)
+            elif frames:
+                self.clients.get(client).last_seen = time.monotonic()
+            for frame in frames:
+                session = self.clients.get(client)
+                if session is None:
+                    break
+                if session.rate is not None and not self.admit(session):
+                    continue
+                data = self.handle(client, self.decode(frame, session.codec))
+                if data is not None:
+                    msgs.append((client, data))
+            decoder = self.decoders.get(client)
+            if decoder is not None:
+                # Кадры обработаны: буферы под ними возвращаются в пул
+                decoder.release()
+            return msgs
+        except (DecodeError, FrameError, ValidationError) as e:
+            logger.error("%s", e)
+            self.metrics.error(type(e).__name__).inc()
+            try:
+                self.send_data(client=client, data=error_400())
+            except OSError:
+                pass
         except OSError:
-            return
-        except (JSONDecodeError, ValidationError) as e:
-            self.send_data(client=client, data=error_400())
-            client.close()
-            logger.error(str(e))
+            pass
+        msg = self.disconnect(client)
+        if msg is not None:
+            msgs.append((client, msg))
+        return msgs
 
-    def run(self):
-        self.init_socket()
-        while True:
-            self.accept()
-            read = []
-            write = []
-            error = []
+    def reader(self, clients: list[socket]) -> list[tuple[socket, dict]]:
+        # Бюджет чтения на проход цикла делится поровну между готовыми сокетами. Кто выбрал долю целиком,
+        # идет на следующий круг с остатком бюджета; непрочитанное останется в сокете до следующего прохода
+        msgs = []
+        self.budget = self.read_budget
+        while clients and self.budget >= self.buffer_size:
+            share = max(self.buffer_size, self.budget // len(clients))
+            self.unread = []
+            for client in clients:
+                msgs.extend(self.receive(client, quota=share))
+            clients = [client for client in self.unread
+                       if (client in self.clients or client in self.handshakes) and client not in self.muted]
+        self.unread = []
+        return msgs
+
+    def accept(self):
+        # Слушающий сокет неблокирующий: забираем всю очередь accept, presence ждем уже в общем цикле
+        for _ in range(self.listen):
+            try:
+                client, addr = self.socket.accept()
+            except OSError:
+                return
+            logger.info("Запрос на соединение от: %s", addr)
+            self.metrics.connections.inc()
+            client.setblocking(False)
+            self.selector.register(client, EVENT_READ)
+            self.handshakes.add(client, time.monotonic())
+
+    def expire(self):
+        for handshake in self.handshakes.expired(time.monotonic()):
+            logger.info("Presence timeout, state: %s", handshake.state)
             try:
-                read, write, error = select.select(self.clients.keys(), self.clients.keys(), [], self.select_wait)
+                self.send_data(client=handshake.client, data=error_400(code=408))
             except OSError:
                 pass
-            msgs = self.reader(read)
+            self.disconnect(handshake.client)
+
+    def heartbeat(self) -> list[tuple[socket, dict]]:
+        msgs = []
+        if self.heartbeats is None:
+            return msgs
+        probe, dead = self.heartbeats.expired(time.monotonic())
+        if probe:
+            # Message кеширует кадр: probe кодируется один раз на кодек
+            data = request_probe()
+            for session in probe:
+                self.push(session, self.encode(data, session.codec))
+        for session in dead:
+            logger.info("Heartbeat timeout: %s", session.name)
+            msg = self.evict(session)
+            if msg is not None:
+                msgs.append((session.client, msg))
+        return msgs
+
+    def evict(self, session: Session) -> Optional[dict]:
+        return self.disconnect(session.client)
+
+    def wait_time(self) -> float:
+        deadlines = [self.handshakes.next_deadline()]
+        if self.heartbeats is not None:
+            deadlines.append(self.heartbeats.next_time())
+        if self.muted:
+            deadlines.append(min(self.muted.values()))
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        if not deadlines:
+            return self.select_wait
+        return max(0, min(self.select_wait, min(deadlines) - time.monotonic()))
+
+    def init_metrics(self):
+        if self.metrics_port:
+            self.metrics_server = serve_metrics(self.metrics, self.metrics_address, self.metrics_port)
+            logger.info("Metrics at http://%s:%s/metrics", self.metrics_address, self.metrics_port)
+        if self.metrics_dump and hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.metrics.dump(self.metrics_dump))
+
+    def stop(self):
+        self.stopped = True
+        if self.waker is not None:
+            try:
+                self.waker[1].send(b"\0")
+            except (BlockingIOError, OSError):
+                pass
+
+    def close(self):
+        for client in list(self.handshakes) + list(self.clients):
+            self.disconnect(client)
+        self.selector.close()
+        self.socket.close()
+        for sock in self.waker:
+            sock.close()
+        self.close_metrics()
+        self.close_storage()
+
+    def close_storage(self):
+        # Буфер журнала пишет на диск фоновый поток-демон, а хранилище - commit() в проходе цикла:
+        # без явного закрытия последние записи теряются при штатной остановке. После закрытия
+        # поздние сообщения (уведомления об уходе) в журнал и хранилище уже не пишутся
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def close_metrics(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+
+    def run(self):
+        self.init_socket()
+        self.init_metrics()
+        try:
+            self.loop()
+        finally:
+            self.close()
+
+    def loop(self):
+        while not self.stopped:
+            read = []
+            ready = []
+            msgs = []
+            selected = self.selector.select(self.wait_time())
+            start = time.perf_counter()
+            for key, events in selected:
+                if key.fileobj is self.socket:
+                    self.accept()
+                elif key.fileobj is self.waker[0]:
+                    msgs.extend(self.authenticated())
+                elif key.fileobj is self.cluster:
+                    self.cluster_reader()
+                else:
+                    if events & EVENT_READ:
+                        read.append(key.fileobj)
+                    session = self.clients.get(key.fileobj)
+                    if events & EVENT_WRITE and session is not None:
+                        ready.append(session)
+            msgs.extend(self.reader(read))
+            msgs.extend(self.heartbeat())
             if msgs:
-                self.writer(write, msgs)
+                self.writer(msgs)
+            self.flush_pending(ready)
+            self.unmute()
+            if self.store is not None:
+                self.store.commit()
+            self.expire()
+            self.metrics.loop.observe(time.perf_counter() - start)
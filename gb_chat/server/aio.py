@@ -0,0 +1,189 @@
+import asyncio
+import time
+from socket import AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, socket
+
+from jsonschema.exceptions import ValidationError
+
+from . import ChatServer
+from .logger import logger
+from .sessions import Session
+from gb_chat.tools.codec import DecodeError
+from gb_chat.tools.framing import FrameDecoder, FrameError
+from gb_chat.tools.responses import error_400
+
+
+class AsyncChatServer(ChatServer):
+    # Движок на asyncio: каждое соединение обслуживается своей корутиной, поэтому accept и чтение
+    # сообщений идут параллельно, без опроса по select_wait. Логика action/login/writer общая с ChatServer.
+    def __init__(self, config):
+        super().__init__(config)
+        self.flushers = {}
+
+    def init_socket(self):
+        _socket = socket(AF_INET, SOCK_STREAM)
+        _socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        for option in self.socket_options:
+            _socket.setsockopt(*option)
+        _socket.bind((self.address, self.port))
+        _socket.setblocking(False)
+        self.socket = _socket
+        self.socket.listen(self.listen)
+        logger.info("Async server started at %s:%s, listen=%s", self.address, self.port, self.listen)
+
+    def send_direct(self, client: asyncio.StreamWriter, frame: bytes):
+        client.write(frame)
+
+    def wakeup(self, session: Session):
+        event = self.flushers.get(session)
+        if event is not None:
+            event.set()
+
+    def flush(self, session: Session):
+        chunks = session.outbox.take()
+        self.metrics.bytes_out.inc(sum(len(chunk) for chunk in chunks))
+        session.client.writelines(chunks)
+
+    async def flusher(self, session: Session, event: asyncio.Event):
+        # Переносит очередь сессии в транспорт и ждет drain, пока буфер транспорта выше high-water,
+        # новые кадры в это время копятся в ограниченной очереди сессии
+        try:
+            while True:
+                while session.outbox:
+                    # Стадия send в asyncio - запись в транспорт вместе с ожиданием drain
+                    start = time.perf_counter()
+                    self.flush(session)
+                    await session.client.drain()
+                    self.metrics.stages["send"].observe(time.perf_counter() - start)
+                await event.wait()
+                event.clear()
+        except OSError:
+            pass
+
+    async def get_frames(self, reader: asyncio.StreamReader, decoder: FrameDecoder,
+                         session: Session = None) -> list[bytes]:
+        if session is not None and session.traffic is not None:
+            # Превышен лимит байтов: следующее чтение откладывается, буфер StreamReader заполнится,
+            # и транспорт сам перестанет читать сокет. Очередность чтения между соединениями обеспечивает
+            # цикл событий, каждое соединение читает не больше buffer_size за раз
+            delay = session.traffic.delay(time.monotonic())
+            if delay:
+                self.metrics.error("Throttled").inc()
+                await asyncio.sleep(delay)
+        data = await reader.read(self.buffer_size)
+        # Как и в select, стадия recv не включает ожидание данных в read
+        start = time.perf_counter()
+        if not data:
+            raise ConnectionResetError("Connection closed by peer")
+        self.metrics.bytes_in.inc(len(data))
+        if session is not None and session.traffic is not None:
+            session.traffic.take(len(data), time.monotonic())
+        frames = decoder.feed(data)
+        self.metrics.stages["recv"].observe(time.perf_counter() - start)
+        return frames
+
+    async def presence(self, reader: asyncio.StreamReader, decoder: FrameDecoder) -> list[bytes]:
+        data = []
+        while not data:
+            data = await self.get_frames(reader, decoder)
+        return data
+
+    async def serve(self, reader: asyncio.StreamReader, client: asyncio.StreamWriter):
+        logger.info("Запрос на соединение от: %s", client.get_extra_info("peername"))
+        self.metrics.connections.inc()
+        decoder = self.decoders.setdefault(client, FrameDecoder(self.limit, self.buffers))
+        flusher = None
+        try:
+            data = await asyncio.wait_for(self.presence(reader, decoder), self.handshakes.timeout)
+            request = self.decode(data[0])
+            code = self.credentials(request)
+            if code is None:
+                # Хеш пароля считается в пуле потоков, остальные соединения в это время обслуживаются
+                verified = await asyncio.wrap_future(
+                    self.auth.submit(request["user"]["account_name"], request["user"]["password"])
+                )
+                code = 200 if verified else 402
+            if code != 200:
+                self.send_data(client=client, data=error_400(code=code))
+                return
+            if not self.login(client, request):
+                return
+            session = self.clients.get(client)
+            self.flushers[session] = asyncio.Event()
+            flusher = asyncio.create_task(self.flusher(session, self.flushers[session]))
+            data = data[1:]
+            while True:
+                start = time.perf_counter()
+                msgs = []
+                for frame in data:
+                    if client not in self.clients:
+                        break
+                    if session.rate is not None and not self.admit(session):
+                        continue
+                    msg = self.handle(client, self.decode(frame, session.codec))
+                    if msg is not None:
+                        msgs.append((client, msg))
+                if msgs:
+                    self.writer(msgs)
+                self.metrics.loop.observe(time.perf_counter() - start)
+                data = await self.get_frames(reader, decoder, session)
+                session.last_seen = time.monotonic()
+        except (DecodeError, FrameError, ValidationError) as e:
+            logger.error("%s", e)
+            self.metrics.error(type(e).__name__).inc()
+            self.send_data(client=client, data=error_400())
+        except asyncio.TimeoutError:
+            logger.info("Presence timeout")
+            self.send_data(client=client, data=error_400(code=408))
+        except OSError:
+            pass
+        finally:
+            self.disconnect(client)
+            if flusher is not None:
+                flusher.cancel()
+
+    def offline(self, msg: dict):
+        # Один commit на все сообщения, накопленные до следующей итерации цикла событий
+        if not self.store.pending:
+            asyncio.get_running_loop().call_soon(self.store.commit)
+        super().offline(msg)
+
+    def evict(self, session: Session):
+        # abort() без ожидания отправки буфера: мертвый пир его не заберет. Чтение в serve() получит EOF,
+        # и сессия закроется там же, где и при обычном разрыве
+        session.client.transport.abort()
+
+    async def heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeats.wheel.tick)
+            msgs = self.heartbeat()
+            if msgs:
+                self.writer(msgs)
+
+    def disconnect(self, client: asyncio.StreamWriter):
+        session = self.clients.get(client)
+        if session is not None:
+            self.flushers.pop(session, None)
+        msg = super().disconnect(client)
+        if msg is not None:
+            self.writer([(client, msg)])
+
+    async def serve_forever(self):
+        self.init_socket()
+        self.init_metrics()
+        if self.cluster is not None:
+            asyncio.get_running_loop().add_reader(self.cluster.fileno(), self.cluster_reader)
+        heartbeat = None
+        if self.heartbeats is not None:
+            heartbeat = asyncio.create_task(self.heartbeat_loop())
+        server = await asyncio.start_server(self.serve, sock=self.socket, limit=self.limit)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            self.close_metrics()
+            self.close_storage()
+
+    def run(self):
+        asyncio.run(self.serve_forever())
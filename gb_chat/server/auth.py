@@ -0,0 +1,107 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from gb_chat.tools.file import open_json
+
+# Параметры scrypt: ~16 МБ памяти и десятки миллисекунд на проверку
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 200000
+SALT_SIZE = 16
+
+
+def hash_password(password: str, salt: Optional[bytes] = None) -> str:
+    salt = salt if salt is not None else os.urandom(SALT_SIZE)
+    if hasattr(hashlib, "scrypt"):
+        digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        return "scrypt${}${}${}${}${}".format(SCRYPT_N, SCRYPT_R, SCRYPT_P, salt.hex(), digest.hex())
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS)
+    return "pbkdf2_sha256${}${}${}".format(PBKDF2_ITERATIONS, salt.hex(), digest.hex())
+
+
+def verify_password(password: str, stored: str) -> bool:
+    method, *params = stored.split("$")
+    if method == "scrypt":
+        n, r, p, salt, digest = params
+        result = hashlib.scrypt(password.encode("utf-8"), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p))
+    elif method == "pbkdf2_sha256":
+        iterations, salt, digest = params
+        result = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+    else:
+        raise ValueError("Unknown password hash: {}".format(method))
+    return hmac.compare_digest(result, bytes.fromhex(digest))
+
+
+class UserStore(object):
+    # Пользователи в json-файле: имя -> соленый хеш пароля
+    def __init__(self, path: str):
+        self.path = path
+        self.users = open_json(path) or {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.users
+
+    def get(self, name: str) -> Optional[str]:
+        return self.users.get(name)
+
+    def add(self, name: str, password: str):
+        self.users[name] = hash_password(password)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.users, f, indent=2)
+
+
+class TokenCache(object):
+    # Выданные после проверки пароля токены: token -> (имя, срок). Переподключение с токеном не считает хеш.
+    # Размер ограничен, при переполнении вытесняются самые давно использованные токены.
+    def __init__(self, ttl: float, limit: int):
+        self.ttl = ttl
+        self.limit = limit
+        self._tokens = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def issue(self, name: str) -> str:
+        token = secrets.token_urlsafe(24)
+        self._tokens[token] = (name, time.time() + self.ttl)
+        while len(self._tokens) > self.limit:
+            self._tokens.popitem(last=False)
+        return token
+
+    def check(self, name: str, token: Optional[str]) -> bool:
+        entry = self._tokens.get(token)
+        if entry is not None and entry[1] < time.time():
+            del self._tokens[token]
+            entry = None
+        if entry is None or entry[0] != name:
+            return False
+        self._tokens.move_to_end(token)
+        return True
+
+
+class Authenticator(object):
+    # Проверка пароля идет в пуле потоков: hashlib отпускает GIL, цикл сервера продолжает доставлять сообщения
+    def __init__(self, path: str, workers: int, ttl: float, limit: int):
+        self.users = UserStore(path)
+        self.tokens = TokenCache(ttl, limit)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth")
+        # Хеш для несуществующих имен, чтобы время ответа не выдавало, есть ли такой пользователь
+        self._dummy = hash_password(secrets.token_hex(8))
+
+    def verify(self, name: str, password: str) -> bool:
+        stored = self.users.get(name)
+        if stored is None:
+            verify_password(password, self._dummy)
+            return False
+        return verify_password(password, stored)
+
+    def submit(self, name: str, password: str) -> Future:
+        return self.executor.submit(self.verify, name, password)
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import shutil
+import signal
+import sys
+import tempfile
+from multiprocessing import Event, Process
+from typing import Optional
+from socket import AF_UNIX, MSG_DONTWAIT, SOCK_STREAM, SOL_SOCKET, socket
+
+try:
+    from socket import SO_REUSEPORT
+except ImportError:
+    SO_REUSEPORT = None
+
+from .history import CURSOR_MAX, HistoryLog, fit_page
+from .logger import logger
+from gb_chat.tools.codec import available_codecs, get_codec
+from gb_chat.tools.framing import FrameDecoder, encode_frame
+
+BROKER_FILE = "broker.sock"
+BROKER_WAIT = 5
+# Запас сверх input_limit на конверт op/worker вокруг пересылаемого сообщения или страницы истории
+BROKER_ENVELOPE = 4096
+
+
+def broker_codec():
+    return get_codec(available_codecs(["orjson", "json"])[0])
+
+
+class Broker(object):
+    # Локальный хаб кластера. Знает, какой воркер обслуживает какое имя (проверка 409 для всего кластера),
+    # и пересылает воркерам личные сообщения для чужих клиентов, рассылки #server и сообщения комнат.
+    # Журнал истории тоже один на кластер и ведется здесь: ответ не зависит от того, на какой воркер попал клиент.
+    def __init__(self, path: str, limit: int, history: Optional[HistoryLog] = None):
+        self.path = path
+        self.limit = limit
+        self.codec = broker_codec()
+        self.history = history
+        self.names = {}
+        self.feeds = {}
+
+    def send(self, writer: asyncio.StreamWriter, data: dict):
+        writer.write(encode_frame(self.codec.dumps(data)))
+
+    def dispatch(self, writer: asyncio.StreamWriter, request: dict):
+        op = request["op"]
+        if op == "hello":
+            self.feeds[request["worker"]] = writer
+            self.send(writer, {"op": "hello"})
+        elif op == "claim":
+            owner = self.names.setdefault(request["name"], request["worker"])
+            self.send(writer, {"op": "claimed", "ok": owner == request["worker"]})
+        elif op == "release":
+            if self.names.get(request["name"]) == request["worker"]:
+                del self.names[request["name"]]
+        elif op == "route":
+            feed = self.feeds.get(self.names.get(request["msg"]["to"]))
+            if feed is not None:
+                self.send(feed, {"op": "deliver", "msg": request["msg"]})
+            elif request["worker"] in self.feeds:
+                # Адресат не в сети: воркер-отправитель сохранит сообщение в хранилище
+                self.send(self.feeds[request["worker"]], {"op": "undelivered", "msg": request["msg"]})
+        elif op == "broadcast":
+            for worker, feed in self.feeds.items():
+                if worker != request["worker"]:
+                    self.send(feed, {"op": "deliver", "msg": request["msg"]})
+        elif op == "append":
+            self.history.append(request["msg"])
+        elif op == "history":
+            messages, start, first = self.history.page(tuple(request["key"]), request["limit"], request["since"],
+                                                       request["until"], request["before"])
+            # Страница не длиннее limit в кодеке брокера; под кодек клиента ее подрежет воркер
+            envelope = {"op": "page", "start": CURSOR_MAX, "first": CURSOR_MAX}
+            messages, start = fit_page(self.codec, envelope, messages, start, self.limit)
+            self.send(writer, {"op": "page", "start": start, "first": first, "messages": messages})
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        decoder = FrameDecoder(self.limit + BROKER_ENVELOPE)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for frame in decoder.feed(data):
+                    self.dispatch(writer, self.codec.loads(frame))
+        finally:
+            for worker, feed in list(self.feeds.items()):
+                if feed is writer:
+                    # Воркер упал: освобождаем все его имена
+                    del self.feeds[worker]
+                    self.names = {name: owner for name, owner in self.names.items() if owner != worker}
+                    logger.error("Worker %s disconnected from broker", worker)
+            writer.close()
+
+    async def serve_forever(self, ready=None):
+        server = await asyncio.start_unix_server(self.serve, path=self.path)
+        # Файл сокета появляется уже при bind, до listen: воркерам можно подключаться только после этого события
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def run(self, ready=None):
+        try:
+            asyncio.run(self.serve_forever(ready))
+        finally:
+            if self.history is not None:
+                # Записи из буфера журнала не теряются при остановке кластера
+                self.history.close()
+
+
+class BrokerLink(object):
+    # Связь воркера с брокером: rpc - синхронные запросы claim/release, feed - пересылка сообщений в обе стороны.
+    # Объект отдает fileno() канала feed, поэтому его можно передавать прямо в select/selectors.
+    def __init__(self, path: str, worker: int, limit: int):
+        self.worker = worker
+        self.codec = broker_codec()
+        self.rpc = socket(AF_UNIX, SOCK_STREAM)
+        self.rpc.connect(path)
+        self.feed = socket(AF_UNIX, SOCK_STREAM)
+        self.feed.connect(path)
+        self._rpc_decoder = FrameDecoder(limit + BROKER_ENVELOPE)
+        self._decoder = FrameDecoder(limit + BROKER_ENVELOPE)
+        # Ждем подтверждения, чтобы к началу работы брокер уже рассылал этому воркеру сообщения
+        self.send(self.feed, {"op": "hello", "worker": worker})
+        self.request(self.feed, self._decoder)
+
+    def fileno(self) -> int:
+        return self.feed.fileno()
+
+    def close(self):
+        # Воркер использует связь и как журнал истории: ChatServer.close_storage() закрывает ее при остановке
+        self.rpc.close()
+        self.feed.close()
+
+    def send(self, channel: socket, data: dict):
+        channel.sendall(encode_frame(self.codec.dumps(data)))
+
+    def request(self, channel: socket, decoder: FrameDecoder) -> dict:
+        frames = []
+        while not frames:
+            data = channel.recv(4096)
+            if not data:
+                raise ConnectionResetError("Broker is gone")
+            frames = decoder.feed(data)
+        return self.codec.loads(frames[0])
+
+    def claim(self, name: str) -> bool:
+        self.send(self.rpc, {"op": "claim", "name": name, "worker": self.worker})
+        return self.request(self.rpc, self._rpc_decoder)["ok"]
+
+    def release(self, name: str):
+        self.send(self.rpc, {"op": "release", "name": name, "worker": self.worker})
+
+    def route(self, msg: dict):
+        self.send(self.feed, {"op": "route", "worker": self.worker, "msg": msg})
+
+    def broadcast(self, msg: dict):
+        self.send(self.feed, {"op": "broadcast", "worker": self.worker, "msg": msg})
+
+    def append(self, msg: dict):
+        # Через rpc, как и запросы истории: свое сообщение воркер видит в следующем же ответе history
+        self.send(self.rpc, {"op": "append", "msg": msg})
+
+    def page(self, key: tuple, limit: int, since: Optional[float] = None, until: Optional[float] = None,
+             before: Optional[int] = None) -> tuple[list[dict], int, int]:
+        self.send(self.rpc, {"op": "history", "key": list(key), "limit": limit, "since": since, "until": until,
+                             "before": before})
+        reply = self.request(self.rpc, self._rpc_decoder)
+        return reply["messages"], reply["start"], reply["first"]
+
+    def receive(self) -> list[dict]:
+        msgs = []
+        while True:
+            try:
+                data = self.feed.recv(65536, MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            if not data:
+                raise ConnectionResetError("Broker is gone")
+            msgs.extend(self.codec.loads(frame) for frame in self._decoder.feed(data))
+        return msgs
+
+
+def start_broker(path: str, limit: int, ready=None, history: Optional[dict] = None):
+    # terminate() из run_cluster - SIGTERM: выходим через finally, чтобы закрыть журнал
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if history is not None:
+        history = HistoryLog(history["history"], history["history_segment_size"], history["history_flush_interval"],
+                             history["encoding"])
+    Broker(path, limit, history).run(ready)
+
+
+def start_worker(server_class, config: dict, path: str, worker: int):
+    # Журнал истории ведет брокер, воркеры свой не открывают
+    history = config["history"]
+    config = {**config, "history": None}
+    if config["metrics_port"]:
+        config = {**config, "metrics_port": config["metrics_port"] + worker}
+    if config["metrics_dump"]:
+        config = {**config, "metrics_dump": "{}.{}".format(config["metrics_dump"], worker)}
+    server = server_class(config)
+    server.socket_options.append((SOL_SOCKET, SO_REUSEPORT, 1))
+    server.cluster = BrokerLink(path, worker, config["input_limit"])
+    if history:
+        server.history = server.cluster
+    logger.info("Worker %s rdy, pid=%s", worker, os.getpid())
+    server.run()
+
+
+def run_cluster(server_class, config: dict, workers: int):
+    if SO_REUSEPORT is None:
+        raise OSError("SO_REUSEPORT is not supported on this platform")
+    directory = tempfile.mkdtemp(prefix="gb_chat-")
+    path = os.path.join(directory, BROKER_FILE)
+    ready = Event()
+    history = None
+    if config["history"]:
+        history = {key: config[key] for key in ("history", "history_segment_size", "history_flush_interval",
+                                                "encoding")}
+    processes = [Process(target=start_broker, args=(path, config["input_limit"], ready, history), daemon=True)]
+    processes[0].start()
+    if not ready.wait(BROKER_WAIT):
+        processes[0].terminate()
+        shutil.rmtree(directory, ignore_errors=True)
+        raise OSError("Broker did not start in {} s".format(BROKER_WAIT))
+    for worker in range(workers):
+        processes.append(Process(target=start_worker, args=(server_class, config, path, worker), daemon=True))
+        processes[-1].start()
+    logger.info("Cluster started: %s workers, broker at %s", workers, path)
+    try:
+        for process in processes[1:]:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,62 @@
+from typing import Iterator, Optional
+
+# Состояния подключения: принято -> ждем presence (пришла часть кадра) -> [проверяем пароль] ->
+# активно (сессия в SessionRegistry)
+CONNECTED = "connected"
+AWAITING_PRESENCE = "awaiting presence"
+AUTHENTICATING = "authenticating"
+ACTIVE = "active"
+
+
+class Handshake(object):
+    __slots__ = ("client", "deadline", "state", "data", "frames")
+
+    def __init__(self, client, deadline: float):
+        self.client = client
+        self.deadline = deadline
+        self.state = CONNECTED
+        # Запрос на вход и кадры, пришедшие во время проверки пароля
+        self.data = None
+        self.frames = []
+
+
+class HandshakeRegistry(object):
+    # Подключения, которые еще не прислали presence. Таймаут у всех одинаковый,
+    # поэтому порядок добавления совпадает с порядком дедлайнов и просроченные берутся с начала.
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._pending = {}
+
+    def __contains__(self, client) -> bool:
+        return client in self._pending
+
+    def __iter__(self) -> Iterator:
+        return iter(self._pending)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, client, now: float) -> Handshake:
+        handshake = self._pending[client] = Handshake(client, now + self.timeout)
+        return handshake
+
+    def get(self, client) -> Optional[Handshake]:
+        return self._pending.get(client)
+
+    def remove(self, client) -> Optional[Handshake]:
+        return self._pending.pop(client, None)
+
+    def next_deadline(self) -> Optional[float]:
+        for handshake in self._pending.values():
+            return handshake.deadline
+        return None
+
+    def expired(self, now: float) -> list[Handshake]:
+        result = []
+        for handshake in self._pending.values():
+            if handshake.deadline > now:
+                break
+            result.append(handshake)
+        for handshake in result:
+            del self._pending[handshake.client]
+        return result
@@ -0,0 +1,97 @@
+import math
+from typing import Optional
+
+
+class TimerWheel(object):
+    # Хешированное колесо таймеров: слот - номер тика дедлайна по модулю числа слотов.
+    # schedule() и cancel() - O(1), advance() разбирает только слоты прошедших тиков, а не все таймеры.
+    def __init__(self, tick: float, size: int, now: float):
+        self.tick = tick
+        self.slots = [{} for _ in range(size)]
+        self.current = int(now / tick)
+        self._slots = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, key) -> bool:
+        return key in self._slots
+
+    def schedule(self, key, deadline: float):
+        self.cancel(key)
+        due = max(self.current + 1, math.ceil(deadline / self.tick))
+        slot = self.slots[due % len(self.slots)]
+        slot[key] = due
+        self._slots[key] = slot
+
+    def cancel(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def next_time(self) -> Optional[float]:
+        if not self._slots:
+            return None
+        return (self.current + 1) * self.tick
+
+    def advance(self, now: float) -> list:
+        target = int(now / self.tick)
+        if target - self.current >= len(self.slots):
+            # Цикл простоял дольше оборота колеса: каждый слот достаточно разобрать один раз
+            ticks = range(len(self.slots))
+        else:
+            ticks = range(self.current + 1, target + 1)
+        expired = []
+        for tick in ticks:
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            due = [key for key, when in slot.items() if when <= target]
+            for key in due:
+                del slot[key]
+                del self._slots[key]
+            expired.extend(due)
+        self.current = max(self.current, target)
+        return expired
+
+
+class Heartbeat(object):
+    # Проверка живости сессий: молчащей interval секунд сессии уходит probe, не ответившая за timeout отключается.
+    # Принятый кадр только обновляет session.last_seen, таймер сессии переносится лениво, когда срабатывает,
+    # поэтому на тик приходится работа лишь с сессиями, чей срок подошел.
+    def __init__(self, interval: float, timeout: float, tick: float, now: float):
+        self.interval = interval
+        self.timeout = timeout
+        self.wheel = TimerWheel(tick, math.ceil(max(interval, timeout) / tick) + 1, now)
+
+    def __len__(self) -> int:
+        return len(self.wheel)
+
+    def add(self, session, now: float):
+        session.last_seen = now
+        session.probed = None
+        self.wheel.schedule(session, now + self.interval)
+
+    def remove(self, session):
+        self.wheel.cancel(session)
+
+    def next_time(self) -> Optional[float]:
+        return self.wheel.next_time()
+
+    def expired(self, now: float) -> tuple[list, list]:
+        # Сессии, которым пора отправить probe, и сессии, не ответившие на него
+        probe = []
+        dead = []
+        for session in self.wheel.advance(now):
+            if session.probed is not None and session.last_seen < session.probed:
+                dead.append(session)
+                continue
+            session.probed = None
+            deadline = session.last_seen + self.interval
+            if deadline > now:
+                self.wheel.schedule(session, deadline)
+            else:
+                session.probed = now
+                self.wheel.schedule(session, now + self.timeout)
+                probe.append(session)
+        return probe, dead
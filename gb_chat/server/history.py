@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+from gb_chat.tools.codec import JsonCodec
+from gb_chat.tools.framing import HEADER
+from gb_chat.tools.requests import ROOM_PREFIX
+
+SEGMENT_SUFFIX = ".log"
+# Заглушка курсора при оценке размера конверта: настоящий номер записи не длиннее
+CURSOR_MAX = (1 << 63) - 1
+
+
+def conversation(msg: dict, user: Optional[str] = None) -> tuple:
+    # Ключ переписки: комната или пара участников личного диалога (порядок не важен)
+    to = msg["to"]
+    if to.startswith(ROOM_PREFIX):
+        return (to,)
+    return tuple(sorted((to, user if user is not None else msg["from"])))
+
+
+def fit_page(codec, envelope: dict, messages: list, start: int, limit: int) -> tuple[list, int]:
+    # Самые новые сообщения страницы, которые вместе с конвертом кодируются в тело не длиннее limit,
+    # и номер первого из них. Не поместилось ни одного - номер указывает за самое новое,
+    # иначе клиент запрашивал бы его со следующей страницей бесконечно
+    budget = limit - len(codec.dumps({**envelope, "messages": []}))
+    count = 0
+    for msg in reversed(messages):
+        # Разделитель списка в json или заголовок элемента в msgpack - не больше 8 байт
+        budget -= len(codec.dumps(msg)) + 8
+        if budget < 0:
+            break
+        count += 1
+    fitted = messages[len(messages) - count:]
+    while fitted and len(codec.dumps({**envelope, "messages": fitted})) > limit:
+        fitted = fitted[1:]
+    return fitted, start + len(messages) - max(len(fitted), 1 if messages else 0)
+
+
+class Segment(object):
+    def __init__(self, path: str, base: int, size: int = 0):
+        self.path = path
+        # Номер первой записи сегмента, из него же собирается имя файла
+        self.base = base
+        self.size = size
+
+
+class ConversationIndex(object):
+    # Времена записей (для bisect) и их положение в логе: (сегмент, смещение, длина)
+    def __init__(self):
+        self.times = []
+        self.locations = []
+
+    def add(self, stamp: float, location: tuple[int, int, int]):
+        self.times.append(stamp)
+        self.locations.append(location)
+
+    def select(self, limit: int, since: Optional[float] = None, until: Optional[float] = None,
+               before: Optional[int] = None) -> tuple[int, int, list]:
+        # Номер первой выбранной записи в переписке, номер первой подходящей по since и сами положения.
+        # before - номер записи, с которой начинается уже полученная страница: лог только дописывается,
+        # поэтому номера записей переписки не меняются
+        lo = 0 if since is None else bisect_left(self.times, since)
+        hi = len(self.times) if until is None else bisect_right(self.times, until)
+        if before is not None:
+            hi = min(hi, before)
+        start = max(lo, hi - limit)
+        return start, lo, self.locations[start:hi]
+
+
+class HistoryLog(object):
+    # История сообщений: журнал из сегментов только на дозапись, запись - кадр HEADER + json {"time", "msg"}.
+    # append() лишь кладет запись в буфер и индекс в памяти, на диск буфер сбрасывает фоновый поток
+    # раз в flush_interval. Индекс по переписке восстанавливается при старте проходом по сегментам.
+    def __init__(self, directory: str, segment_size: int, flush_interval: float, encoding: str = "utf-8"):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.codec = JsonCodec(encoding)
+        self.segments = []
+        self.index = {}
+        self.offset = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+        self._thread = threading.Thread(target=self.flusher, daemon=True)
+        self._thread.start()
+
+    def segment_path(self, base: int) -> str:
+        return os.path.join(self.directory, "{:020d}{}".format(base, SEGMENT_SUFFIX))
+
+    def load(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            segment = Segment(os.path.join(self.directory, name), int(name[:-len(SEGMENT_SUFFIX)]))
+            with open(segment.path, "rb") as f:
+                data = f.read()
+            number = len(self.segments)
+            while segment.size + HEADER.size <= len(data):
+                (length,) = HEADER.unpack_from(data, segment.size)
+                end = segment.size + HEADER.size + length
+                if end > len(data):
+                    break
+                record = self.codec.loads(memoryview(data)[segment.size + HEADER.size:end])
+                self.index_record(record, (number, segment.size, end - segment.size))
+                segment.size = end
+                self.offset += 1
+            if segment.size < len(data):
+                # Хвост незаконченной записи после аварийного останова
+                with open(segment.path, "r+b") as f:
+                    f.truncate(segment.size)
+            self.segments.append(segment)
+
+    def index_record(self, record: dict, location: tuple[int, int, int]):
+        key = conversation(record["msg"])
+        index = self.index.get(key)
+        if index is None:
+            index = self.index[key] = ConversationIndex()
+        index.add(record["time"], location)
+
+    def append(self, msg: dict):
+        record = {"time": time.time(), "msg": msg}
+        payload = self.codec.dumps(record)
+        data = HEADER.pack(len(payload)) + payload
+        with self._lock:
+            if not self.segments or self.segments[-1].size >= self.segment_size:
+                self.segments.append(Segment(self.segment_path(self.offset), self.offset))
+            segment = self.segments[-1]
+            self.index_record(record, (len(self.segments) - 1, segment.size, len(data)))
+            self._pending.append((segment, data))
+            segment.size += len(data)
+            self.offset += 1
+
+    def flush(self):
+        # append() ждет только обмена буфера, сама запись идет под отдельной блокировкой,
+        # которую берет и query(), чтобы не читать записи раньше, чем они дошли до файла
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            f = None
+            for segment, data in pending:
+                if f is None or f.name != segment.path:
+                    if f is not None:
+                        f.close()
+                    f = open(segment.path, "ab")
+                f.write(data)
+            if f is not None:
+                f.close()
+
+    def flusher(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def query(self, key: tuple, limit: int, since: Optional[float] = None,
+              until: Optional[float] = None) -> list[dict]:
+        return self.page(key, limit, since, until)[0]
+
+    def page(self, key: tuple, limit: int, since: Optional[float] = None, until: Optional[float] = None,
+             before: Optional[int] = None) -> tuple[list[dict], int, int]:
+        # Сообщения страницы, номер первого из них в переписке и номер самого раннего подходящего:
+        # если первый больше, есть более ранние страницы
+        index = self.index.get(key)
+        if index is None:
+            return [], 0, 0
+        start, first, locations = index.select(limit, since, until, before)
+        self.flush()
+        result = []
+        f = None
+        for number, position, length in locations:
+            path = self.segments[number].path
+            if f is None or f.name != path:
+                if f is not None:
+                    f.close()
+                f = open(path, "rb")
+            f.seek(position + HEADER.size)
+            result.append(self.codec.loads(f.read(length - HEADER.size))["msg"])
+        if f is not None:
+            f.close()
+        return result, start, first
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,28 @@
+class TokenBucket(object):
+    # Ведро токенов: пополняется со скоростью rate в секунду, вмещает не больше burst.
+    # consume() - взять, только если хватает; take() - взять всегда, уходя в долг, delay() - сколько ждать до нуля.
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def update(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return self.tokens
+
+    def consume(self, amount: float, now: float) -> bool:
+        if self.update(now) < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def take(self, amount: float, now: float):
+        self.update(now)
+        self.tokens -= amount
+
+    def delay(self, now: float) -> float:
+        return max(0.0, -self.update(now) / self.rate)
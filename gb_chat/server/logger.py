@@ -1,9 +1,11 @@
 import sys
 from functools import wraps
 from logging.handlers import TimedRotatingFileHandler
-from logging import Formatter, getLogger
+from logging import Formatter
 import os
 
+from gb_chat.tools.log import DeferredFlushMixin, queue_logger
+
 DEBUG = os.getenv("DEBUG", "")
 DEBUG = True if "1" == DEBUG or "true" == DEBUG.lower() else False
 
@@ -34,25 +36,23 @@ def get_filename(filename):
     return f
 
 
-handler = TimedRotatingFileHandler(FILE, when=PERIOD, interval=INTERVAL, encoding=ENCODING)
+class DeferredFileHandler(DeferredFlushMixin, TimedRotatingFileHandler):
+    pass
+
+
+handler = DeferredFileHandler(FILE, when=PERIOD, interval=INTERVAL, encoding=ENCODING)
 handler.suffix = FILE_SUFFIX
 handler.namer = get_filename
 handler.setFormatter(FORMATTER)
 
-logger = getLogger(NAME)
-logger.addHandler(handler)
-if DEBUG:
-    logger.setLevel("DEBUG")
-else:
-    logger.setLevel(LEVEL)
+# Запись в файл идет в фоновом потоке, цикл сервера только кладет записи в очередь
+logger = queue_logger(NAME, "DEBUG" if DEBUG else LEVEL, handler)
 
 
 def log(func):
     @wraps(func)
     def wrap(*args, **kwargs):
         # не использовал inspect потому что при, обертки метода и функции результаты будут отличаться
-        logger.debug("Функция {name} вызвана из функции {caller}".format(
-            name=wrap.__name__, caller=sys._getframe(1).f_code.co_name)
-        )
+        logger.debug("Функция %s вызвана из функции %s", wrap.__name__, sys._getframe(1).f_code.co_name)
         return func(*args, **kwargs)
     return wrap
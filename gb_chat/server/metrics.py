@@ -0,0 +1,152 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+STAGES = ("recv", "decode", "validate", "route", "send")
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, value) for key, value in labels) + "}"
+
+
+class Counter(object):
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, value: float = 1):
+        self.value += value
+
+    def render(self, name: str, labels: tuple) -> list[str]:
+        return ["{}{} {}".format(name, format_labels(labels), self.value)]
+
+
+class Gauge(object):
+    # Значение считается только при выгрузке, в горячем пути ничего не делается
+    def __init__(self, callback: Callable[[], float]):
+        self.callback = callback
+
+    def render(self, name: str, labels: tuple) -> list[str]:
+        return ["{}{} {}".format(name, format_labels(labels), self.callback())]
+
+
+class Histogram(object):
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: tuple) -> list[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", bound),)), total))
+        lines.append("{}_sum{} {}".format(name, format_labels(labels), self.sum))
+        lines.append("{}_count{} {}".format(name, format_labels(labels), self.count))
+        return lines
+
+
+class Registry(object):
+    # Метрики в текстовом формате Prometheus. Экземпляр метрики с набором меток создается один раз,
+    # вызывающий код хранит его у себя и в горячем пути только увеличивает число.
+    def __init__(self):
+        self.families = {}
+
+    def metric(self, kind: str, factory: Callable, name: str, help_text: str, labels: dict):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = (kind, help_text, {})
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        return self.metric("counter", Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float], **labels) -> Gauge:
+        return self.metric("gauge", lambda: Gauge(callback), name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, **labels) -> Histogram:
+        return self.metric("histogram", Histogram, name, help_text, labels)
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, metrics) in list(self.families.items()):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, metric in list(metrics.items()):
+                lines.extend(metric.render(name, labels))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+
+
+class ServerMetrics(Registry):
+    def __init__(self):
+        super().__init__()
+        self.connections = self.counter("chat_connections_total", "Accepted TCP connections")
+        self.bytes_in = self.counter("chat_bytes_in_total", "Bytes received from clients")
+        self.bytes_out = self.counter("chat_bytes_out_total", "Bytes sent to clients")
+        self.stages = {stage: self.histogram("chat_stage_seconds", "Time spent per processing stage", stage=stage)
+                       for stage in STAGES}
+        self.loop = self.histogram("chat_loop_seconds", "Busy time of one event loop pass")
+        self._messages = {}
+        self._frames = {}
+        self._errors = {}
+
+    def message(self, action: str) -> Counter:
+        counter = self._messages.get(action)
+        if counter is None:
+            counter = self._messages[action] = self.counter(
+                "chat_messages_in_total", "Validated messages by action", action=action
+            )
+        return counter
+
+    def frames_out(self, action: str) -> Counter:
+        counter = self._frames.get(action)
+        if counter is None:
+            counter = self._frames[action] = self.counter(
+                "chat_frames_out_total", "Frames queued to client outboxes by action", action=action
+            )
+        return counter
+
+    def error(self, kind: str) -> Counter:
+        counter = self._errors.get(kind)
+        if counter is None:
+            counter = self._errors[kind] = self.counter(
+                "chat_errors_total", "Rejected frames by reason", kind=kind
+            )
+        return counter
+
+
+def serve_metrics(registry: Registry, address: str, port: int) -> ThreadingHTTPServer:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
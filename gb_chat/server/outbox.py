@@ -0,0 +1,81 @@
+from collections import deque
+from itertools import islice
+from typing import Callable
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, DISCONNECT)
+# Сколько буферов отдаем в один sendmsg (writev)
+IOV_MAX = 64
+
+
+class Outbox(object):
+    # Ограниченная очередь исходящих кадров одного клиента. Кадры копятся здесь и отправляются,
+    # когда сокет готов к записи, поэтому медленный клиент не блокирует цикл сервера.
+    # При переполнении (limit байт) либо выбрасываются самые старые кадры, либо клиент отключается.
+    # Пустая очередь не держит deque (это ~600 байт на клиента): он создается на первый кадр
+    # и отпускается, когда все отправлено.
+    __slots__ = ("limit", "policy", "dropped", "_chunks", "_size", "_offset")
+
+    def __init__(self, limit: int, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError("Unknown overflow policy: {}".format(policy))
+        self.limit = limit
+        self.policy = policy
+        self.dropped = 0
+        self._chunks = None
+        self._size = 0
+        # Сколько байт первого кадра уже отправлено
+        self._offset = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def put(self, data: bytes) -> bool:
+        size = len(data)
+        if self._chunks is None:
+            self._chunks = deque()
+        elif self._chunks and self._size + size > self.limit:
+            if self.policy == DISCONNECT:
+                return False
+            # Частично отправленный кадр выбросить нельзя, иначе поток кадров будет испорчен
+            keep = 1 if self._offset else 0
+            while len(self._chunks) > keep and self._size + size > self.limit:
+                chunk = self._chunks[keep]
+                del self._chunks[keep]
+                self._size -= len(chunk)
+                self.dropped += 1
+        self._chunks.append(data)
+        self._size += size
+        return True
+
+    def flush(self, send: Callable[[list], int]) -> int:
+        total = 0
+        while self._chunks:
+            buffers = [memoryview(self._chunks[0])[self._offset:]]
+            buffers.extend(islice(self._chunks, 1, IOV_MAX))
+            try:
+                sent = send(buffers)
+            except (BlockingIOError, InterruptedError):
+                break
+            total += sent
+            self._size -= sent
+            partial = sent < sum(len(buffer) for buffer in buffers)
+            sent += self._offset
+            while self._chunks and sent >= len(self._chunks[0]):
+                sent -= len(self._chunks.popleft())
+            self._offset = sent
+            if partial:
+                break
+        if not self._chunks:
+            self._chunks = None
+        return total
+
+    def take(self) -> list:
+        chunks = list(self._chunks or ())
+        if chunks and self._offset:
+            chunks[0] = memoryview(chunks[0])[self._offset:]
+        self._chunks = None
+        self._size = 0
+        self._offset = 0
+        return chunks
@@ -0,0 +1,43 @@
+from .sessions import NO_ROOMS, Session
+
+
+class RoomRegistry(object):
+    # Индекс участников комнат: комната -> множество сессий. Сообщение в комнату рассылается
+    # только ее участникам, т.е. за O(участников), а не по всем подключенным клиентам.
+    def __init__(self):
+        self._members = {}
+
+    def __contains__(self, room: str) -> bool:
+        return room in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def join(self, room: str, session: Session) -> bool:
+        members = self._members.setdefault(room, set())
+        if session in members:
+            return False
+        members.add(session)
+        if session.rooms is NO_ROOMS:
+            session.rooms = set()
+        session.rooms.add(room)
+        return True
+
+    def leave(self, room: str, session: Session) -> bool:
+        members = self._members.get(room)
+        if members is None or session not in members:
+            return False
+        members.remove(session)
+        session.rooms.discard(room)
+        if not session.rooms:
+            session.rooms = NO_ROOMS
+        if not members:
+            del self._members[room]
+        return True
+
+    def leave_all(self, session: Session):
+        for room in list(session.rooms):
+            self.leave(room, session)
+
+    def members(self, room: str) -> list[Session]:
+        return list(self._members.get(room, ()))
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+# Общее пустое множество комнат: большинство сессий ни в одной комнате не состоит,
+# свое множество (216 байт даже пустое) заводит RoomRegistry.join
+NO_ROOMS = frozenset()
+
+
+class Session(object):
+    # Сессий столько же, сколько пользователей в сети: __slots__ вместо __dict__ у каждой
+    __slots__ = ("client", "name", "rooms", "outbox", "codec", "resume", "sequence", "last_seen", "probed",
+                 "rate", "traffic", "throttled")
+
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self.rooms = NO_ROOMS
+        self.outbox = None
+        self.codec = None
+        # Идентификатор экземпляра клиента и номер последнего принятого от него сообщения
+        self.resume = None
+        self.sequence = 0
+        # Время последнего принятого кадра и отправки probe, на который еще нет ответа (time.monotonic)
+        self.last_seen = 0.0
+        self.probed = None
+        # Ограничения скорости (limits.TokenBucket): сообщения и байты в секунду; throttled - 429 уже отправлен
+        self.rate = None
+        self.traffic = None
+        self.throttled = False
+
+
+class SessionRegistry(object):
+    # Двусторонний индекс сессий: сокет -> сессия и имя -> сессия.
+    # Вход, выход и маршрутизация личного сообщения выполняются за O(1) независимо от числа клиентов.
+    def __init__(self):
+        self._by_client = {}
+        self._by_name = {}
+
+    def __contains__(self, client) -> bool:
+        return client in self._by_client
+
+    def __iter__(self) -> Iterator:
+        return iter(self._by_client)
+
+    def __len__(self) -> int:
+        return len(self._by_client)
+
+    def add(self, client, name: str) -> Optional[Session]:
+        if name in self._by_name or client in self._by_client:
+            return None
+        session = Session(client, name)
+        self._by_client[client] = session
+        self._by_name[name] = session
+        return session
+
+    def remove(self, client) -> Optional[Session]:
+        session = self._by_client.pop(client, None)
+        if session is not None:
+            del self._by_name[session.name]
+        return session
+
+    def get(self, client) -> Optional[Session]:
+        return self._by_client.get(client)
+
+    def find(self, name: str) -> Optional[Session]:
+        return self._by_name.get(name)
+
+    def sessions(self) -> list[Session]:
+        return list(self._by_client.values())
+
+
+class SequenceRegistry(object):
+    # Номера последних принятых сообщений вышедших клиентов: имя -> (идентификатор клиента, seq).
+    # После переподключения клиент по нему повторяет только то, что сервер не получил, а повторы отбрасываются.
+    # Размер ограничен, при переполнении вытесняются давно не входившие имена.
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._sequences = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sequences)
+
+    def save(self, name: str, resume: str, sequence: int):
+        self._sequences[name] = (resume, sequence)
+        self._sequences.move_to_end(name)
+        while len(self._sequences) > self.limit:
+            self._sequences.popitem(last=False)
+
+    def restore(self, name: str, resume: str) -> Optional[int]:
+        # None - этого экземпляра клиента сервер не видел (первый вход, другой процесс клиента, рестарт сервера)
+        entry = self._sequences.pop(name, None)
+        if entry is None or entry[0] != resume:
+            return None
+        return entry[1]
@@ -0,0 +1,63 @@
+import sqlite3
+import time
+
+from gb_chat.tools.codec import JsonCodec
+
+# Как часто удаляем сообщения старше retention, секунды
+PURGE_INTERVAL = 60
+
+
+class OfflineStore(object):
+    # Личные сообщения для пользователей не в сети (SQLite, индекс по получателю).
+    # put() только копит строки в памяти, commit() пишет их одной транзакцией раз за проход цикла,
+    # а WAL с synchronous=NORMAL убирает fsync с каждого коммита.
+    def __init__(self, path: str, retention: float, encoding: str = "utf-8"):
+        self.path = path
+        self.retention = retention
+        self.codec = JsonCodec(encoding)
+        self.pending = []
+        self._purged = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS offline ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, recipient TEXT NOT NULL, "
+                "time REAL NOT NULL, payload BLOB NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS offline_recipient ON offline (recipient, id)")
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def put(self, msg: dict):
+        self.pending.append((msg["to"], time.time(), self.codec.dumps(msg)))
+
+    def commit(self):
+        now = time.time()
+        if not self.pending and now - self._purged < PURGE_INTERVAL:
+            return
+        with self.connection:
+            if self.pending:
+                self.connection.executemany(
+                    "INSERT INTO offline (recipient, time, payload) VALUES (?, ?, ?)", self.pending
+                )
+                self.pending = []
+            if now - self._purged >= PURGE_INTERVAL:
+                self.connection.execute("DELETE FROM offline WHERE time < ?", (now - self.retention,))
+                self._purged = now
+
+    def take(self, recipient: str) -> list[dict]:
+        self.commit()
+        with self.connection:
+            rows = self.connection.execute(
+                "SELECT payload FROM offline WHERE recipient = ? AND time >= ? ORDER BY id",
+                (recipient, time.time() - self.retention)
+            ).fetchall()
+            self.connection.execute("DELETE FROM offline WHERE recipient = ?", (recipient,))
+        return [self.codec.loads(row[0]) for row in rows]
+
+    def close(self):
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,132 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DEFAULT = "json"
+# Экранированная половина суррогатной пары: json.loads пропускает ее одну в str, и такую строку
+# не закодировать в UTF-8 ни orjson, ни msgpack, ни сам json с encoding utf-8
+SURROGATE = re.compile(r"\\u[dD][89a-fA-F]")
+
+
+class DecodeError(ValueError):
+    pass
+
+
+class EncodeError(ValueError):
+    pass
+
+
+def check_strings(value, encoding: str):
+    # Каждая строка (и ключи) должна кодироваться без ошибок: иначе кадр упадет у получателя другого кодека
+    if isinstance(value, str):
+        value.encode(encoding)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            check_strings(key, encoding)
+            check_strings(item, encoding)
+    elif isinstance(value, list):
+        for item in value:
+            check_strings(item, encoding)
+
+
+class JsonCodec(object):
+    name = "json"
+
+    def __init__(self, encoding: str = "utf-8"):
+        self.encoding = encoding
+
+    def dumps(self, data: dict) -> bytes:
+        try:
+            return json.dumps(data).encode(self.encoding)
+        except (TypeError, ValueError) as e:
+            raise EncodeError(str(e))
+
+    def loads(self, data: bytes) -> dict:
+        # str() декодирует прямо из memoryview кадра, без промежуточной копии в bytes
+        try:
+            text = str(data, self.encoding)
+            result = json.loads(text)
+            # Полный обход строк только для кадров с экранированными суррогатами, обычные кадры его не платят
+            if SURROGATE.search(text) is not None:
+                check_strings(result, "utf-8")
+            return result
+        except ValueError as e:
+            raise DecodeError(str(e))
+
+
+class OrjsonCodec(object):
+    # Тот же JSON на проводе, но сериализация в C; всегда utf-8
+    name = "orjson"
+
+    def __init__(self, encoding: str = "utf-8"):
+        self.encoding = "utf-8"
+
+    def dumps(self, data: dict) -> bytes:
+        try:
+            return orjson.dumps(data)
+        except orjson.JSONEncodeError as e:
+            raise EncodeError(str(e))
+
+    def loads(self, data: bytes) -> dict:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as e:
+            raise DecodeError(str(e))
+
+
+class MsgpackCodec(object):
+    name = "msgpack"
+
+    def __init__(self, encoding: str = "utf-8"):
+        self.encoding = "utf-8"
+
+    def dumps(self, data: dict) -> bytes:
+        try:
+            return msgpack.packb(data, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise EncodeError(str(e))
+
+    def loads(self, data: bytes) -> dict:
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise DecodeError(str(e))
+
+
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+INSTALLED = {
+    JsonCodec.name: True,
+    OrjsonCodec.name: orjson is not None,
+    MsgpackCodec.name: msgpack is not None,
+}
+
+
+def available_codecs(preferred: list[str]) -> list[str]:
+    return [name for name in preferred if INSTALLED.get(name)]
+
+
+def get_codec(name: str = DEFAULT, encoding: str = "utf-8"):
+    if not INSTALLED.get(name):
+        raise ValueError("Codec {} is not available".format(name))
+    return CODECS[name](encoding)
+
+
+def negotiate(offered: list[str], preferred: list[str]) -> str:
+    # Первый кодек из списка сервера, который предложил клиент. Старые клиенты ничего не предлагают - json
+    for name in available_codecs(preferred):
+        if name in offered:
+            return name
+    return DEFAULT
@@ -0,0 +1,115 @@
+import zlib
+from typing import Optional
+
+from gb_chat.tools.codec import DecodeError
+
+# Версия словаря входит в имя: обе стороны строят словарь из своих SAMPLES, и при их изменении имя меняется
+# (zlib-d2, ...). Стороны с разными словарями не найдут общего имени и договорятся о работе без сжатия,
+# вместо того чтобы получить неразбираемые кадры
+ZLIB = "zlib-d1"
+COMPRESSIONS = (ZLIB,)
+# Первый байт тела кадра при включенном сжатии: дальше либо тело кодека как есть, либо raw deflate
+RAW = 0
+DEFLATE = 1
+# Окно 4 КБ и memLevel 5: ~32 КБ на компрессор вместо ~256 КБ по умолчанию и втрое быстрее его создание.
+# Сообщения чата короткие, большее окно им не нужно
+WBITS = -12
+MEM_LEVEL = 5
+LEVEL = 6
+
+# Образцы кадров для предустановленного словаря: самые частые формы кадров записанного трафика, переменные части
+# заменены заглушками. Каждый кадр сжимается отдельно (иначе один кадр не разослать всем получателям), и без
+# словаря в коротком сообщении повторяться нечему. Чаще всего встречающееся - в конце: ближние совпадения
+# кодируются короче. Пересобираются так: трафик пишется через прокси
+#     python -m benchmarks.capture record traffic.jsonl -l 7779 -p 7778
+# (клиенты подключаются к 7779; записаны bench_load и сессии AsyncChatClient с комнатами и историей),
+# затем python -m benchmarks.capture samples traffic.jsonl печатает кортеж ниже. Новые SAMPLES - новый словарь,
+# поэтому вместе с ними меняется версия в имени ZLIB.
+SAMPLES = (
+    {"action": "quit", "time": 1700000000.0},
+    {"action": "history", "time": 1700000000.0, "to": "#room"},
+    {"action": "history", "time": 1700000000.0, "to": "#room", "limit": 10},
+    {"response": 200, "alert": "Left #room"},
+    {"action": "leave", "time": 1700000000.0, "room": "#room"},
+    {"response": 200, "messages": []},
+    {"response": 200, "alert": "Joined #room"},
+    {"action": "join", "time": 1700000000.0, "room": "#room"},
+    {"action": "presence", "time": 1700000000.0, "type": "status", "user": {"account_name": "user",
+     "status": "Yep, I am here!"}},
+    {"action": "probe", "time": 1700000000.0},
+    {"response": 200, "alert": "Welcome", "codec": "orjson", "compression": "zlib-d1"},
+    {"action": "presence", "time": 1700000000.0, "type": "status", "user": {"account_name": "user",
+     "status": "Yep, I am here!"}, "codecs": ["orjson", "json"], "compressions": ["zlib-d1"],
+     "session": "0123456789abcdef"},
+    {"action": "msg", "time": 1700000000.0, "to": "#server", "from": "server", "encoding": "utf-8",
+     "message": "Пользователь: 'user' покинул чат!"},
+    {"action": "msg", "time": 1700000000.0, "to": "user", "from": "user", "encoding": "utf-8",
+     "message": "the message", "seq": 1},
+    {"action": "msg", "time": 1700000000.0, "to": "#server", "from": "user", "encoding": "utf-8",
+     "message": "the message", "seq": 1},
+    {"action": "msg", "time": 1700000000.0, "to": "#room", "from": "user", "encoding": "utf-8",
+     "message": "the message", "seq": 1},
+)
+
+
+def build_dictionary(codec, samples=SAMPLES) -> bytes:
+    # Словарь в формате кодека (json и msgpack пишут одни и те же ключи по-разному),
+    # поэтому обе стороны получают его одинаковым без передачи по сети. Длиннее окна он бесполезен
+    return b"".join(codec.dumps(sample) for sample in samples)[-(1 << -WBITS):]
+
+
+def negotiate_compression(offered: list[str], supported: list[str]) -> Optional[str]:
+    # Первый способ из списка сервера, который предложил клиент; старые клиенты ничего не предлагают - без сжатия
+    for name in supported:
+        if name in COMPRESSIONS and name in offered:
+            return name
+    return None
+
+
+class CompressedCodec(object):
+    # Обертка над кодеком: тело длиннее min_size сжимается deflate с предустановленным словарем,
+    # короткое уходит как есть - на нем создание компрессора стоит больше, чем экономия трафика.
+    # Ключ кеша кадров (Message.frame) - сам объект, поэтому сервер держит по одному экземпляру на пару
+    # кодек + сжатие, и сжатый кадр по-прежнему кодируется один раз для всех получателей.
+    def __init__(self, codec, min_size: int, limit: int, dictionary: Optional[bytes] = None):
+        self.codec = codec
+        self.name = codec.name
+        self.encoding = codec.encoding
+        self.min_size = min_size
+        self.limit = limit
+        self.dictionary = build_dictionary(codec) if dictionary is None else dictionary
+
+    def dumps(self, data: dict) -> bytes:
+        payload = self.codec.dumps(data)
+        if len(payload) >= self.min_size:
+            compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, WBITS, MEM_LEVEL, zdict=self.dictionary)
+            compressed = compressor.compress(payload) + compressor.flush()
+            if len(compressed) < len(payload):
+                return bytes((DEFLATE,)) + compressed
+        return bytes((RAW,)) + payload
+
+    def loads(self, data: bytes) -> dict:
+        view = memoryview(data)
+        if not view:
+            raise DecodeError("Empty frame")
+        if view[0] == RAW:
+            return self.codec.loads(view[1:])
+        if view[0] != DEFLATE:
+            raise DecodeError("Unknown compression flag {}".format(view[0]))
+        decompressor = zlib.decompressobj(WBITS, zdict=self.dictionary)
+        try:
+            # Распакованное тело ограничено тем же limit, что и кадр: сжатая "бомба" не раздует память
+            payload = decompressor.decompress(view[1:], self.limit)
+        except zlib.error as e:
+            raise DecodeError(str(e))
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise DecodeError("Compressed frame is truncated or exceeds limit {}".format(self.limit))
+        return self.codec.loads(payload)
+
+
+def get_compressed(codec, name: Optional[str], min_size: int, limit: int):
+    if name is None:
+        return codec
+    if name not in COMPRESSIONS:
+        raise ValueError("Compression {} is not available".format(name))
+    return CompressedCodec(codec, min_size, limit)
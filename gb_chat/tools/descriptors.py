@@ -12,7 +12,7 @@ class Port:
             raise ValueError("Port {} is not integer".format(value))
         if _value not in range(*PORT_RANGE):
             raise ValueError("Port {} not in range 1024-49151".format(value))
-        setattr(instance, self.name, _value)
+        instance.__dict__[self.name] = _value
 
     def __get__(self, instance, owner):
-        return getattr(instance, self.name)
+        return instance.__dict__[self.name]
@@ -1,12 +1,12 @@
-import json
-from json import JSONDecodeError
 from typing import Optional
 
+from .codec import DecodeError, JsonCodec
+
 
 def open_json(path: str, encoding: str = "utf-8") -> Optional[dict]:
     try:
-        with open(path, "r", encoding=encoding) as f:
-            result = json.load(f)
-    except (FileNotFoundError, JSONDecodeError):
+        with open(path, "rb") as f:
+            result = JsonCodec(encoding).loads(f.read())
+    except (FileNotFoundError, DecodeError):
         return None
     return result
@@ -0,0 +1,164 @@
+from struct import Struct
+from typing import Optional
+
+# Кадр: 4 байта длины (network byte order) + тело сообщения
+HEADER = Struct("!I")
+# Буфер декодера без пула, выросший сверх этого размера, отпускается, как только опустеет
+SHRINK_SIZE = 16384
+
+
+class FrameError(ValueError):
+    pass
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return HEADER.pack(len(payload)) + payload
+
+
+class BufferPool(object):
+    # Свободные буферы приема по классам размеров: size, 2 * size, 4 * size... Соединение берет буфер только
+    # на время чтения, поэтому у простаивающих соединений своего буфера нет вовсе. Буфер, выросший под большой
+    # кадр, тоже возвращается в пул своего класса; в классе k хранится не больше limit >> k буферов,
+    # т.е. каждый класс занимает не больше limit * size байт.
+    def __init__(self, size: int, limit: int):
+        self.size = size
+        self.limit = limit
+        self._free = {}
+
+    def __len__(self) -> int:
+        return sum(len(free) for free in self._free.values())
+
+    def capacity(self, size: int) -> int:
+        # Размер класса, в который помещается size байт
+        capacity = self.size
+        while capacity < size:
+            capacity *= 2
+        return capacity
+
+    def get(self, size: int = 0) -> bytearray:
+        capacity = self.capacity(size)
+        free = self._free.get(capacity)
+        if free:
+            return free.pop()
+        return bytearray(capacity)
+
+    def put(self, buffer: bytearray):
+        capacity = len(buffer)
+        if capacity != self.capacity(capacity):
+            return
+        free = self._free.setdefault(capacity, [])
+        if len(free) < max(1, self.limit * self.size // capacity):
+            free.append(buffer)
+
+
+class FrameDecoder(object):
+    # Инкрементальный разбор потока: копит байты между вызовами recv и отдает только целые кадры,
+    # поэтому склеенные или разрезанные на несколько recv сообщения разбираются корректно.
+    # Данные лежат в буфере [start:end]; read() читает из сокета прямо в его свободный хвост (recv_into),
+    # frames() отдает кадры как memoryview без копирования. Пока выданные кадры не обработаны, буфер под ними
+    # не переписывается: недоразобранный хвост переносится в новый буфер, а старые возвращаются в пул
+    # в release(). Как только известна длина недоразобранного кадра, место под него резервируется целиком,
+    # так что буфер растет не больше чем до длины самого большого допустимого кадра плюс одно чтение.
+    __slots__ = ("limit", "pool", "_buffer", "_start", "_end", "_expected", "_exported", "_retired")
+
+    def __init__(self, limit: int, pool: Optional[BufferPool] = None):
+        self.limit = limit
+        self.pool = pool
+        self._buffer = None
+        self._start = 0
+        self._end = 0
+        # Полная длина кадра, начало которого уже в буфере
+        self._expected = 0
+        # На текущий буфер ссылаются выданные кадры; буферы, замененные, пока на них ссылались
+        self._exported = False
+        self._retired = []
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def allocate(self, size: int) -> bytearray:
+        if self.pool is not None:
+            return self.pool.get(size)
+        return bytearray(size)
+
+    def reserve(self, size: int) -> memoryview:
+        # Свободное место не меньше size в конце буфера, а если начало кадра уже пришло - под весь кадр
+        pending = self._end - self._start
+        needed = max(pending + size, self._expected)
+        buffer = self._buffer
+        if buffer is None:
+            buffer = self._buffer = self.allocate(needed)
+            self._start = self._end = 0
+        elif self._start + needed > len(buffer):
+            if self._exported or needed > len(buffer):
+                # Старый буфер не переписываем: на него могут ссылаться memoryview выданных кадров
+                buffer = self.allocate(needed)
+                buffer[:pending] = self._buffer[self._start:self._end]
+                self.retire()
+                self._buffer = buffer
+            else:
+                buffer[:pending] = buffer[self._start:self._end]
+            self._start = 0
+            self._end = pending
+        return memoryview(buffer)[self._end:self._end + size]
+
+    def read(self, sock, size: int) -> int:
+        # 0 - соединение закрыто; BlockingIOError неблокирующего сокета пробрасывается вызывающему
+        with self.reserve(size) as view:
+            received = sock.recv_into(view)
+        self._end += received
+        return received
+
+    def retire(self):
+        if self._exported:
+            self._retired.append(self._buffer)
+        elif self.pool is not None:
+            self.pool.put(self._buffer)
+        self._buffer = None
+        self._exported = False
+
+    def release(self):
+        # Выданные кадры обработаны: буферы под ними можно переписывать, пустой буфер уходит в пул
+        self._exported = False
+        if self.pool is not None:
+            for buffer in self._retired:
+                self.pool.put(buffer)
+        self._retired.clear()
+        if self._buffer is not None and not self:
+            self._start = self._end = 0
+            if self.pool is not None:
+                self.retire()
+            elif len(self._buffer) > SHRINK_SIZE:
+                self._buffer = None
+
+    def frames(self) -> list[memoryview]:
+        # memoryview действительны до release(): кто хранит кадры дольше, копирует их в bytes
+        frames = []
+        if not self:
+            return frames
+        buffer = self._buffer
+        view = memoryview(buffer)
+        offset = self._start
+        self._expected = 0
+        while self._end - offset >= HEADER.size:
+            size = HEADER.unpack_from(buffer, offset)[0]
+            if size > self.limit:
+                raise FrameError("Frame size {size} exceeds limit {limit}".format(size=size, limit=self.limit))
+            end = offset + HEADER.size + size
+            if end > self._end:
+                self._expected = HEADER.size + size
+                break
+            frames.append(view[offset + HEADER.size:end])
+            offset = end
+        self._start = offset
+        if frames:
+            self._exported = True
+        return frames
+
+    def feed(self, data: bytes) -> list[bytes]:
+        with self.reserve(len(data)) as view:
+            view[:] = data
+        self._end += len(data)
+        frames = [bytes(frame) for frame in self.frames()]
+        self.release()
+        return frames
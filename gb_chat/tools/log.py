@@ -0,0 +1,86 @@
+import atexit
+import os
+import threading
+from logging import Handler, Logger, LogRecord, getLogger
+from logging.handlers import QueueHandler
+from queue import Empty, SimpleQueue
+
+# Сколько записей слушатель забирает из очереди за раз, файл сбрасывается один раз на пачку
+BATCH_SIZE = 512
+
+
+class DeferredFlushMixin(object):
+    # Пока слушатель пишет пачку, flush() после каждой записи пропускается
+    deferred = False
+
+    def flush(self):
+        if not self.deferred:
+            super().flush()
+
+
+class LazyQueueHandler(QueueHandler):
+    # Стандартный QueueHandler форматирует сообщение еще в вызывающем потоке.
+    # Очередь здесь внутри процесса, поэтому запись кладется как есть, а % подставляется в потоке записи.
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+
+class BatchQueueListener(object):
+    # Фоновый писатель: ждет первую запись, добирает из очереди все накопленное (до BATCH_SIZE)
+    # и отдает пачку обработчикам. Поток логирующего кода только кладет запись в очередь.
+    def __init__(self, queue: SimpleQueue, *handlers: Handler):
+        self.queue = queue
+        self.handlers = handlers
+        self._thread = None
+        # После fork (воркеры кластера) поток в дочернем процессе не существует, запускаем новый
+        os.register_at_fork(after_in_child=self.start)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self.handle(batch)
+            if stop:
+                return
+
+    def handle(self, batch: list[LogRecord]):
+        for handler in self.handlers:
+            handler.acquire()
+            try:
+                handler.deferred = True
+                for record in batch:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            finally:
+                handler.deferred = False
+                handler.release()
+            handler.flush()
+
+
+def queue_logger(name: str, level: str, *handlers: Handler) -> Logger:
+    queue = SimpleQueue()
+    listener = BatchQueueListener(queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+    logger = getLogger(name)
+    logger.addHandler(LazyQueueHandler(queue))
+    logger.setLevel(level)
+    return logger
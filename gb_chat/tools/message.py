@@ -0,0 +1,53 @@
+from gb_chat.tools.framing import encode_frame
+
+
+class Message(dict):
+    # Запрос или ответ протокола. Остается dict: схемы, кодеки и вызывающий код работают с ним как раньше,
+    # но готовый кадр кешируется по кодеку и кодируется не больше одного раза на кодек, сколько бы получателей
+    # его ни ждало. Любое изменение верхнего уровня сбрасывает кеш; вложенные словари после создания не меняются.
+    __slots__ = ("_frames",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._frames = None
+
+    def frame(self, codec) -> bytes:
+        frames = self._frames
+        if frames is None:
+            frames = self._frames = {}
+        frame = frames.get(codec)
+        if frame is None:
+            frame = frames[codec] = encode_frame(codec.dumps(self))
+        return frame
+
+    def __setitem__(self, key, value):
+        self._frames = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._frames = None
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self._frames = None
+        return super().__ior__(other)
+
+    def clear(self):
+        self._frames = None
+        super().clear()
+
+    def pop(self, *args):
+        self._frames = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._frames = None
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._frames = None
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._frames = None
+        super().update(*args, **kwargs)
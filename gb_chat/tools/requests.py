@@ -1,20 +1,29 @@
 import time
 
+from gb_chat.tools.message import Message
 
-def request_msg(*, sender: str, to: str, encoding: str, message: str) -> dict:
-    data = {
+ROOM_PREFIX = "#"
+SERVER_ROOM = "#server"
+
+
+def room_name(room: str) -> str:
+    return room if room.startswith(ROOM_PREFIX) else ROOM_PREFIX + room
+
+
+def request_msg(*, sender: str, to: str, encoding: str, message: str) -> Message:
+    data = Message({
         "action": "msg",
         "time": time.time(),
         "to": to,
         "from": sender,
         "encoding": encoding,
         "message": message
-    }
+    })
     return data
 
 
-def request_presence(account_name: str, status: str = "Yep, I am here!") -> dict:
-    data = {
+def request_presence(account_name: str, status: str = "Yep, I am here!") -> Message:
+    data = Message({
         "action": "presence",
         "time": time.time(),
         "type": "status",
@@ -22,51 +31,73 @@ def request_presence(account_name: str, status: str = "Yep, I am here!") -> dict
             "account_name": account_name,
             "status": status
         }
-    }
+    })
     return data
 
 
-def request_authenticate(account_name: str, password: str) -> dict:
-    data = {
+def request_authenticate(account_name: str, password: str = None, token: str = None) -> Message:
+    data = Message({
         "action": "authenticate",
         "time": time.time(),
         "user": {
-            "account_name": account_name,
-            "password": password
+            "account_name": account_name
         }
-    }
+    })
+    if password is not None:
+        data["user"]["password"] = password
+    if token is not None:
+        data["user"]["token"] = token
     return data
 
 
-def request_quit() -> dict:
-    data = {
+def request_quit() -> Message:
+    data = Message({
         "action": "quit",
         "time": time.time(),
-    }
+    })
     return data
 
 
-def request_probe() -> dict:
-    data = {
+def request_probe() -> Message:
+    data = Message({
         "action": "probe",
         "time": time.time(),
-    }
+    })
     return data
 
 
-def request_join(room: str) -> dict:
-    data = {
+def request_join(room: str) -> Message:
+    data = Message({
         "action": "join",
         "time": time.time(),
-        "room": room
-    }
+        "room": room_name(room)
+    })
+    return data
+
+
+def request_history(to: str, limit: int = None, since: float = None, until: float = None,
+                    before: int = None) -> Message:
+    data = Message({
+        "action": "history",
+        "time": time.time(),
+        "to": to
+    })
+    if limit is not None:
+        data["limit"] = limit
+    if since is not None:
+        data["since"] = since
+    if until is not None:
+        data["until"] = until
+    if before is not None:
+        # Курсор из поля before прошлого ответа: следующая, более ранняя страница
+        data["before"] = before
     return data
 
 
-def request_leave(room: str) -> dict:
-    data = {
+def request_leave(room: str) -> Message:
+    data = Message({
         "action": "leave",
         "time": time.time(),
-        "room": room
-    }
+        "room": room_name(room)
+    })
     return data
@@ -1,39 +1,44 @@
 import time
 
+from gb_chat.tools.message import Message
+
 RESPONSE = {
     400: "incorrect JSON object",
     401: "Permissions denied, you need to log in",
     402: 'This could be "wrong password" or "no account with that name"',
+    403: "You are not a member of this room",
+    408: "Presence was not received in time",
     409: "Someone is already connected with the given user name",
+    429: "Too many messages, slow down",
 }
 
 
-def error_400(error: str = None, code: int = 400) -> dict:
+def error_400(error: str = None, code: int = 400) -> Message:
     if code in RESPONSE and error is None:
         error = RESPONSE[code]
-    result = {
+    result = Message({
         "response": code,
         "time": time.time(),
-    }
+    })
     if error is not None:
         result["error"] = error
     return result
 
 
-def error_500(error: str = None, code: int = 500) -> dict:
-    result = {
+def error_500(error: str = None, code: int = 500) -> Message:
+    result = Message({
         "response": code,
         "time": time.time(),
-    }
+    })
     if error is not None:
         result["error"] = error
     return result
 
 
-def ok(msg: str = None, code: int = 200) -> dict:
-    result = {
+def ok(msg: str = None, code: int = 200) -> Message:
+    result = Message({
         "response": code
-    }
+    })
     if msg is not None:
         result["alert"] = msg
     return result
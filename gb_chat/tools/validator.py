@@ -1,4 +1,5 @@
 import os
+from typing import Callable, Optional
 
 from jsonschema import FormatChecker
 from jsonschema.exceptions import ValidationError
@@ -6,11 +7,102 @@ from jsonschema.validators import Draft6Validator
 
 from ..tools.file import open_json
 
+TYPES = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "integer": lambda value: (isinstance(value, int) and not isinstance(value, bool))
+                             or (isinstance(value, float) and value.is_integer()),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+# Ключи схемы, которые не влияют на результат проверки
+ANNOTATIONS = ("$schema", "$id", "id", "title", "description")
+OBJECT_KEYWORDS = ("type", "properties", "required", "additionalProperties")
+LEAF_KEYWORDS = ("type", "enum", "minimum", "maximum", "minLength", "maxLength", "items")
+
+
+def compile_schema(schema: dict) -> Optional[Callable[[object], bool]]:
+    # Собирает из схемы быструю проверку на замыканиях. Поддерживается только подмножество Draft 6,
+    # которое используется в schemas/; для прочих схем возвращается None и работает jsonschema.
+    keywords = [key for key in schema if key not in ANNOTATIONS]
+    if schema.get("type") == "object":
+        if any(key not in OBJECT_KEYWORDS for key in keywords):
+            return None
+        return _compile_object(schema)
+    if any(key not in LEAF_KEYWORDS for key in keywords):
+        return None
+    return _compile_leaf(schema)
+
+
+def _compile_object(schema: dict) -> Optional[Callable[[object], bool]]:
+    properties = {}
+    for name, subschema in schema.get("properties", {}).items():
+        properties[name] = compile_schema(subschema)
+        if properties[name] is None:
+            return None
+    required = tuple(schema.get("required", ()))
+    additional = schema.get("additionalProperties", True)
+    if not isinstance(additional, bool):
+        return None
+
+    def check(data) -> bool:
+        if not isinstance(data, dict):
+            return False
+        for name in required:
+            if name not in data:
+                return False
+        for name, value in data.items():
+            checker = properties.get(name)
+            if checker is None:
+                if not additional:
+                    return False
+            elif not checker(value):
+                return False
+        return True
+
+    return check
+
+
+def _compile_leaf(schema: dict) -> Optional[Callable[[object], bool]]:
+    checks = []
+    if "type" in schema:
+        if schema["type"] not in TYPES:
+            return None
+        checks.append(TYPES[schema["type"]])
+    if "enum" in schema:
+        enum = schema["enum"]
+        # bool равен 1/0 при сравнении, а для jsonschema это разные значения
+        checks.append(lambda value: not isinstance(value, bool) and value in enum)
+    # Сравнение как в jsonschema: нарушение - только строго за границей, нечисла оставлены проверке type
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+        checks.append(lambda value: not TYPES["number"](value) or not value < minimum)
+    if "maximum" in schema:
+        maximum = schema["maximum"]
+        checks.append(lambda value: not TYPES["number"](value) or not value > maximum)
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+        checks.append(lambda value: not isinstance(value, str) or len(value) >= min_length)
+    if "maxLength" in schema:
+        max_length = schema["maxLength"]
+        checks.append(lambda value: not isinstance(value, str) or len(value) <= max_length)
+    if "items" in schema:
+        items = compile_schema(schema["items"])
+        if items is None:
+            return None
+        checks.append(lambda value: not isinstance(value, list) or all(items(item) for item in value))
+    if len(checks) == 1:
+        return checks[0]
+    return lambda value: all(check(value) for check in checks)
+
 
 class Validator(object):
     def __init__(self, schemes: dict):
         self.schemes = {}
         self._validator = {}
+        self._fast = {}
         self.init(schemes)
 
     def init(self, schemas: dict):
@@ -22,12 +114,24 @@ class Validator(object):
                 raise FileNotFoundError("schema not found in {}".format(schema_path))
             self.schemes.setdefault(name, schema)
             self._validator.setdefault(name, Draft6Validator(schema, format_checker=checker))
+            self._fast.setdefault(name, compile_schema(schema))
 
     def validate_data(self, name: str, data: dict) -> bool:
+        fast = self._fast[name]
+        if fast is not None and fast(data):
+            return True
+        # Медленный путь нужен только для текста ошибки: jsonschema найдет то же нарушение
         try:
             self._validator[name].validate(data)
             return True
         except ValidationError as e:
-            field = "-".join(e.absolute_path)
+            field = "-".join(str(part) for part in e.absolute_path)
             raise ValidationError("Validate Error, field[{field}], error msg: {msg}"
                                   .format(field=field, msg=e.message))
+
+    def validate_action(self, data: dict) -> bool:
+        # Один проход на сообщение: схема конкретного action, если она есть, иначе общая схема "action"
+        name = data.get("action") if isinstance(data, dict) else None
+        if not isinstance(name, str) or name not in self._validator:
+            name = "action"
+        return self.validate_data(name, data)
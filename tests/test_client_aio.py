@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import socket
+import unittest
+
+from gb_chat.client.aio import AsyncChatClient
+from gb_chat.server.aio import AsyncChatServer
+from gb_chat.tools.compression import ZLIB, CompressedCodec
+from gb_chat.tools.requests import request_msg
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(__file__))[0], "config.json")
+
+
+def free_port() -> int:
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        if port < 49152:
+            return port
+
+
+class AsyncChatClientTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with open(CONFIG_PATH) as f:
+            result = json.load(f)
+        port = free_port()
+        self.chat_server = AsyncChatServer({**result["general"], **result["server"],
+                                            "address": "127.0.0.1", "port": port})
+        self.task = asyncio.create_task(self.chat_server.serve_forever())
+        self.config = {**result["general"], **result["client"], "address": "127.0.0.1", "port": port}
+        self.clients = []
+        await asyncio.sleep(0.05)
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            client.close()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def connect(self, name: str, handler=None) -> AsyncChatClient:
+        client = AsyncChatClient({**self.config, "account": {"login": name}}, handler)
+        self.clients.append(client)
+        self.assertTrue(await client.connect())
+        return client
+
+    async def test_connect(self):
+        client = await self.connect("test")
+        self.assertTrue(client.is_connected)
+
+    async def test_duplicate_name(self):
+        await self.connect("test")
+        client = AsyncChatClient({**self.config, "account": {"login": "test"}})
+        self.assertFalse(await client.connect())
+
+    async def test_handler(self):
+        received = asyncio.Queue()
+        await self.connect("recipient", received.put_nowait)
+        sender = await self.connect("sender")
+        sender.send_data(data=request_msg(sender="sender", to="recipient", encoding=sender.encoding,
+                                          message="hello"))
+        msg = await asyncio.wait_for(received.get(), 1)
+        self.assertEqual(msg["message"], "hello")
+
+    async def test_compression(self):
+        received = asyncio.Queue()
+        recipient = await self.connect("recipient", received.put_nowait)
+        sender = await self.connect("sender")
+        self.assertIsInstance(sender.codec, CompressedCodec)
+        text = "Every frame is uncompressed JSON with repeated keys. " * 20
+        sender.send_data(data=request_msg(sender="sender", to="recipient", encoding=sender.encoding, message=text))
+        self.assertEqual((await asyncio.wait_for(received.get(), 1))["message"], text)
+        self.assertIsInstance(recipient.codec, CompressedCodec)
+
+    async def test_no_compression(self):
+        # Клиент без сжатия (или старый клиент) получает кадры без флага сжатия
+        received = asyncio.Queue()
+        self.config["compressions"] = []
+        recipient = await self.connect("recipient", received.put_nowait)
+        self.assertNotIsInstance(recipient.codec, CompressedCodec)
+        self.config["compressions"] = [ZLIB]
+        sender = await self.connect("sender")
+        text = "x" * 1000
+        sender.send_data(data=request_msg(sender="sender", to="recipient", encoding=sender.encoding, message=text))
+        self.assertEqual((await asyncio.wait_for(received.get(), 1))["message"], text)
+
+    def direct(self, received: asyncio.Queue):
+        # Уведомления сервера в #server (выход пользователя) тестам не нужны
+        return lambda msg: msg["from"] != "server" and received.put_nowait(msg)
+
+    async def drop(self, name: str):
+        session = self.chat_server.clients.find(name)
+        session.client.close()
+        while self.chat_server.clients.find(name) is session:
+            await asyncio.sleep(0.01)
+
+    async def wait_online(self, client: AsyncChatClient):
+        while not client.online:
+            await asyncio.sleep(0.01)
+
+    async def test_reconnect(self):
+        received = asyncio.Queue()
+        await self.connect("recipient", self.direct(received))
+        sender = await self.connect("sender")
+        await self.drop("sender")
+        # Пока соединения нет, сообщения копятся в буфере и уходят после повторного входа
+        while sender.online:
+            await asyncio.sleep(0.01)
+        sender.send_data(data=request_msg(sender="sender", to="recipient", encoding=sender.encoding,
+                                          message="offline"))
+        await asyncio.wait_for(self.wait_online(sender), 2)
+        msg = await asyncio.wait_for(received.get(), 1)
+        self.assertEqual(msg["message"], "offline")
+
+    async def test_no_duplicates(self):
+        received = asyncio.Queue()
+        await self.connect("recipient", self.direct(received))
+        sender = await self.connect("sender")
+        for text in ("first", "second"):
+            sender.send_data(data=request_msg(sender="sender", to="recipient", encoding=sender.encoding,
+                                              message=text))
+        for text in ("first", "second"):
+            self.assertEqual((await asyncio.wait_for(received.get(), 1))["message"], text)
+        second = sender.outbox[-1]
+        await self.drop("sender")
+        await asyncio.wait_for(self.wait_online(sender), 2)
+        # Сервер вернул seq последнего принятого сообщения: буфер клиента очищен, а повтор отбрасывается
+        self.assertEqual(len(sender.outbox), 0)
+        sender.write(second)
+        sender.send_data(data=request_msg(sender="sender", to="recipient", encoding=sender.encoding,
+                                          message="third"))
+        self.assertEqual((await asyncio.wait_for(received.get(), 1))["message"], "third")
+
+
+if __name__ == '__main__':
+    unittest.main()
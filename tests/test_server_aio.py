@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import time
+import socket
+import tempfile
+import unittest
+
+from gb_chat.server.aio import AsyncChatServer
+from gb_chat.server.history import HistoryLog
+from gb_chat.tools.framing import FrameDecoder, encode_frame
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(__file__))[0], "config.json")
+
+
+def free_port() -> int:
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        if port < 49152:
+            return port
+
+
+class AsyncChatServerTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with open(CONFIG_PATH) as f:
+            result = json.load(f)
+        config = {**result["general"], **result["server"], "address": "127.0.0.1",
+                  "heartbeat_interval": 0.2, "heartbeat_timeout": 0.2, "heartbeat_tick": 0.05}
+        self.port = config["port"] = free_port()
+        self.chat_server = AsyncChatServer(config)
+        self.task = asyncio.create_task(self.chat_server.serve_forever())
+        await asyncio.sleep(0.05)
+
+    async def asyncTearDown(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def connect(self, name: str):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        presence = {"action": "presence", "time": time.time(), "user": {"account_name": name}}
+        writer.write(encode_frame(json.dumps(presence).encode()))
+        return reader, writer, await self.receive(reader)
+
+    async def receive(self, reader) -> dict:
+        decoder = FrameDecoder(1024)
+        frames = []
+        while not frames:
+            frames = decoder.feed(await asyncio.wait_for(reader.read(1024), 1))
+        return json.loads(frames[0])
+
+    async def test_presence(self):
+        _, writer, response = await self.connect("test")
+        writer.close()
+        self.assertEqual(response["response"], 200)
+
+    async def test_not_object(self):
+        for payload in (b"[]", b'"hi"'):
+            reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+            writer.write(encode_frame(payload))
+            self.assertEqual((await self.receive(reader))["response"], 400)
+            self.assertEqual(await asyncio.wait_for(reader.read(1024), 1), b"")
+            writer.close()
+        _, writer, response = await self.connect("test")
+        writer.close()
+        self.assertEqual(response["response"], 200)
+
+    async def test_duplicate_name(self):
+        _, first, _ = await self.connect("test")
+        _, second, response = await self.connect("test")
+        first.close()
+        second.close()
+        self.assertEqual(response["response"], 409)
+
+    async def test_direct_msg(self):
+        _, sender, _ = await self.connect("sender")
+        reader, recipient, _ = await self.connect("recipient")
+        msg = {"action": "msg", "time": time.time(), "to": "recipient", "from": "sender", "message": "hello"}
+        sender.write(encode_frame(json.dumps(msg).encode()))
+        data = await self.receive(reader)
+        sender.close()
+        recipient.close()
+        self.assertEqual(data["message"], "hello")
+
+    async def test_spoofed_from(self):
+        _, sender, _ = await self.connect("sender")
+        reader, recipient, _ = await self.connect("recipient")
+        msg = {"action": "msg", "time": time.time(), "to": "recipient", "from": "recipient", "message": "hello"}
+        sender.write(encode_frame(json.dumps(msg).encode()))
+        data = await self.receive(reader)
+        sender.close()
+        recipient.close()
+        self.assertEqual(data["from"], "sender")
+
+    async def test_close_history(self):
+        # Остановка сервера сбрасывает буфер журнала, хотя фоновый сброс еще не наступил
+        with tempfile.TemporaryDirectory() as directory:
+            self.chat_server.history = HistoryLog(directory, 1 << 20, 60)
+            _, sender, _ = await self.connect("sender")
+            reader, recipient, _ = await self.connect("recipient")
+            msg = {"action": "msg", "time": time.time(), "to": "recipient", "from": "sender", "message": "logged"}
+            sender.write(encode_frame(json.dumps(msg).encode()))
+            while (await self.receive(reader)).get("message") != "logged":
+                pass
+            sender.close()
+            recipient.close()
+            await self.asyncTearDown()
+            history = HistoryLog(directory, 1 << 20, 60)
+            self.assertEqual([msg["message"] for msg in history.query(("recipient", "sender"), 10)], ["logged"])
+            history.close()
+
+    async def test_stage_metrics(self):
+        reader, recipient, _ = await self.connect("recipient")
+        _, sender, _ = await self.connect("sender")
+        msg = {"action": "msg", "time": time.time(), "to": "recipient", "from": "sender", "message": "timed"}
+        sender.write(encode_frame(json.dumps(msg).encode()))
+        while (await self.receive(reader)).get("message") != "timed":
+            pass
+        sender.close()
+        recipient.close()
+        metrics = self.chat_server.metrics
+        self.assertGreater(metrics.stages["recv"].count, 0)
+        self.assertGreater(metrics.stages["send"].count, 0)
+        self.assertGreater(metrics.loop.count, 0)
+
+    async def test_heartbeat(self):
+        reader, writer, _ = await self.connect("test")
+        probe = await self.receive(reader)
+        self.assertEqual(probe["action"], "probe")
+        # На probe не отвечаем - сервер закрывает соединение
+        self.assertEqual(await asyncio.wait_for(reader.read(1024), 1), b"")
+        writer.close()
+        self.assertIsNone(self.chat_server.clients.find("test"))
+
+    async def test_heartbeat_reply(self):
+        reader, writer, _ = await self.connect("test")
+        for _ in range(3):
+            self.assertEqual((await self.receive(reader))["action"], "probe")
+            presence = {"action": "presence", "time": time.time(), "user": {"account_name": "test"}}
+            writer.write(encode_frame(json.dumps(presence).encode()))
+        writer.close()
+        self.assertIsNotNone(self.chat_server.clients.find("test"))
+
+    async def test_rate_limit(self):
+        reader, writer, _ = await self.connect("test")
+        # Один токен и почти нулевое пополнение: результат не зависит от того, сколько прошло между чтениями
+        bucket = self.chat_server.clients.find("test").rate
+        bucket.tokens = 1
+        bucket.rate = 0.01
+        msg = {"action": "msg", "time": time.time(), "to": "test", "from": "test", "message": "hello"}
+        writer.write(encode_frame(json.dumps(msg).encode()) * 3)
+        decoder = FrameDecoder(1024)
+        frames = []
+        while len(frames) < 2:
+            data = await asyncio.wait_for(reader.read(1024), 1)
+            frames.extend(frame for frame in map(json.loads, decoder.feed(data)) if frame.get("action") != "probe")
+        writer.close()
+        # Второе и третье сообщения отброшены, 429 приходит один раз на серию; порядок зависит от разбиения TCP
+        self.assertCountEqual([frame.get("response", frame.get("message")) for frame in frames], [429, "hello"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gb_chat.server.auth import Authenticator, TokenCache, UserStore, hash_password, verify_password
+
+
+class PasswordTestCase(unittest.TestCase):
+    def test_verify(self):
+        stored = hash_password("secret")
+        self.assertTrue(verify_password("secret", stored))
+        self.assertFalse(verify_password("wrong", stored))
+
+    def test_salt(self):
+        self.assertNotEqual(hash_password("secret"), hash_password("secret"))
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    def test_check(self):
+        cache = TokenCache(60, 10)
+        token = cache.issue("user")
+        self.assertTrue(cache.check("user", token))
+        self.assertFalse(cache.check("other", token))
+        self.assertFalse(cache.check("user", None))
+
+    def test_expired(self):
+        cache = TokenCache(-1, 10)
+        token = cache.issue("user")
+        self.assertFalse(cache.check("user", token))
+        self.assertEqual(len(cache), 0)
+
+    def test_limit(self):
+        cache = TokenCache(60, 2)
+        first = cache.issue("first")
+        cache.issue("second")
+        cache.issue("third")
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(cache.check("first", first))
+
+
+class AuthenticatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "users.json")
+        UserStore(self.path).add("user", "secret")
+        self.auth = Authenticator(self.path, 1, 60, 10)
+
+    def tearDown(self):
+        self.auth.executor.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_submit(self):
+        self.assertTrue(self.auth.submit("user", "secret").result())
+        self.assertFalse(self.auth.submit("user", "wrong").result())
+        self.assertFalse(self.auth.submit("nobody", "secret").result())
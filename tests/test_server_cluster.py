@@ -0,0 +1,77 @@
+import os
+import select
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Event, Process
+
+from gb_chat.server.cluster import BROKER_FILE, BrokerLink, start_broker
+from gb_chat.server.history import HistoryLog
+
+
+class BrokerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, BROKER_FILE)
+        ready = Event()
+        history = {"history": os.path.join(self.directory, "history"), "history_segment_size": 1 << 20,
+                   "history_flush_interval": 60, "encoding": "utf-8"}
+        self.broker = Process(target=start_broker, args=(path, 100000, ready, history), daemon=True)
+        self.broker.start()
+        self.assertTrue(ready.wait(5))
+        self.first = BrokerLink(path, 0, 100000)
+        self.second = BrokerLink(path, 1, 100000)
+
+    def tearDown(self):
+        self.broker.terminate()
+        self.broker.join()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def receive(self, link: BrokerLink) -> list[dict]:
+        select.select([link], [], [], 2)
+        return link.receive()
+
+    def test_claim(self):
+        self.assertTrue(self.first.claim("user"))
+        self.assertFalse(self.second.claim("user"))
+        self.first.release("user")
+        self.assertTrue(self.second.claim("user"))
+
+    def test_route(self):
+        self.assertTrue(self.second.claim("user"))
+        msg = {"action": "msg", "to": "user", "message": "hi"}
+        self.first.route(msg)
+        self.assertEqual(self.receive(self.second), [{"op": "deliver", "msg": msg}])
+
+    def test_route_undelivered(self):
+        msg = {"action": "msg", "to": "user", "message": "hi"}
+        self.first.route(msg)
+        self.assertEqual(self.receive(self.first), [{"op": "undelivered", "msg": msg}])
+
+    def test_broadcast(self):
+        msg = {"action": "msg", "to": "#server", "message": "hi"}
+        self.first.broadcast(msg)
+        self.assertEqual(self.receive(self.second), [{"op": "deliver", "msg": msg}])
+        self.assertEqual(self.first.receive(), [])
+
+    def test_history(self):
+        # Журнал один на кластер: записанное через один воркер видно через другой, и после остановки брокера
+        msgs = [{"action": "msg", "to": "#room", "from": "user", "message": str(i)} for i in range(3)]
+        for msg in msgs:
+            self.first.append(msg)
+        messages, start, first = self.second.page(("#room",), 2)
+        self.assertEqual((messages, start, first), (msgs[1:], 1, 0))
+        self.assertEqual(self.second.page(("#room",), 2, before=start)[0], msgs[:1])
+        self.broker.terminate()
+        self.broker.join()
+        history = HistoryLog(os.path.join(self.directory, "history"), 1 << 20, 60)
+        self.assertEqual(history.query(("#room",), 10), msgs)
+        history.close()
+
+    def test_history_size(self):
+        # Страница от брокера не длиннее input_limit: иначе ее не принял бы декодер воркера
+        for i in range(4):
+            self.first.append({"action": "msg", "to": "#room", "from": "user", "message": str(i) * 40000})
+        messages, start, first = self.second.page(("#room",), 10)
+        self.assertEqual([msg["message"][0] for msg in messages], ["2", "3"])
+        self.assertEqual((start, first), (2, 0))
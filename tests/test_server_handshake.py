@@ -0,0 +1,32 @@
+import unittest
+
+from gb_chat.server.handshake import CONNECTED, HandshakeRegistry
+
+
+class HandshakeRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = HandshakeRegistry(5)
+        self.first = object()
+        self.second = object()
+
+    def test_add(self):
+        handshake = self.registry.add(self.first, 10)
+        self.assertEqual(handshake.deadline, 15)
+        self.assertEqual(handshake.state, CONNECTED)
+        self.assertIn(self.first, self.registry)
+        self.assertIs(self.registry.get(self.first), handshake)
+
+    def test_remove(self):
+        self.registry.add(self.first, 10)
+        self.assertIsNotNone(self.registry.remove(self.first))
+        self.assertIsNone(self.registry.remove(self.first))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_expired(self):
+        self.registry.add(self.first, 10)
+        self.registry.add(self.second, 12)
+        self.assertEqual(self.registry.next_deadline(), 15)
+        self.assertEqual(self.registry.expired(14), [])
+        self.assertEqual([handshake.client for handshake in self.registry.expired(16)], [self.first])
+        self.assertEqual(self.registry.next_deadline(), 17)
+        self.assertEqual(list(self.registry), [self.second])
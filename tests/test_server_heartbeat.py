@@ -0,0 +1,82 @@
+import unittest
+
+from gb_chat.server.heartbeat import Heartbeat, TimerWheel
+from gb_chat.server.sessions import Session
+
+
+class TimerWheelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wheel = TimerWheel(1, 8, 0)
+
+    def test_advance(self):
+        self.wheel.schedule("a", 2)
+        self.wheel.schedule("b", 5)
+        self.assertEqual(self.wheel.advance(1), [])
+        self.assertEqual(self.wheel.advance(2), ["a"])
+        self.assertEqual(self.wheel.advance(6), ["b"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel(self):
+        self.wheel.schedule("a", 2)
+        self.wheel.cancel("a")
+        self.assertNotIn("a", self.wheel)
+        self.assertEqual(self.wheel.advance(3), [])
+
+    def test_reschedule(self):
+        self.wheel.schedule("a", 2)
+        self.wheel.schedule("a", 4)
+        self.assertEqual(self.wheel.advance(3), [])
+        self.assertEqual(self.wheel.advance(4), ["a"])
+
+    def test_next_round(self):
+        # Дедлайн дальше оборота колеса остается в слоте до своего тика
+        self.wheel.schedule("a", 10)
+        self.assertEqual(self.wheel.advance(7), [])
+        self.assertEqual(self.wheel.advance(10), ["a"])
+
+    def test_stall(self):
+        for key in range(8):
+            self.wheel.schedule(key, key + 1)
+        self.assertEqual(sorted(self.wheel.advance(100)), list(range(8)))
+
+    def test_past_deadline(self):
+        self.wheel.advance(5)
+        self.wheel.schedule("a", 1)
+        self.assertEqual(self.wheel.advance(6), ["a"])
+
+
+class HeartbeatTestCase(unittest.TestCase):
+    def setUp(self):
+        self.heartbeat = Heartbeat(10, 5, 1, 0)
+        self.session = Session(object(), "test")
+        self.heartbeat.add(self.session, 0)
+
+    def test_probe(self):
+        self.assertEqual(self.heartbeat.expired(9), ([], []))
+        self.assertEqual(self.heartbeat.expired(10), ([self.session], []))
+        self.assertEqual(self.session.probed, 10)
+
+    def test_active_session(self):
+        self.session.last_seen = 8
+        self.assertEqual(self.heartbeat.expired(10), ([], []))
+        self.assertEqual(self.heartbeat.expired(18), ([self.session], []))
+
+    def test_evict(self):
+        self.heartbeat.expired(10)
+        self.assertEqual(self.heartbeat.expired(15), ([], [self.session]))
+        self.assertEqual(len(self.heartbeat), 0)
+
+    def test_reply(self):
+        self.heartbeat.expired(10)
+        self.session.last_seen = 11
+        self.assertEqual(self.heartbeat.expired(15), ([], []))
+        self.assertIsNone(self.session.probed)
+        self.assertEqual(self.heartbeat.expired(21), ([self.session], []))
+
+    def test_remove(self):
+        self.heartbeat.remove(self.session)
+        self.assertEqual(self.heartbeat.expired(100), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
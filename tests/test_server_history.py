@@ -0,0 +1,61 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+from gb_chat.server.history import HistoryLog, conversation
+
+
+class HistoryLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = HistoryLog(self.directory, 200, 60)
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def msg(self, sender: str, to: str, message: str) -> dict:
+        return {"action": "msg", "time": time.time(), "to": to, "from": sender, "message": message}
+
+    def test_conversation(self):
+        self.assertEqual(conversation(self.msg("a", "b", "")), conversation(self.msg("b", "a", "")))
+        self.assertEqual(conversation({"to": "b"}, "a"), ("a", "b"))
+        self.assertEqual(conversation(self.msg("a", "#room", "")), ("#room",))
+
+    def test_query_limit(self):
+        for i in range(10):
+            self.history.append(self.msg("a", "b", str(i)))
+            self.history.append(self.msg("a", "#room", str(i)))
+        messages = self.history.query(("a", "b"), 3)
+        self.assertEqual([msg["message"] for msg in messages], ["7", "8", "9"])
+        self.assertGreater(len(self.history.segments), 1)
+
+    def test_query_range(self):
+        self.history.append(self.msg("a", "b", "old"))
+        since = time.time()
+        self.history.append(self.msg("b", "a", "new"))
+        messages = self.history.query(("a", "b"), 10, since=since)
+        self.assertEqual([msg["message"] for msg in messages], ["new"])
+        messages = self.history.query(("a", "b"), 10, until=since)
+        self.assertEqual([msg["message"] for msg in messages], ["old"])
+
+    def test_page(self):
+        for i in range(5):
+            self.history.append(self.msg("a", "#room", str(i)))
+        messages, start, first = self.history.page(("#room",), 2)
+        self.assertEqual(([msg["message"] for msg in messages], start, first), (["3", "4"], 3, 0))
+        messages, start, first = self.history.page(("#room",), 2, before=start)
+        self.assertEqual(([msg["message"] for msg in messages], start), (["1", "2"], 1))
+        messages, start, first = self.history.page(("#room",), 2, before=start)
+        self.assertEqual(([msg["message"] for msg in messages], start), (["0"], 0))
+        self.assertEqual(self.history.page(("#none",), 2), ([], 0, 0))
+
+    def test_reload(self):
+        for i in range(5):
+            self.history.append(self.msg("a", "#room", str(i)))
+        self.history.close()
+        self.history = HistoryLog(self.directory, 200, 60)
+        self.assertEqual(self.history.offset, 5)
+        messages = self.history.query(("#room",), 2)
+        self.assertEqual([msg["message"] for msg in messages], ["3", "4"])
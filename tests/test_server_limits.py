@@ -0,0 +1,31 @@
+import unittest
+
+from gb_chat.server.limits import TokenBucket
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bucket = TokenBucket(10, 20, 0)
+
+    def test_burst(self):
+        for _ in range(20):
+            self.assertTrue(self.bucket.consume(1, 0))
+        self.assertFalse(self.bucket.consume(1, 0))
+
+    def test_refill(self):
+        self.bucket.consume(20, 0)
+        self.assertFalse(self.bucket.consume(1, 0.05))
+        self.assertTrue(self.bucket.consume(1, 0.1))
+
+    def test_burst_limit(self):
+        self.assertEqual(self.bucket.update(100), 20)
+
+    def test_debt(self):
+        self.bucket.take(40, 0)
+        self.assertAlmostEqual(self.bucket.delay(0), 2)
+        self.assertAlmostEqual(self.bucket.delay(1.5), 0.5)
+        self.assertEqual(self.bucket.delay(3), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
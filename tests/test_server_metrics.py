@@ -0,0 +1,38 @@
+import unittest
+
+from gb_chat.server.metrics import Histogram, Registry, ServerMetrics
+
+
+class RegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter("test_total", "Test", action="msg")
+        self.assertIs(self.registry.counter("test_total", "Test", action="msg"), counter)
+        counter.inc()
+        counter.inc(2)
+        self.assertIn('test_total{action="msg"} 3', self.registry.render())
+
+    def test_gauge(self):
+        self.registry.gauge("test_gauge", "Test", lambda: 42)
+        self.assertIn("# TYPE test_gauge gauge\ntest_gauge 42", self.registry.render())
+
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        lines = histogram.render("test_seconds", ())
+        self.assertEqual(lines[:3], ['test_seconds_bucket{le="0.1"} 1', 'test_seconds_bucket{le="1.0"} 2',
+                                     'test_seconds_bucket{le="+Inf"} 3'])
+        self.assertEqual(lines[-1], "test_seconds_count 3")
+
+    def test_server_metrics(self):
+        metrics = ServerMetrics()
+        self.assertIs(metrics.message("msg"), metrics.message("msg"))
+        metrics.frames_out("msg").inc(3)
+        metrics.frames_out("response").inc()
+        self.assertIn('chat_frames_out_total{action="msg"} 3', metrics.render())
+        self.assertIn('chat_frames_out_total{action="response"} 1', metrics.render())
+        metrics.stages["recv"].observe(0.001)
+        self.assertIn('chat_stage_seconds_count{stage="recv"} 1', metrics.render())
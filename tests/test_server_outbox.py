@@ -0,0 +1,89 @@
+import unittest
+
+from gb_chat.server.outbox import DISCONNECT, DROP_OLDEST, Outbox
+
+
+class Peer(object):
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.received = bytearray()
+
+    def sendmsg(self, buffers: list) -> int:
+        data = b"".join(buffers)[:self.capacity]
+        if not data:
+            raise BlockingIOError()
+        self.capacity -= len(data)
+        self.received += data
+        return len(data)
+
+
+class OutboxTestCase(unittest.TestCase):
+    def test_flush(self):
+        outbox = Outbox(100)
+        outbox.put(b"hello")
+        outbox.put(b"world")
+        peer = Peer(100)
+        self.assertEqual(outbox.flush(peer.sendmsg), 10)
+        self.assertEqual(peer.received, b"helloworld")
+        self.assertEqual(len(outbox), 0)
+
+    def test_partial(self):
+        outbox = Outbox(100)
+        outbox.put(b"hello")
+        outbox.put(b"world")
+        peer = Peer(7)
+        outbox.flush(peer.sendmsg)
+        self.assertEqual(len(outbox), 3)
+        peer.capacity = 100
+        outbox.flush(peer.sendmsg)
+        self.assertEqual(peer.received, b"helloworld")
+
+    def test_drop_oldest(self):
+        outbox = Outbox(10, DROP_OLDEST)
+        outbox.put(b"aaaa")
+        outbox.put(b"bbbb")
+        self.assertTrue(outbox.put(b"cccc"))
+        self.assertEqual(outbox.dropped, 1)
+        peer = Peer(100)
+        outbox.flush(peer.sendmsg)
+        self.assertEqual(peer.received, b"bbbbcccc")
+
+    def test_drop_keeps_partial(self):
+        outbox = Outbox(10, DROP_OLDEST)
+        outbox.put(b"aaaa")
+        outbox.put(b"bbbb")
+        peer = Peer(2)
+        outbox.flush(peer.sendmsg)
+        outbox.put(b"cccccc")
+        peer.capacity = 100
+        outbox.flush(peer.sendmsg)
+        self.assertEqual(peer.received, b"aaaacccccc")
+
+    def test_disconnect(self):
+        outbox = Outbox(10, DISCONNECT)
+        self.assertTrue(outbox.put(b"aaaaaaaa"))
+        self.assertFalse(outbox.put(b"bbbb"))
+
+    def test_take(self):
+        outbox = Outbox(100)
+        outbox.put(b"hello")
+        outbox.put(b"world")
+        self.assertEqual(b"".join(outbox.take()), b"helloworld")
+        self.assertEqual(len(outbox), 0)
+
+    def test_release(self):
+        # Опустевшая очередь отпускает свой deque, следующий кадр заводит новый
+        outbox = Outbox(100)
+        outbox.put(b"hello")
+        outbox.flush(Peer(100).sendmsg)
+        self.assertIsNone(outbox._chunks)
+        self.assertTrue(outbox.put(b"world"))
+        self.assertEqual(len(outbox), 5)
+
+    def test_policy(self):
+        with self.assertRaises(ValueError):
+            Outbox(10, "unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from gb_chat.server.rooms import RoomRegistry
+from gb_chat.server.sessions import NO_ROOMS, Session
+
+
+class RoomRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rooms = RoomRegistry()
+        self.first = Session(object(), "first")
+        self.second = Session(object(), "second")
+
+    def test_join(self):
+        self.assertTrue(self.rooms.join("#room", self.first))
+        self.assertFalse(self.rooms.join("#room", self.first))
+        self.assertEqual(self.rooms.members("#room"), [self.first])
+        self.assertEqual(self.first.rooms, {"#room"})
+
+    def test_members(self):
+        self.rooms.join("#room", self.first)
+        self.rooms.join("#room", self.second)
+        self.rooms.join("#other", self.second)
+        self.assertEqual(set(self.rooms.members("#room")), {self.first, self.second})
+        self.assertEqual(self.rooms.members("#other"), [self.second])
+        self.assertEqual(self.rooms.members("#empty"), [])
+
+    def test_leave(self):
+        self.rooms.join("#room", self.first)
+        self.assertTrue(self.rooms.leave("#room", self.first))
+        self.assertFalse(self.rooms.leave("#room", self.first))
+        self.assertNotIn("#room", self.rooms)
+        self.assertEqual(self.first.rooms, set())
+        # Вышедшая из всех комнат сессия снова ссылается на общее пустое множество
+        self.assertIs(self.first.rooms, NO_ROOMS)
+
+    def test_leave_all(self):
+        self.rooms.join("#room", self.first)
+        self.rooms.join("#other", self.first)
+        self.rooms.join("#other", self.second)
+        self.rooms.leave_all(self.first)
+        self.assertEqual(len(self.rooms), 1)
+        self.assertEqual(self.rooms.members("#other"), [self.second])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,427 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+from collections import deque
+from selectors import EVENT_READ, EVENT_WRITE
+
+from gb_chat.server import ChatServer
+from gb_chat.server.history import HistoryLog
+from gb_chat.server.outbox import Outbox
+from gb_chat.server.store import OfflineStore
+from gb_chat.tools.codec import INSTALLED, available_codecs
+from gb_chat.tools.framing import FrameDecoder, encode_frame
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(__file__))[0], "config.json")
+
+
+def free_port() -> int:
+    while True:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        if port < 49152:
+            return port
+
+
+def presence(name: str) -> bytes:
+    return encode_frame(json.dumps({"action": "presence", "time": time.time(),
+                                    "user": {"account_name": name}}).encode())
+
+
+class SelectChatServerTestCase(unittest.TestCase):
+    # Движок select целиком: ChatServer.run в отдельном потоке, клиенты - обычные блокирующие сокеты.
+    # Исключение, завершившее цикл сервера, проваливает тест в tearDown
+    config = {}
+
+    def setUp(self):
+        with open(CONFIG_PATH) as f:
+            result = json.load(f)
+        self.port = free_port()
+        self.chat_server = None
+        self.error = None
+        # Сервер создается в своем потоке: SQLite хранилища работает только в потоке, где открыт
+        self.thread = threading.Thread(target=self.serve, daemon=True,
+                                       args=({**result["general"], **result["server"], "address": "127.0.0.1",
+                                              "port": self.port, "metrics_dump": None, **self.config},))
+        self.thread.start()
+        self.sockets = []
+        self.decoders = {}
+        self.inboxes = {}
+        self.wait(lambda: self.error is not None or (self.chat_server is not None
+                                                     and self.chat_server.socket is not None))
+        self.assertIsNone(self.error)
+
+    def serve(self, config: dict):
+        try:
+            self.chat_server = ChatServer(config)
+            self.chat_server.run()
+        except Exception as e:
+            self.error = e
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        self.chat_server.stop()
+        self.thread.join(2)
+        self.assertFalse(self.thread.is_alive())
+        self.assertIsNone(self.error)
+
+    def wait(self, condition, timeout: float = 2):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Condition not met in {} s".format(timeout))
+            time.sleep(0.005)
+
+    def open(self, rcvbuf: int = None) -> socket.socket:
+        sock = socket.socket()
+        if rcvbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.settimeout(2)
+        sock.connect(("127.0.0.1", self.port))
+        self.sockets.append(sock)
+        self.decoders[sock] = FrameDecoder(1 << 20)
+        self.inboxes[sock] = deque()
+        return sock
+
+    def receive(self, sock: socket.socket) -> dict:
+        # Кадры probe от проверки живости тестам не нужны; лишние кадры одного recv ждут в inbox
+        inbox = self.inboxes[sock]
+        while True:
+            while inbox:
+                data = json.loads(inbox.popleft())
+                if data.get("action") != "probe":
+                    return data
+            data = sock.recv(65536)
+            if not data:
+                raise ConnectionResetError("Connection closed by server")
+            inbox.extend(self.decoders[sock].feed(data))
+
+    def wait_closed(self, sock: socket.socket):
+        # Сервер закрыл соединение: все, что он успел прислать, дочитывается до EOF (таймаут сокета - провал)
+        try:
+            while sock.recv(65536):
+                pass
+        except ConnectionResetError:
+            pass
+
+    def connect(self, name: str) -> tuple[socket.socket, dict]:
+        sock = self.open()
+        sock.sendall(presence(name))
+        return sock, self.receive(sock)
+
+    def send(self, sock: socket.socket, data: dict):
+        sock.sendall(encode_frame(json.dumps({"time": time.time(), **data}).encode()))
+
+
+class SelectHandshakeTestCase(SelectChatServerTestCase):
+    config = {"handshake_timeout": 0.3}
+
+    def test_presence(self):
+        _, response = self.connect("test")
+        self.assertEqual(response["response"], 200)
+
+    def test_interleaved(self):
+        # Половина presence от одного клиента не мешает войти другому: рукопожатие не блокирует цикл
+        slow = self.open()
+        data = presence("slow")
+        slow.sendall(data[:7])
+        _, response = self.connect("fast")
+        self.assertEqual(response["response"], 200)
+        slow.sendall(data[7:])
+        self.assertEqual(self.receive(slow)["response"], 200)
+
+    def test_deadline(self):
+        sock = self.open()
+        self.assertEqual(self.receive(sock)["response"], 408)
+        self.wait_closed(sock)
+        self.wait(lambda: len(self.chat_server.handshakes) == 0)
+
+    def test_deadline_partial(self):
+        # Недосланный кадр presence тоже не продлевает срок
+        sock = self.open()
+        sock.sendall(presence("test")[:7])
+        self.assertEqual(self.receive(sock)["response"], 408)
+        self.wait_closed(sock)
+        _, response = self.connect("test")
+        self.assertEqual(response["response"], 200)
+
+    def test_not_object(self):
+        # Первый кадр - не объект: ответ 400 и отключение, цикл сервера продолжает работать
+        for payload in (b"[]", b'"hi"', b"42"):
+            sock = self.open()
+            sock.sendall(encode_frame(payload))
+            self.assertEqual(self.receive(sock)["response"], 400)
+            self.wait_closed(sock)
+        _, response = self.connect("test")
+        self.assertEqual(response["response"], 200)
+
+
+class SelectWriteInterestTestCase(SelectChatServerTestCase):
+    config = {"output_limit": 16 * 1024 * 1024, "rate_bytes": None, "rate_messages": None}
+
+    def events(self, name: str) -> int:
+        key = self.chat_server.selector.get_map().get(self.chat_server.clients.find(name).client)
+        return 0 if key is None else key.events
+
+    def test_slow_reader(self):
+        slow = self.open(rcvbuf=4096)
+        slow.sendall(presence("slow"))
+        self.assertEqual(self.receive(slow)["response"], 200)
+        sender, _ = self.connect("sender")
+        text = "x" * 60000
+        for number in range(100):
+            self.send(sender, {"action": "msg", "to": "slow", "from": "sender", "message": text + str(number)})
+        # Очередь медленного читателя копится на сервере, интерес к записи включен только для него
+        self.wait(lambda: self.events("slow") & EVENT_WRITE)
+        self.assertEqual(self.events("sender"), EVENT_READ)
+        # Пока медленный клиент не читает, остальные обслуживаются
+        other, _ = self.connect("other")
+        self.send(sender, {"action": "msg", "to": "other", "from": "sender", "message": "hello"})
+        self.assertEqual(self.receive(other)["message"], "hello")
+        for number in range(100):
+            self.assertEqual(self.receive(slow)["message"], text + str(number))
+        # Очередь опустела - интерес к записи снят
+        self.wait(lambda: self.events("slow") == EVENT_READ)
+        self.assertEqual(len(self.chat_server.clients.find("slow").outbox), 0)
+
+
+class SelectOverflowTestCase(SelectChatServerTestCase):
+    config = {"output_limit": 100000, "overflow_policy": "disconnect", "rate_bytes": None, "rate_messages": None}
+
+    def test_overflow_leave(self):
+        # Отключенный за переполнение очереди пользователь уходит из чата с уведомлением для остальных
+        slow = self.open(rcvbuf=4096)
+        slow.sendall(presence("slow"))
+        self.assertEqual(self.receive(slow)["response"], 200)
+        other, _ = self.connect("other")
+        sender, _ = self.connect("sender")
+        for _ in range(100):
+            self.send(sender, {"action": "msg", "to": "slow", "from": "sender", "message": "x" * 60000})
+        self.wait(lambda: self.chat_server.clients.find("slow") is None)
+        msg = self.receive(other)
+        self.assertEqual((msg["from"], msg["to"]), ("server", "#server"))
+        self.assertIn("slow", msg["message"])
+
+
+class SelectLimitsTestCase(SelectChatServerTestCase):
+    config = {"read_budget": 8192, "rate_bytes": 200000, "rate_bytes_burst": 200000}
+
+    def test_rate_limit(self):
+        sock, _ = self.connect("test")
+        self.chat_server.clients.find("test").rate.rate = 0.01
+        self.chat_server.clients.find("test").rate.tokens = 1
+        for _ in range(3):
+            self.send(sock, {"action": "msg", "to": "test", "from": "test", "message": "hello"})
+        frames = [self.receive(sock), self.receive(sock)]
+        self.assertCountEqual([frame.get("response", frame.get("message")) for frame in frames], [429, "hello"])
+
+    def test_mute(self):
+        # Превысивший байты в секунду сокет снимается с селектора, но его сообщения доходят позже, а не теряются
+        sink, _ = self.connect("sink")
+        flooder, _ = self.connect("flooder")
+        start = time.monotonic()
+        for number in range(8):
+            self.send(flooder, {"action": "msg", "to": "sink", "from": "flooder", "message": "x" * 50000 + str(number)})
+        self.wait(lambda: self.chat_server.clients.find("flooder").client in self.chat_server.muted)
+        for number in range(8):
+            self.assertEqual(self.receive(sink)["message"][50000:], str(number))
+        # 400 КБ при 200 КБ/с и запасе 200 КБ - не меньше секунды
+        self.assertGreater(time.monotonic() - start, 0.8)
+
+    def test_read_budget(self):
+        # Бюджет прохода делится между сокетами: поток одного клиента не задерживает другого до своего конца
+        self.chat_server.rate_bytes = None
+        sink, _ = self.connect("sink")
+        flooder, _ = self.connect("flooder")
+        light, _ = self.connect("light")
+        flood = b"".join(
+            encode_frame(json.dumps({"action": "msg", "time": time.time(), "to": "sink", "from": "flooder",
+                                     "message": "x" * 50000}).encode())
+            for _ in range(40)
+        )
+        thread = threading.Thread(target=flooder.sendall, args=(flood,))
+        thread.start()
+        self.wait(lambda: self.chat_server.metrics.bytes_in.value > 100000)
+        self.send(light, {"action": "msg", "to": "sink", "from": "light", "message": "hello"})
+        senders = [self.receive(sink)["from"] for _ in range(41)]
+        thread.join()
+        self.assertLess(senders.index("light"), 40)
+
+
+class SelectReceiveTestCase(SelectChatServerTestCase):
+    config = {"rate_bytes": None, "rate_messages": None}
+
+    def test_pooled(self):
+        # Склеенные, разрезанные и длиннее buffer_size кадры разбираются из буферов пула,
+        # после обработки простаивающее соединение буфера не держит
+        sink, _ = self.connect("sink")
+        sender, _ = self.connect("sender")
+        texts = ["short", "x" * 3 * self.chat_server.buffer_size, "glued", "y" * 50000, "tail"]
+        data = b"".join(encode_frame(json.dumps({"action": "msg", "time": time.time(), "to": "sink",
+                                                 "from": "sender", "message": text}).encode()) for text in texts)
+        for offset in range(0, len(data), 1000):
+            sender.sendall(data[offset:offset + 1000])
+            time.sleep(0.001)
+        for text in texts:
+            self.assertEqual(self.receive(sink)["message"], text)
+        decoder = self.chat_server.decoders[self.chat_server.clients.find("sender").client]
+        self.wait(lambda: decoder._buffer is None and not decoder._retired)
+        self.assertGreater(len(self.chat_server.buffers), 0)
+
+    @unittest.skipUnless(INSTALLED["orjson"], "orjson is not installed")
+    def test_surrogate(self):
+        # Одинокий суррогат от json-клиента: 400 на входе, до кодирования для orjson-получателя не доходит
+        sink = self.open()
+        sink.sendall(encode_frame(json.dumps({"action": "presence", "time": time.time(), "codecs": ["orjson"],
+                                              "user": {"account_name": "sink"}}).encode()))
+        self.assertEqual(self.receive(sink)["codec"], "orjson")
+        sender, _ = self.connect("sender")
+        sender.sendall(encode_frame(json.dumps({"action": "msg", "time": time.time(), "to": "sink",
+                                                "from": "sender", "message": "\ud800"}).encode()))
+        self.assertEqual(self.receive(sender)["response"], 400)
+        self.wait_closed(sender)
+        self.assertIn("sender", self.receive(sink)["message"])
+        sender, _ = self.connect("sender")
+        self.send(sender, {"action": "msg", "to": "sink", "from": "sender", "message": "hello"})
+        self.assertEqual(self.receive(sink)["message"], "hello")
+
+    @unittest.skipUnless(INSTALLED["orjson"], "orjson is not installed")
+    def test_mixed_codecs(self):
+        # Число вне int64 из json-клиента отклоняется на входе: orjson-получатель и цикл сервера живы
+        sink = self.open()
+        sink.sendall(encode_frame(json.dumps({"action": "presence", "time": time.time(), "codecs": ["orjson"],
+                                              "user": {"account_name": "sink"}}).encode()))
+        self.assertEqual(self.receive(sink)["codec"], "orjson")
+        sender, _ = self.connect("sender")
+        self.send(sender, {"action": "msg", "to": "sink", "from": "sender", "message": "big", "seq": 2 ** 70})
+        self.assertEqual(self.receive(sender)["response"], 400)
+        self.wait_closed(sender)
+        self.assertIn("sender", self.receive(sink)["message"])
+        sender, _ = self.connect("sender")
+        self.send(sender, {"action": "msg", "to": "sink", "from": "sender", "message": "hello", "seq": 1})
+        self.assertEqual(self.receive(sink)["message"], "hello")
+
+
+class WriterEncodeErrorTestCase(unittest.TestCase):
+    def setUp(self):
+        with open(CONFIG_PATH) as f:
+            result = json.load(f)
+        self.chat_server = ChatServer({**result["general"], **result["server"], "address": "127.0.0.1",
+                                       "port": free_port(), "metrics_dump": None})
+        self.sessions = []
+        for name in available_codecs(["json", "orjson"]):
+            session = self.chat_server.clients.add(socket.socket(), name)
+            session.outbox = Outbox(self.chat_server.output_limit, self.chat_server.overflow_policy)
+            session.codec = self.chat_server.get_codec(name)
+            self.sessions.append(session)
+
+    def tearDown(self):
+        for session in self.sessions:
+            session.client.close()
+
+    def test_unencodable(self):
+        # Сообщение, которое не кодируется хотя бы для одного получателя, отбрасывается целиком, цикл живет дальше
+        msg = {"action": "msg", "time": time.time(), "to": "#server", "from": "user", "message": "\ud800"}
+        self.chat_server.writer([(None, msg)])
+        self.assertEqual([len(session.outbox) for session in self.sessions], [0] * len(self.sessions))
+        self.assertIn('chat_errors_total{kind="EncodeError"} 1', self.chat_server.metrics.render())
+        self.chat_server.writer([(None, {**msg, "message": "hello"})])
+        self.assertTrue(all(len(session.outbox) for session in self.sessions))
+
+
+class SelectSenderTestCase(SelectChatServerTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = {"history": self.directory.name}
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def test_spoofed_from(self):
+        # Поле from подписывает сервер по имени сессии: ни получатель, ни журнал истории чужого имени не видят
+        sink, _ = self.connect("sink")
+        sender, _ = self.connect("sender")
+        self.send(sender, {"action": "msg", "to": "sink", "from": "sink", "message": "hello"})
+        self.assertEqual(self.receive(sink)["from"], "sender")
+        self.send(sink, {"action": "history", "to": "sender"})
+        messages = self.receive(sink)["messages"]
+        self.assertEqual([(msg["from"], msg["message"]) for msg in messages], [("sender", "hello")])
+
+    def test_history_pages(self):
+        # Ответ истории - один кадр не длиннее input_limit клиента, остальное - страницами по курсору before
+        sink, _ = self.connect("sink")
+        sender, _ = self.connect("sender")
+        self.decoders[sink] = FrameDecoder(self.chat_server.limit)
+        size = self.chat_server.limit * 2 // 5
+        for number in range(3):
+            self.send(sender, {"action": "msg", "to": "sink", "from": "sender", "message": str(number) * size})
+            self.assertEqual(self.receive(sink)["message"][0], str(number))
+        self.send(sink, {"action": "history", "to": "sender"})
+        page = self.receive(sink)
+        self.assertEqual([msg["message"][0] for msg in page["messages"]], ["1", "2"])
+        self.send(sink, {"action": "history", "to": "sender", "before": page["before"]})
+        page = self.receive(sink)
+        self.assertEqual([msg["message"][0] for msg in page["messages"]], ["0"])
+        self.assertNotIn("before", page)
+
+
+class SelectCloseTestCase(SelectChatServerTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Фоновый сброс журнала за время теста не наступает: записи на диске только после close()
+        self.config = {"history": os.path.join(self.directory.name, "history"), "history_flush_interval": 60,
+                       "offline_store": os.path.join(self.directory.name, "offline.db")}
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def test_close(self):
+        sink, _ = self.connect("sink")
+        sender, _ = self.connect("sender")
+        self.send(sender, {"action": "msg", "to": "sink", "from": "sender", "message": "logged"})
+        self.assertEqual(self.receive(sink)["message"], "logged")
+        self.send(sender, {"action": "msg", "to": "away", "from": "sender", "message": "stored"})
+        # Сообщения одного отправителя обрабатываются по порядку: дошло второе - первое уже в хранилище
+        self.send(sender, {"action": "msg", "to": "sink", "from": "sender", "message": "after"})
+        self.assertEqual(self.receive(sink)["message"], "after")
+        self.chat_server.stop()
+        self.thread.join(2)
+        history = HistoryLog(self.config["history"], 1 << 20, 60)
+        self.assertEqual([msg["message"] for msg in history.query(("sender", "sink"), 10)], ["logged", "after"])
+        history.close()
+        store = OfflineStore(self.config["offline_store"], 3600)
+        self.assertEqual([msg["message"] for msg in store.take("away")], ["stored"])
+        store.close()
+
+
+class SelectMetricsTestCase(SelectChatServerTestCase):
+    def setUp(self):
+        self.config = {"metrics_port": free_port()}
+        super().setUp()
+
+    def test_frames_out(self):
+        # Метрики слушают metrics_address (по умолчанию 127.0.0.1), исходящие кадры считаются по action
+        self.assertEqual(self.chat_server.metrics_address, "127.0.0.1")
+        sink, _ = self.connect("sink")
+        sender, _ = self.connect("sender")
+        self.send(sender, {"action": "msg", "to": "sink", "from": "sender", "message": "hello"})
+        self.assertEqual(self.receive(sink)["message"], "hello")
+        url = "http://127.0.0.1:{}/metrics".format(self.config["metrics_port"])
+        with urllib.request.urlopen(url, timeout=2) as response:
+            body = response.read().decode("utf-8")
+        self.assertIn('chat_frames_out_total{action="msg"} 1', body)
+        self.assertIn('chat_frames_out_total{action="response"} 2', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
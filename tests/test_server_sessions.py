@@ -0,0 +1,59 @@
+import unittest
+
+from gb_chat.server.sessions import SequenceRegistry, SessionRegistry
+
+
+class SessionRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = SessionRegistry()
+        self.client = object()
+
+    def test_add(self):
+        session = self.registry.add(self.client, "test")
+        self.assertIs(self.registry.get(self.client), session)
+        self.assertIs(self.registry.find("test"), session)
+        self.assertIn(self.client, self.registry)
+        self.assertEqual(len(self.registry), 1)
+
+    def test_duplicate_name(self):
+        self.registry.add(self.client, "test")
+        self.assertIsNone(self.registry.add(object(), "test"))
+        self.assertEqual(len(self.registry), 1)
+
+    def test_remove(self):
+        self.registry.add(self.client, "test")
+        session = self.registry.remove(self.client)
+        self.assertEqual(session.name, "test")
+        self.assertIsNone(self.registry.find("test"))
+        self.assertNotIn(self.client, self.registry)
+        self.assertIsNone(self.registry.remove(self.client))
+
+    def test_name_released(self):
+        self.registry.add(self.client, "test")
+        self.registry.remove(self.client)
+        self.assertIsNotNone(self.registry.add(object(), "test"))
+
+
+
+class SequenceRegistryTestCase(unittest.TestCase):
+    def test_restore(self):
+        registry = SequenceRegistry(10)
+        registry.save("test", "a", 5)
+        self.assertEqual(registry.restore("test", "a"), 5)
+        self.assertIsNone(registry.restore("test", "a"))
+
+    def test_other_client(self):
+        registry = SequenceRegistry(10)
+        registry.save("test", "a", 5)
+        self.assertIsNone(registry.restore("test", "b"))
+
+    def test_limit(self):
+        registry = SequenceRegistry(2)
+        for name in ("first", "second", "third"):
+            registry.save(name, "a", 1)
+        self.assertEqual(len(registry), 2)
+        self.assertIsNone(registry.restore("first", "a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
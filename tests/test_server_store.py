@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from gb_chat.server.store import OfflineStore
+
+
+class OfflineStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = OfflineStore(os.path.join(self.directory, "offline.db"), 60)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def msg(self, to: str, message: str) -> dict:
+        return {"action": "msg", "time": time.time(), "to": to, "from": "test", "message": message}
+
+    def test_commit(self):
+        self.store.put(self.msg("user", "first"))
+        self.store.put(self.msg("user", "second"))
+        self.assertEqual(len(self.store), 2)
+        self.store.commit()
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual([msg["message"] for msg in self.store.take("user")], ["first", "second"])
+        self.assertEqual(self.store.take("user"), [])
+
+    def test_take_pending(self):
+        self.store.put(self.msg("user", "first"))
+        self.store.put(self.msg("other", "second"))
+        self.assertEqual([msg["message"] for msg in self.store.take("user")], ["first"])
+        self.assertEqual([msg["message"] for msg in self.store.take("other")], ["second"])
+
+    def test_retention(self):
+        self.store.retention = 0
+        self.store.put(self.msg("user", "first"))
+        self.store.commit()
+        time.sleep(0.01)
+        self.assertEqual(self.store.take("user"), [])
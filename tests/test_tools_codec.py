@@ -0,0 +1,59 @@
+import unittest
+
+from gb_chat.tools.codec import (DEFAULT, DecodeError, EncodeError, INSTALLED, JsonCodec, available_codecs,
+                                 get_codec, negotiate)
+
+MESSAGE = {"action": "msg", "time": 1.5, "to": "#room", "from": "user", "message": "привет"}
+
+
+class ToolsCodecTestCase(unittest.TestCase):
+    def test_json(self):
+        codec = JsonCodec()
+        self.assertEqual(codec.loads(codec.dumps(MESSAGE)), MESSAGE)
+
+    def test_installed(self):
+        for name in available_codecs(["orjson", "msgpack", "json"]):
+            codec = get_codec(name)
+            self.assertEqual(codec.loads(codec.dumps(MESSAGE)), MESSAGE, name)
+            self.assertEqual(codec.loads(memoryview(codec.dumps(MESSAGE))), MESSAGE, name)
+
+    def test_decode_error(self):
+        for name in available_codecs(["orjson", "msgpack", "json"]):
+            with self.assertRaises(DecodeError, msg=name):
+                get_codec(name).loads(b"\xc1{")
+
+    def test_surrogate(self):
+        # Одинокий суррогат из json не доходит до других кодеков, пара суррогатов - обычный символ
+        codec = JsonCodec()
+        for payload in (b'{"message": "\\ud800"}', b'{"\\udc00": 1}', b'{"a": ["\\uDBFF"]}'):
+            with self.assertRaises(DecodeError, msg=payload):
+                codec.loads(payload)
+        self.assertEqual(codec.loads(b'{"message": "\\ud83d\\ude00"}'), {"message": "\U0001f600"})
+
+    def test_encode_error(self):
+        # json экранирует суррогат в \\ud800, а orjson и msgpack пишут строки только в UTF-8
+        for name in available_codecs(["orjson", "msgpack"]):
+            with self.assertRaises(EncodeError, msg=name):
+                get_codec(name).dumps({**MESSAGE, "message": "\ud800"})
+        for name in available_codecs(["orjson", "msgpack", "json"]):
+            with self.assertRaises(EncodeError, msg=name):
+                get_codec(name).dumps({**MESSAGE, "message": object()})
+
+    def test_negotiate_old_client(self):
+        self.assertEqual(negotiate([], ["orjson", "msgpack", "json"]), DEFAULT)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate(["msgpack", "json"], ["json", "msgpack"]), "json")
+        self.assertEqual(negotiate(["unknown"], ["orjson", "json"]), DEFAULT)
+
+    @unittest.skipUnless(INSTALLED["orjson"], "orjson is not installed")
+    def test_negotiate_orjson(self):
+        self.assertEqual(negotiate(["json", "orjson"], ["orjson", "json"]), "orjson")
+
+    def test_unavailable(self):
+        with self.assertRaises(ValueError):
+            get_codec("unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
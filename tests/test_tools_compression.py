@@ -0,0 +1,67 @@
+import unittest
+import zlib
+
+from gb_chat.tools.codec import DecodeError, JsonCodec, available_codecs, get_codec
+from gb_chat.tools.compression import (DEFLATE, MEM_LEVEL, RAW, WBITS, ZLIB, CompressedCodec, get_compressed,
+                                       negotiate_compression)
+
+SHORT = {"action": "msg", "time": 1.5, "to": "#room", "from": "user", "encoding": "utf-8", "message": "привет"}
+LONG = {**SHORT, "message": "Every frame is uncompressed JSON with repeated keys. " * 10}
+
+
+class ToolsCompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.codec = CompressedCodec(JsonCodec(), 256, 10000)
+
+    def test_short(self):
+        # Короткий кадр не сжимается
+        payload = self.codec.dumps(SHORT)
+        self.assertEqual(payload[0], RAW)
+        self.assertEqual(self.codec.loads(payload), SHORT)
+
+    def test_long(self):
+        payload = self.codec.dumps(LONG)
+        self.assertEqual(payload[0], DEFLATE)
+        self.assertLess(len(payload), len(JsonCodec().dumps(LONG)) // 2)
+        self.assertEqual(self.codec.loads(memoryview(payload)), LONG)
+
+    def test_dictionary(self):
+        # Предустановленный словарь сжимает даже одиночное сообщение без повторов внутри
+        codec = CompressedCodec(JsonCodec(), 0, 10000)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, WBITS, MEM_LEVEL)
+        plain = compressor.compress(JsonCodec().dumps(SHORT)) + compressor.flush()
+        self.assertLess(len(codec.dumps(SHORT)), len(plain))
+
+    def test_codecs(self):
+        for name in available_codecs(["orjson", "msgpack", "json"]):
+            codec = get_compressed(get_codec(name), ZLIB, 256, 10000)
+            self.assertEqual(codec.loads(codec.dumps(LONG)), LONG, name)
+            self.assertEqual(codec.loads(codec.dumps(SHORT)), SHORT, name)
+
+    def test_limit(self):
+        codec = CompressedCodec(JsonCodec(), 256, 100)
+        with self.assertRaises(DecodeError):
+            codec.loads(self.codec.dumps(LONG))
+
+    def test_invalid(self):
+        for payload in (b"", b"\x07{}", b"\x01garbage"):
+            with self.assertRaises(DecodeError, msg=payload):
+                self.codec.loads(payload)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate_compression([ZLIB], [ZLIB]), ZLIB)
+        self.assertIsNone(negotiate_compression([], [ZLIB]))
+        self.assertIsNone(negotiate_compression([ZLIB], []))
+        self.assertIsNone(negotiate_compression(["brotli"], ["brotli", ZLIB]))
+        # Другая версия словаря - без сжатия, а не неразбираемые кадры
+        self.assertIsNone(negotiate_compression(["zlib", "zlib-d0"], [ZLIB]))
+
+    def test_disabled(self):
+        codec = JsonCodec()
+        self.assertIs(get_compressed(codec, None, 256, 100), codec)
+        with self.assertRaises(ValueError):
+            get_compressed(codec, "unknown", 256, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
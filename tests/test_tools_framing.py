@@ -0,0 +1,114 @@
+import socket
+import unittest
+
+from gb_chat.tools.framing import BufferPool, FrameDecoder, FrameError, encode_frame
+
+
+class ToolsFramingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.decoder = FrameDecoder(100)
+
+    def test_single(self):
+        self.assertEqual(self.decoder.feed(encode_frame(b"hello")), [b"hello"])
+
+    def test_glued(self):
+        data = encode_frame(b"hello") + encode_frame(b"") + encode_frame(b"world")
+        self.assertEqual(self.decoder.feed(data), [b"hello", b"", b"world"])
+
+    def test_split(self):
+        data = encode_frame(b"hello") + encode_frame(b"world")
+        frames = []
+        for i in range(len(data)):
+            frames.extend(self.decoder.feed(data[i:i + 1]))
+        self.assertEqual(frames, [b"hello", b"world"])
+        self.assertEqual(len(self.decoder), 0)
+
+    def test_partial(self):
+        data = encode_frame(b"hello")
+        self.assertEqual(self.decoder.feed(data[:-1]), [])
+        self.assertEqual(self.decoder.feed(data[-1:]), [b"hello"])
+
+    def test_limit(self):
+        with self.assertRaises(FrameError):
+            self.decoder.feed(encode_frame(b"x" * 101))
+
+
+class ToolsPooledFramingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = BufferPool(16, 2)
+        self.decoder = FrameDecoder(100, self.pool)
+        self.peer, self.sock = socket.socketpair()
+        self.sock.setblocking(False)
+
+    def tearDown(self):
+        self.peer.close()
+        self.sock.close()
+
+    def test_read(self):
+        self.peer.sendall(encode_frame(b"hello") + encode_frame(b"world"))
+        while self.decoder.read(self.sock, 16) == 16:
+            pass
+        self.assertEqual([bytes(frame) for frame in self.decoder.frames()], [b"hello", b"world"])
+
+    def test_recycle(self):
+        # Разобранный до конца буфер возвращается в пул и достается следующему чтению
+        self.decoder.feed(encode_frame(b"hello"))
+        self.assertEqual(len(self.pool), 1)
+        self.decoder.feed(encode_frame(b"hello")[:-1])
+        self.assertEqual(len(self.pool), 0)
+
+    def test_partial(self):
+        data = encode_frame(b"hello")
+        self.assertEqual(self.decoder.feed(data[:-1]), [])
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(self.decoder.feed(data[-1:]), [b"hello"])
+        self.assertEqual(len(self.pool), 1)
+
+    def test_size_classes(self):
+        # Буфер под большой кадр берется из класса нужного размера и возвращается туда же
+        self.assertEqual(self.decoder.feed(encode_frame(b"x" * 50)), [b"x" * 50])
+        self.assertEqual(len(self.pool), 1)
+        buffer = self.pool.get(54)
+        self.assertEqual(len(buffer), 64)
+        self.pool.put(buffer)
+        self.assertEqual(self.decoder.feed(encode_frame(b"x" * 50)), [b"x" * 50])
+        self.assertEqual(len(self.pool), 1)
+        self.assertIs(self.pool.get(33), buffer)
+
+    def test_pool_limit(self):
+        # В классе k не больше limit >> k буферов
+        for _ in range(3):
+            self.pool.put(bytearray(16))
+            self.pool.put(bytearray(32))
+            self.pool.put(bytearray(64))
+        self.pool.put(bytearray(20))
+        self.assertEqual(len(self.pool), 2 + 1 + 1)
+
+    def test_exported(self):
+        # Кадры, выданные до release(), не портятся, даже если следующему чтению нужно место в буфере
+        data = encode_frame(b"a" * 10) + encode_frame(b"b" * 10)
+        self.peer.sendall(data[:16])
+        self.decoder.read(self.sock, 16)
+        first = self.decoder.frames()
+        self.peer.sendall(data[16:])
+        self.decoder.read(self.sock, 16)
+        second = self.decoder.frames()
+        self.assertEqual([bytes(frame) for frame in first + second], [b"a" * 10, b"b" * 10])
+        self.decoder.release()
+        self.assertEqual(len(self.pool), 2)
+
+    def test_expected(self):
+        # Известна длина кадра - место резервируется под него целиком, без повторных расширений
+        data = encode_frame(b"x" * 90)
+        self.peer.sendall(data)
+        frames = []
+        buffers = set()
+        while not frames:
+            self.decoder.read(self.sock, 8)
+            frames = self.decoder.frames()
+            buffers.add(id(self.decoder._buffer))
+        self.assertEqual(bytes(frames[0]), b"x" * 90)
+        self.assertEqual(len(buffers), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import logging
+import unittest
+from queue import SimpleQueue
+
+from gb_chat.tools.log import BatchQueueListener, DeferredFlushMixin, LazyQueueHandler
+
+
+class RecordingHandler(DeferredFlushMixin, logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.flushes = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(self.format(record))
+        self.flush()
+
+    def flush(self):
+        if not self.deferred:
+            self.flushes += 1
+
+
+class BatchQueueListenerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.queue = SimpleQueue()
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger("test_tools_log")
+        self.logger.propagate = False
+        self.logger.setLevel("DEBUG")
+        self.logger.addHandler(LazyQueueHandler(self.queue))
+        self.listener = BatchQueueListener(self.queue, self.handler)
+
+    def tearDown(self):
+        self.logger.handlers.clear()
+
+    def test_lazy(self):
+        self.logger.info("user %s", "test")
+        record = self.queue.get_nowait()
+        self.assertEqual(record.args, ("test",))
+        self.assertEqual(record.getMessage(), "user test")
+
+    def test_batch(self):
+        for i in range(10):
+            self.logger.info("message %s", i)
+        self.listener.start()
+        self.listener.stop()
+        self.assertEqual(self.handler.messages, ["message {}".format(i) for i in range(10)])
+        self.assertEqual(self.handler.flushes, 1)
@@ -0,0 +1,53 @@
+import json
+import unittest
+
+from gb_chat.tools.codec import JsonCodec, available_codecs, get_codec
+from gb_chat.tools.framing import FrameDecoder
+from gb_chat.tools.message import Message
+from gb_chat.tools.requests import request_msg
+from gb_chat.tools.responses import error_400, ok
+
+
+class ToolsMessageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.codec = JsonCodec()
+
+    def test_dict(self):
+        # Помощники возвращают Message, который сравнивается и сериализуется как обычный dict
+        self.assertEqual(ok(), {"response": 200})
+        self.assertIsInstance(error_400(), dict)
+        msg = request_msg(sender="user", to="#room", encoding="utf-8", message="привет")
+        self.assertEqual(json.loads(json.dumps(msg)), dict(msg))
+
+    def test_frame(self):
+        msg = Message({"response": 200})
+        frame = msg.frame(self.codec)
+        self.assertIs(msg.frame(self.codec), frame)
+        self.assertEqual(FrameDecoder(100).feed(frame), [self.codec.dumps({"response": 200})])
+
+    def test_invalidate(self):
+        msg = ok("Welcome")
+        frame = msg.frame(self.codec)
+        msg["seq"] = 5
+        self.assertIsNot(msg.frame(self.codec), frame)
+        self.assertEqual(self.codec.loads(FrameDecoder(100).feed(msg.frame(self.codec))[0]),
+                         {"response": 200, "alert": "Welcome", "seq": 5})
+        for change in (lambda: msg.pop("seq"), lambda: msg.update(seq=6), lambda: msg.setdefault("codec", "json"),
+                       lambda: msg.__delitem__("alert"), msg.popitem, msg.clear):
+            frame = msg.frame(self.codec)
+            change()
+            self.assertEqual(FrameDecoder(100).feed(msg.frame(self.codec))[0], self.codec.dumps(dict(msg)))
+
+    def test_codecs(self):
+        msg = ok()
+        for name in available_codecs(["orjson", "msgpack", "json"]):
+            codec = get_codec(name)
+            self.assertEqual(codec.loads(FrameDecoder(100).feed(msg.frame(codec))[0]), {"response": 200}, name)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            ok().extra = True
+
+
+if __name__ == '__main__':
+    unittest.main()
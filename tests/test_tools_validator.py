@@ -0,0 +1,64 @@
+import json
+import os
+import time
+import unittest
+
+from jsonschema.exceptions import ValidationError
+
+from gb_chat.tools.validator import Validator, compile_schema
+
+CONFIG_PATH = os.path.join(os.path.split(os.path.dirname(__file__))[0], "config.json")
+
+
+class ToolsValidatorTestCase(unittest.TestCase):
+    def setUp(self):
+        with open(CONFIG_PATH) as f:
+            result = json.load(f)
+        self.validator = Validator(result["server"]["schema"])
+        self.msg = {"action": "msg", "time": time.time(), "to": "b", "from": "a", "encoding": "utf-8",
+                    "message": "hello"}
+
+    def test_compiled(self):
+        for name in ("action", "msg", "presence", "authenticate", "join", "leave"):
+            self.assertIsNotNone(compile_schema(self.validator.schemes[name]), name)
+
+    def test_unsupported(self):
+        self.assertIsNone(compile_schema({"type": "string", "pattern": "^a"}))
+
+    def test_valid(self):
+        self.assertTrue(self.validator.validate_action(self.msg))
+        presence = {"action": "presence", "time": 1, "user": {"account_name": "a", "status": "here"}}
+        self.assertTrue(self.validator.validate_action(presence))
+        self.assertTrue(self.validator.validate_action({"action": "quit", "time": 1.5}))
+        self.assertTrue(self.validator.validate_action({**self.msg, "seq": 2 ** 63 - 1}))
+
+    def test_invalid(self):
+        cases = [
+            {**self.msg, "to": 1},
+            {**self.msg, "time": True},
+            {**self.msg, "extra": "field"},
+            {key: value for key, value in self.msg.items() if key != "to"},
+            {"action": "presence", "time": 1, "user": {"status": "here"}},
+            {"action": "presence", "time": 1, "user": {"account_name": "a", "password": "1"}},
+            {"action": "join", "time": 1, "room": ""},
+            {"action": "unknown", "time": 1},
+            {"time": 1},
+            # За пределами int64 число не закодировать orjson и msgpack у получателя
+            {**self.msg, "time": 2 ** 70},
+            {**self.msg, "seq": 2 ** 63},
+            {**self.msg, "seq": -2 ** 63 - 1},
+            {"action": "history", "time": 1, "to": "a", "limit": 2 ** 64},
+        ]
+        for data in cases:
+            with self.assertRaises(ValidationError, msg=data):
+                self.validator.validate_action(data)
+
+    def test_error_message(self):
+        with self.assertRaises(ValidationError) as context:
+            self.validator.validate_action({**self.msg, "to": 1})
+        self.assertEqual(context.exception.message,
+                         "Validate Error, field[to], error msg: 1 is not of type 'string'")
+
+
+if __name__ == '__main__':
+    unittest.main()